@@ -7,8 +7,10 @@ import datetime
 import re
 import shutil
 from django.conf import settings
+from dataqs.metrics import instrumented
 from dataqs.processor_base import GeoDataMosaicProcessor
-from dataqs.helpers import warp_image, style_exists
+from dataqs.helpers import warp_image, make_cog, style_exists, \
+    WARP_INDEX_CACHE_DIR
 
 logger = logging.getLogger("dataqs.processors")
 
@@ -77,6 +79,7 @@ class AirNowGRIB2HourlyProcessor(GeoDataMosaicProcessor):
             imgtitle, imgstrtime)
         return layer_title, layer_name, imgtime
 
+    @instrumented('convert')
     def convert(self, grib_file, imgtime, layer_name):
         """
         Convert a GRIB2 image to a GeoTIFF image in EPSG:3857 projection
@@ -90,7 +93,9 @@ class AirNowGRIB2HourlyProcessor(GeoDataMosaicProcessor):
         tif_out = "{prefix}_{time}.tif".format(
             prefix=layer_name, time=time_format)
         warp_image(os.path.join(self.tmp_dir, grib_file),
-                   os.path.join(self.tmp_dir, tif_out))
+                   os.path.join(self.tmp_dir, tif_out),
+                   index_cache=WARP_INDEX_CACHE_DIR)
+        make_cog(os.path.join(self.tmp_dir, tif_out))
         return tif_out
 
     def run(self, days=1):
@@ -112,14 +117,17 @@ class AirNowGRIB2HourlyProcessor(GeoDataMosaicProcessor):
             if dst_file.endswith('.tif'):
                 shutil.move(os.path.join(self.tmp_dir, tif_out), dst_file)
             self.post_geoserver(dst_file, layer_name)
-            self.drop_old_hourly_images(imgtime, layer_name)
-            self.drop_old_daily_images(imgtime, layer_name)
+            removed = self.drop_old_hourly_images(imgtime, layer_name)
+            removed += self.drop_old_daily_images(imgtime, layer_name)
             if not style_exists(layer_name):
                 with open(os.path.join(
                         script_dir, 'resources/airnow.sld')) as sld:
                     self.set_default_style(layer_name, layer_name, sld.read())
-            self.update_geonode(layer_name, title=layer_title, store=layer_name)
-            self.truncate_gs_cache(layer_name)
+            self.update_geonode(layer_name, title=layer_title, store=layer_name,
+                                time_extent=self.get_time_extent(imgtime))
+            times = [imgtime.strftime(self.gwc_time_format)]
+            self.truncate_gs_cache(layer_name, times=times + removed)
+            self.seed_gs_cache(layer_name, times=times)
         self.cleanup()
 
 if __name__ == '__main__':
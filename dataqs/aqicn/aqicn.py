@@ -5,7 +5,9 @@ import sys
 import re
 import time
 from multiprocessing.pool import ThreadPool
-from random import randint
+from Queue import Queue, Empty
+from random import uniform
+from urlparse import urlparse
 
 import requests
 from bs4 import BeautifulSoup as bs
@@ -13,8 +15,10 @@ import datetime
 import traceback
 from dateutil.parser import parse
 from dateutil.tz import tzutc
+from django.conf import settings
 from dataqs.helpers import postgres_query, layer_exists, table_exists, \
-    style_exists, asciier
+    style_exists, asciier, expand_bbox, HostRateLimiter
+from dataqs.metrics import instrumented
 from dataqs.processor_base import GeoDataProcessor, DEFAULT_WORKSPACE
 from geonode.geoserver.helpers import ogc_server_settings
 
@@ -22,6 +26,16 @@ logger = logging.getLogger("dataqs.processors")
 
 script_dir = os.path.dirname(os.path.realpath(__file__))
 
+# Number of cities scraped at the same time
+AQICN_CONCURRENCY = getattr(settings, 'AQICN_CONCURRENCY', 6)
+# Requests per second, and maximum burst of requests, per host
+AQICN_RATE_LIMIT = getattr(settings, 'AQICN_RATE_LIMIT', 2.0)
+AQICN_BURST = getattr(settings, 'AQICN_BURST', 2)
+# Retries of failed requests, after a random delay of up to
+# AQICN_RETRY_BACKOFF * 2 ** retry seconds
+AQICN_MAX_RETRIES = getattr(settings, 'AQICN_MAX_RETRIES', 3)
+AQICN_RETRY_BACKOFF = getattr(settings, 'AQICN_RETRY_BACKOFF', 1.0)
+
 REQ_HEADER = {
     'Accept': 'text/html,application/xhtml+xml,application/xml;'
               'q=0.9,image/webp,*/*;q=0.8',
@@ -73,37 +87,67 @@ CREATE TABLE IF NOT EXISTS {table}
 WITH (
   OIDS=FALSE
 );
-CREATE INDEX {table}_city_idx ON {table}(city);
-CREATE INDEX {table}_datetime_idx ON {table}(datetime);
+CREATE INDEX IF NOT EXISTS {table}_city_idx ON {table}(city);
+CREATE INDEX IF NOT EXISTS {table}_datetime_idx ON {table}(datetime);
 SELECT AddGeometryColumn ('public','{table}','the_geom',4326,'POINT',2);
-CREATE INDEX {table}_the_geom ON {table} USING gist (the_geom);
+CREATE INDEX IF NOT EXISTS {table}_the_geom ON {table} USING gist (the_geom);
 """
 
 
-def thread_parse(table, cities):
+def thread_parse(table, cities, queue, limiter):
     """
-    Thread worker for a list of cities
+    Thread worker that scrapes cities from a shared queue until it is empty
+    :return: extent of the cities that were updated
     """
-    aqi_parser = AQICNWorker(table, cities)
-    aqi_parser.run()
+    aqi_parser = AQICNWorker(table, cities, limiter)
+    aqi_parser.run(queue)
+    return aqi_parser.bbox
 
 
 class AQICNWorker(object):
-    def __init__(self, table, cities):
+    limiter = None
+    max_retries = AQICN_MAX_RETRIES
+    retry_backoff = AQICN_RETRY_BACKOFF
+
+    def __init__(self, table, cities, limiter=None):
         self.cities = cities
         self.prefix = table
         self.archive = self.prefix + "_archive"
-        self.max_wait = 5
-        if not table_exists(self.archive):
-            postgres_query(AQICN_TABLE.format(table=self.archive), commit=True)
+        self.limiter = limiter
+        self.bbox = None
+
+    def fetch(self, url):
+        """
+        Get a page once the rate limiter allows a request to its host.
+        Connection errors, timeouts, 429 and 5xx responses are retried
+        after a random (jittered) exponential backoff.
+        :param url: URL of the page
+        :return: requests.Response
+        """
+        retry = 0
+        while True:
+            if self.limiter:
+                self.limiter.acquire(urlparse(url).netloc)
+            try:
+                page = requests.get(url, timeout=60, headers=REQ_HEADER)
+                page.raise_for_status()
+                return page
+            except requests.RequestException as e:
+                status = getattr(e.response, 'status_code', None)
+                if retry >= self.max_retries or (
+                        status and status < 500 and status != 429):
+                    raise
+                delay = uniform(0, self.retry_backoff * 2 ** retry)
+                logger.debug('Retrying {} in {:.1f}s: {}'.format(
+                    url, delay, e))
+                time.sleep(delay)
+                retry += 1
 
     def handle_city(self, i, city):
         try:
             logger.debug('Scraping %d of %d cities - %s' % (
                 i+1, len(self.cities), city['url']))
-            time.sleep(randint(1, self.max_wait))
-            page = requests.get(city['url'], timeout=60, headers=REQ_HEADER)
-            page.raise_for_status()
+            page = self.fetch(city['url'])
             soup = bs(page.text, "lxml")
 
             aqi_div = soup.find('div', class_='aqivalue')
@@ -188,6 +232,8 @@ class AQICNWorker(object):
             cntry=city['country']
         ))
         postgres_query(sql_str, commit=True)
+        self.bbox = expand_bbox(self.bbox, float(city['g'][1]),
+                                float(city['g'][0]))
 
     @staticmethod
     def get_time(city):
@@ -209,8 +255,16 @@ class AQICNWorker(object):
             raise e
         return city_time
 
-    def run(self):
-        for i, city in enumerate(self.cities):
+    def run(self, queue):
+        """
+        Scrape cities until the shared queue is empty
+        :param queue: Queue of (index, city) tuples
+        """
+        while True:
+            try:
+                i, city = queue.get_nowait()
+            except Empty:
+                break
             if 'url' in city:
                 self.handle_city(i, city)
             else:
@@ -223,7 +277,7 @@ class AQICNProcessor(GeoDataProcessor):
     directory = 'output'
     cities = None
     countries = None
-    pool_size = 6
+    pool_size = AQICN_CONCURRENCY
     base_url = 'http://aqicn.org/city/all/'
     layers = {
         'aqi': 'Air Quality Index',
@@ -275,29 +329,43 @@ class AQICNProcessor(GeoDataProcessor):
                         'url': citylink.get('href')})
                     citylink = citylink.findNext('a')
 
-    def split_list(self, num):
-        """ Yield n successive lists from cities list.
-        """
-        newn = int(1.0 * len(self.cities) / num + 0.5)
-        for i in xrange(0, num-1):
-            yield self.cities[i*newn:i*newn+newn]
-        yield self.cities[num*newn-newn:]
-
+    @instrumented('scrape')
     def process(self):
-        if not table_exists(self.prefix):
-            postgres_query(AQICN_TABLE.format(table=self.prefix), commit=True)
+        """
+        Scrape and save the latest data for all cities.  Cities are taken
+        from a shared queue by pool_size workers, and requests are rate
+        limited per host by AQICN_RATE_LIMIT and AQICN_BURST.
+        :return: extent of the cities that were updated
+        """
+        # Created before the workers start, so that they do not race to
+        # create the archive table
+        for table in (self.prefix, self.prefix + "_archive"):
+            if not table_exists(table):
+                postgres_query(AQICN_TABLE.format(table=table), commit=True)
         logger.debug("Start %s" % datetime.datetime.now())
         if not self.cities:
             self.getCities()
         logger.debug("There are %s cities" % str(len(self.cities)))
+        queue = Queue()
+        for i, city in enumerate(self.cities):
+            queue.put((i, city))
+        limiter = HostRateLimiter(AQICN_RATE_LIMIT, AQICN_BURST)
         pool = ThreadPool(self.pool_size)
-        for citylist in self.split_list(self.pool_size):
-            pool.apply_async(thread_parse, args=(self.prefix, citylist))
+        results = [pool.apply_async(thread_parse, args=(
+            self.prefix, self.cities, queue, limiter))
+            for _ in xrange(self.pool_size)]
         pool.close()
         pool.join()
+        bbox = None
+        for result in results:
+            city_bbox = result.get()
+            if city_bbox:
+                bbox = expand_bbox(bbox, city_bbox[0], city_bbox[1])
+                bbox = expand_bbox(bbox, city_bbox[2], city_bbox[3])
+        return bbox
 
     def run(self):
-        self.process()
+        bbox = self.process()
         layer_name = self.prefix
         datastore = ogc_server_settings.server.get('DATASTORE')
         if not layer_exists(layer_name, datastore, DEFAULT_WORKSPACE):
@@ -308,7 +376,9 @@ class AQICNProcessor(GeoDataProcessor):
         self.update_geonode(layer_name,
                             title='Air Quality Index',
                             store=datastore)
-        self.truncate_gs_cache(layer_name)
+        if bbox:
+            self.truncate_gs_cache(layer_name, bbox=bbox)
+            self.seed_gs_cache(layer_name)
         self.cleanup()
 
 if __name__ == '__main__':
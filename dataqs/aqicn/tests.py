@@ -5,6 +5,7 @@ from django.test import TestCase
 import dataqs
 from dataqs.aqicn.aqicn import AQICNProcessor
 import httpretty
+import requests
 from mock import patch
 
 script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -31,11 +32,11 @@ def mock_saveData(self, city):
         outfile.write(json.dumps(city))
 
 
-def mock_worker_init(self, table, cities):
+def mock_worker_init(self, table, cities, limiter=None):
     self.cities = cities
     self.prefix = table
     self.archive = self.prefix + "_archive"
-    self.max_wait = 5
+    self.limiter = limiter
 
 
 class AQICNTest(TestCase):
@@ -98,3 +99,52 @@ class AQICNTest(TestCase):
             self.assertEquals(city_json['data']['cur_pm25'], u'25')
             self.assertEquals(city_json['data']['cur_o3'], u'11')
             self.assertEquals(city_json['data']['cur_so2'], u'2')
+
+    @patch('dataqs.aqicn.aqicn.AQICNWorker.__init__', mock_worker_init)
+    @patch('time.sleep')
+    def test_fetch_retry(self, mock_sleep):
+        """
+        Verify that server errors are retried after a jittered delay,
+        and client errors are not.
+        """
+        boston = u'http://aqicn.org/city/boston/'
+        httpretty.register_uri(
+            httpretty.GET,
+            boston,
+            responses=[httpretty.Response(body='', status=503),
+                       httpretty.Response(body='', status=429),
+                       httpretty.Response(body='Boston', status=200)])
+        worker = dataqs.aqicn.aqicn.AQICNWorker('aqicn', [])
+        self.assertEquals('Boston', worker.fetch(boston).text)
+        self.assertEquals(2, mock_sleep.call_count)
+        for i, call in enumerate(mock_sleep.call_args_list):
+            self.assertTrue(0 <= call[0][0] <= worker.retry_backoff * 2 ** i)
+
+        missing = u'http://aqicn.org/city/missing/'
+        httpretty.register_uri(httpretty.GET, missing, status=404)
+        self.assertRaises(requests.HTTPError, worker.fetch, missing)
+        self.assertEquals(2, mock_sleep.call_count)
+
+    @patch('dataqs.aqicn.aqicn.postgres_query')
+    @patch('dataqs.aqicn.aqicn.table_exists', return_value=False)
+    def test_process_tables(self, mock_table_exists, mock_query):
+        """
+        Verify that the data and archive tables are created once, before
+        the worker threads start.
+        """
+        created = []
+
+        def mock_thread_parse(table, cities, queue, limiter):
+            created.append(mock_query.call_count)
+            return None
+
+        self.processor.cities = [
+            {'city': u'Boston', 'country': u'USA',
+             'url': u'http://aqicn.org/city/boston/'}]
+        self.processor.pool_size = 2
+        with patch('dataqs.aqicn.aqicn.thread_parse', mock_thread_parse):
+            self.assertIsNone(self.processor.process())
+        self.assertEquals([2, 2], created)
+        self.assertEquals(
+            ['aqicn', 'aqicn_archive'],
+            [call[0][0] for call in mock_table_exists.call_args_list])
@@ -0,0 +1,351 @@
+from __future__ import absolute_import
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger("dataqs.downloader")
+
+DOWNLOAD_CHUNK_SIZE = getattr(settings, 'DOWNLOAD_CHUNK_SIZE', 1024 * 1024)
+DOWNLOAD_CONNECT_TIMEOUT = getattr(settings, 'DOWNLOAD_CONNECT_TIMEOUT', 10)
+DOWNLOAD_READ_TIMEOUT = getattr(settings, 'DOWNLOAD_READ_TIMEOUT', 120)
+DOWNLOAD_MAX_ATTEMPTS = getattr(settings, 'DOWNLOAD_MAX_ATTEMPTS', 3)
+DOWNLOAD_POOL_SIZE = getattr(settings, 'DOWNLOAD_POOL_SIZE', 4)
+DOWNLOAD_VALIDATOR_CACHE = getattr(
+    settings, 'DOWNLOAD_VALIDATOR_CACHE',
+    os.path.join(getattr(settings, 'GS_TMP_DIR', '/tmp'),
+                 'dataqs_validators.json'))
+# Validators not updated for this many days are removed from the cache
+DOWNLOAD_VALIDATOR_MAX_AGE = getattr(settings, 'DOWNLOAD_VALIDATOR_MAX_AGE',
+                                     30)
+# Maximum number of URLs kept in the cache, most recently updated first
+DOWNLOAD_VALIDATOR_MAX_ENTRIES = getattr(
+    settings, 'DOWNLOAD_VALIDATOR_MAX_ENTRIES', 1000)
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+def get_download_session():
+    """
+    Return a shared, connection-pooled session for downloads from
+    external data sources (one per process).  This is deliberately
+    separate from the GeoServer session so that GeoServer credentials
+    are never sent to third-party hosts.
+    :return: requests.Session
+    """
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE,
+                                      pool_maxsize=DOWNLOAD_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _sessions[pid] = session
+    return session
+
+
+class ChecksumError(Exception):
+    """
+    Raised when a downloaded file does not match its expected checksum
+    """
+    pass
+
+
+class NotModified(Exception):
+    """
+    Raised by a conditional download when the remote file has not changed
+    since it was last processed (HTTP 304)
+    """
+    pass
+
+
+class ValidatorCache(object):
+    """
+    Persistent, URL-keyed store of the ETag and Last-Modified values of
+    previously processed downloads, kept in a JSON file.  Writes replace
+    the file atomically; concurrent writers from separate processes may
+    overwrite each other's entries, which only costs an extra download.
+    URLs that change on every run (i.e. with a date in the query) would
+    add an entry each time, so entries older than max_age days are
+    removed, and only the max_entries most recent ones are kept.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, path=DOWNLOAD_VALIDATOR_CACHE,
+                 max_age=DOWNLOAD_VALIDATOR_MAX_AGE,
+                 max_entries=DOWNLOAD_VALIDATOR_MAX_ENTRIES):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except ValueError:
+            logger.warn("Ignoring corrupt validator cache {}".format(
+                self.path))
+            return {}
+
+    def get(self, url):
+        """
+        Return the stored validators for a URL
+        :param url: URL of a previous download
+        :return: dict with 'etag' and/or 'last_modified' keys
+        """
+        return self.load().get(url, {})
+
+    def conditional_headers(self, url):
+        """
+        Return If-None-Match/If-Modified-Since headers for a URL
+        :param url: URL to be downloaded
+        :return: dict of request headers
+        """
+        validators = self.get(url)
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def update(self, entries):
+        """
+        Store validators for one or more URLs
+        :param entries: dict of URL: {'etag': x, 'last_modified': y}
+        """
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            cache = self.load()
+            for url, validators in entries.items():
+                cache[url] = dict(validators, updated=now)
+            cache = self.expire(cache, now)
+            cache_dir = os.path.dirname(self.path)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as tmp_file:
+                    json.dump(cache, tmp_file)
+                os.rename(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def expire(self, cache, now):
+        """
+        Remove old entries from the cache contents
+        :param cache: dict of URL: validators
+        :param now: Current time (seconds since the epoch)
+        :return: dict of the remaining entries
+        """
+        cutoff = now - self.max_age * 86400
+        # Entries saved before they were timestamped count as new
+        entries = sorted(
+            ((validators.get('updated', now), url, validators)
+             for url, validators in cache.items()), reverse=True)
+        return dict((url, dict(validators, updated=updated))
+                    for updated, url, validators in entries[:self.max_entries]
+                    if updated >= cutoff)
+
+
+class DownloadStats(object):
+    """
+    Byte and timing statistics for a single download
+    """
+    def __init__(self, url):
+        self.url = url
+        self.bytes = 0
+        self.resumed_from = 0
+        self.attempts = 0
+        self.latency = None
+        self.elapsed = None
+        self.etag = None
+        self.last_modified = None
+
+    @property
+    def validators(self):
+        """
+        ETag and Last-Modified values of the downloaded file
+        """
+        return {'etag': self.etag, 'last_modified': self.last_modified}
+
+    @property
+    def rate(self):
+        """
+        Transfer rate in bytes/second
+        """
+        if not self.elapsed:
+            return None
+        return self.bytes / self.elapsed
+
+    def __repr__(self):
+        return ("<DownloadStats {url}: {bytes} bytes "
+                "(resumed from {resumed}) in {elapsed:.2f}s, "
+                "first response {latency:.2f}s, {attempts} attempt(s)>".format(
+                    url=self.url, bytes=self.bytes,
+                    resumed=self.resumed_from, elapsed=self.elapsed or 0,
+                    latency=self.latency or 0, attempts=self.attempts))
+
+
+class Downloader(object):
+    """
+    Download files over HTTP(S) using large buffers.  Data is written to a
+    partial file next to the destination, interrupted transfers are resumed
+    with HTTP Range requests, and the partial file is atomically renamed
+    to the destination once it is complete (and, optionally, verified).
+    """
+    partial_suffix = '.part'
+    validator_suffix = '.validator'
+
+    def __init__(self, session=None, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT),
+                 max_attempts=DOWNLOAD_MAX_ATTEMPTS):
+        self.session = session or get_download_session()
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    def download(self, url, dst_path, checksum=None, headers=None):
+        """
+        Download a URL to a local file
+        :param url: The URL to download from
+        :param dst_path: Full path & name of the destination file
+        :param checksum: Optional tuple of (hashlib algorithm, hex digest)
+        :param headers: Optional extra request headers, such as
+        If-None-Match/If-Modified-Since for a conditional download
+        :return: DownloadStats
+        :raises NotModified: if the server responds with 304 Not Modified
+        """
+        part_path = dst_path + self.partial_suffix
+        stats = DownloadStats(url)
+        start = time.time()
+        while True:
+            stats.attempts += 1
+            try:
+                self.fetch(url, part_path, stats, headers)
+                break
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if stats.attempts >= self.max_attempts:
+                    raise
+                logger.warn("Download of {} interrupted ({}), resuming".format(
+                    url, e))
+        if checksum:
+            self.verify(part_path, *checksum)
+        os.rename(part_path, dst_path)
+        self.discard_validator(part_path)
+        stats.elapsed = time.time() - start
+        logger.debug(stats)
+        return stats
+
+    def fetch(self, url, part_path, stats, headers=None):
+        """
+        Write the remainder of a URL's content to a partial file,
+        resuming from the partial file's current size if possible.
+        :param url: The URL to download from
+        :param part_path: Full path & name of the partial file
+        :param stats: DownloadStats to update
+        :param headers: Optional extra request headers
+        """
+        req_headers = dict(headers or {})
+        # The partial file holds the decoded body, so Range offsets are
+        # only valid if the body is not content-encoded (i.e. gzipped)
+        req_headers['Accept-Encoding'] = 'identity'
+        offset = 0
+        validator = self.read_validator(part_path)
+        if os.path.exists(part_path) and validator:
+            offset = os.path.getsize(part_path)
+            req_headers['Range'] = 'bytes={}-'.format(offset)
+            req_headers['If-Range'] = validator
+
+        request_start = time.time()
+        r = self.session.get(url, stream=True, timeout=self.timeout,
+                             headers=req_headers)
+        try:
+            if stats.latency is None:
+                stats.latency = time.time() - request_start
+            if r.status_code == 304:
+                raise NotModified(url)
+            if r.status_code == 416:
+                # Partial file is unusable, start over
+                os.remove(part_path)
+                self.discard_validator(part_path)
+                return self.fetch(url, part_path, stats, headers)
+            r.raise_for_status()
+            stats.etag = r.headers.get('ETag')
+            stats.last_modified = r.headers.get('Last-Modified')
+            if r.status_code == 206:
+                mode = 'ab'
+                stats.resumed_from = offset
+            else:
+                mode = 'wb'
+                self.write_validator(part_path, r.headers)
+            with open(part_path, mode, self.chunk_size) as out_file:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    if chunk:  # filter out keep-alive new chunks
+                        out_file.write(chunk)
+                        stats.bytes += len(chunk)
+        finally:
+            r.close()
+
+    def verify(self, filepath, algorithm, expected):
+        """
+        Compare a file's checksum to the expected value, removing the file
+        if they do not match.
+        :param filepath: Full path & name of the file
+        :param algorithm: Name of a hashlib algorithm, e.g. 'md5'
+        :param expected: Expected hex digest
+        """
+        digest = hashlib.new(algorithm)
+        with open(filepath, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(self.chunk_size), b''):
+                digest.update(chunk)
+        if digest.hexdigest().lower() != expected.lower():
+            os.remove(filepath)
+            self.discard_validator(filepath)
+            raise ChecksumError("{} checksum of {} is {}, expected {}".format(
+                algorithm, filepath, digest.hexdigest(), expected))
+
+    def read_validator(self, part_path):
+        """
+        Return the ETag or Last-Modified value stored for a partial file
+        """
+        validator_file = part_path + self.validator_suffix
+        if os.path.exists(validator_file):
+            with open(validator_file) as infile:
+                return infile.read().strip() or None
+        return None
+
+    def write_validator(self, part_path, headers):
+        """
+        Store the ETag or Last-Modified value of a response, so that a
+        resumed download only appends to a partial file if the remote
+        file has not changed in between (If-Range).
+        """
+        validator = headers.get('ETag') or headers.get('Last-Modified')
+        if validator:
+            with open(part_path + self.validator_suffix, 'w') as outfile:
+                outfile.write(validator)
+        else:
+            self.discard_validator(part_path)
+
+    def discard_validator(self, part_path):
+        validator_file = part_path + self.validator_suffix
+        if os.path.exists(validator_file):
+            os.remove(validator_file)
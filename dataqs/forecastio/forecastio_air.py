@@ -6,8 +6,10 @@ import datetime
 import requests
 from django.conf import settings
 import shutil
+from dataqs.downloader import NotModified
+from dataqs.metrics import instrumented
 from dataqs.processor_base import GeoDataMosaicProcessor
-from dataqs.helpers import gdal_translate, style_exists
+from dataqs.helpers import gdal_translate, make_cog, style_exists
 
 logger = logging.getLogger("dataqs.processors")
 script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -29,6 +31,7 @@ class ForecastIOAirTempProcessor(GeoDataMosaicProcessor):
             imgstrtime)
         return layer_title
 
+    @instrumented('convert')
     def convert(self, dl_file, imgtime):
         """
         Set the correct projection on the image and save as a GeoTIFF.
@@ -41,8 +44,8 @@ class ForecastIOAirTempProcessor(GeoDataMosaicProcessor):
                 imgtime.hour))
         gdal_translate(os.path.join(self.tmp_dir, dl_file),
                        os.path.join(self.tmp_dir, tif_file),
-                       projection='EPSG:4326',
-                       options=['COMPRESS=DEFLATE'])
+                       projection='EPSG:4326')
+        make_cog(os.path.join(self.tmp_dir, tif_file))
         return tif_file
 
     def run(self, now=None):
@@ -62,17 +65,26 @@ class ForecastIOAirTempProcessor(GeoDataMosaicProcessor):
                     year=str(now.year),
                     month='{0:02d}'.format(now.month),
                     day='{0:02d}'.format(now.day),
-                    hour='{0:02d}'.format(now.hour)), filename=raw_name)
+                    hour='{0:02d}'.format(now.hour)), filename=raw_name,
+                conditional=True)
         except requests.HTTPError:
             # Try the previous hour:
             now = now - datetime.timedelta(hours=1)
-            raw_file = self.download(
-                "{url}{year}/{month}/{day}/{hour}.tif".format(
-                    url=self.base_url,
-                    year=str(now.year),
-                    month='{0:02d}'.format(now.month),
-                    day='{0:02d}'.format(now.day),
-                    hour='{0:02d}'.format(now.hour)), filename=raw_name)
+            try:
+                raw_file = self.download(
+                    "{url}{year}/{month}/{day}/{hour}.tif".format(
+                        url=self.base_url,
+                        year=str(now.year),
+                        month='{0:02d}'.format(now.month),
+                        day='{0:02d}'.format(now.day),
+                        hour='{0:02d}'.format(now.hour)), filename=raw_name,
+                    conditional=True)
+            except NotModified:
+                logger.info("Air temperature image has not changed, skipping")
+                return
+        except NotModified:
+            logger.info("Air temperature image has not changed, skipping")
+            return
 
         tif_file = self.convert(raw_file, now)
 
@@ -90,14 +102,17 @@ class ForecastIOAirTempProcessor(GeoDataMosaicProcessor):
                 self.set_default_style(self.layer_name,
                                        self.layer_name,
                                        sld.read())
-        self.drop_old_hourly_images(now, self.layer_name)
-        self.drop_old_daily_images(now, self.layer_name)
+        removed = self.drop_old_hourly_images(now, self.layer_name)
+        removed += self.drop_old_daily_images(now, self.layer_name)
 
         self.update_geonode(self.layer_name, title=self.parse_name(now),
                             store=self.layer_name,
                             bounds=('-180.0', '180.0',
-                                    '-90.0', '90.0', 'EPSG:4326'))
-        self.truncate_gs_cache(self.layer_name)
+                                    '-90.0', '90.0', 'EPSG:4326'),
+                            time_extent=self.get_time_extent(now))
+        times = [now.strftime(self.gwc_time_format)]
+        self.truncate_gs_cache(self.layer_name, times=times + removed)
+        self.seed_gs_cache(self.layer_name, times=times)
         self.cleanup()
 
 
@@ -6,6 +6,7 @@ from urlparse import urljoin
 from django.test import TestCase
 from dataqs.forecastio.forecastio_air import ForecastIOAirTempProcessor
 import httpretty
+from osgeo import gdal
 
 script_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -87,6 +88,10 @@ class ForecastIOAirTempTest(TestCase):
         self.assertTrue(tif_file.endswith('0000000Z.tif'))
         self.assertTrue(os.path.exists(os.path.join(
             self.processor.tmp_dir, tif_file)))
+        tif = gdal.Open(os.path.join(self.processor.tmp_dir, tif_file))
+        self.assertEquals([256, 256], tif.GetRasterBand(1).GetBlockSize())
+        self.assertEquals('DEFLATE', tif.GetMetadata(
+            'IMAGE_STRUCTURE').get('COMPRESSION'))
 
     def test_cleanup(self):
         """
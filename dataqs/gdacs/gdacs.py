@@ -5,7 +5,8 @@ import os
 import datetime
 from django.db import connections
 from geonode.geoserver.helpers import ogc_server_settings
-from dataqs.helpers import ogr2ogr_exec, layer_exists, style_exists
+from dataqs.downloader import NotModified
+from dataqs.helpers import ogr2ogr_load, layer_exists, style_exists
 from dataqs.processor_base import GeoDataProcessor, DEFAULT_WORKSPACE
 
 logger = logging.getLogger("dataqs.processors")
@@ -39,17 +40,17 @@ class GDACSProcessor(GeoDataProcessor):
         super(GDACSProcessor, self).__init__(*args)
 
     def run(self):
-        rss = self.download(self.base_url.format(
-            self.params['sdate'], self.params['edate']),
-            filename=self.prefix + ".rss")
-        db = ogc_server_settings.datastore_db
-        ogr2ogr_exec("-append -skipfailures -f PostgreSQL \
-            \"PG:host={db_host} user={db_user} password={db_pass} \
-            dbname={db_name}\" {rss} -nln {table}".format(
-            db_host=db["HOST"], db_user=db["USER"],
-            db_pass=db["PASSWORD"], db_name=db["NAME"],
-            rss="{}".format(os.path.join(self.tmp_dir, rss)),
-            table=self.prefix))
+        try:
+            rss = self.download(self.base_url.format(
+                self.params['sdate'], self.params['edate']),
+                filename=self.prefix + ".rss", conditional=True)
+        except NotModified:
+            logger.info("GDACS alerts have not changed, skipping")
+            return
+        with self.stage('db_load') as timing:
+            result = ogr2ogr_load(os.path.join(self.tmp_dir, rss),
+                                  self.prefix, key='guid', bulk=True)
+            timing.rows += result.features_written
         datastore = ogc_server_settings.server.get('DATASTORE')
         if not layer_exists(self.prefix, datastore, DEFAULT_WORKSPACE):
             c = connections[datastore].cursor()
@@ -68,6 +69,7 @@ class GDACSProcessor(GeoDataProcessor):
         self.update_geonode(self.prefix, title=self.layer_title,
                             store=datastore)
         self.truncate_gs_cache(self.prefix)
+        self.seed_gs_cache(self.prefix)
         self.cleanup()
 
 if __name__ == '__main__':
@@ -3,11 +3,13 @@ from __future__ import absolute_import
 import logging
 import os
 import datetime
-import struct
 import re
+import numpy
 import requests
 from bs4 import BeautifulSoup as bs
-from dataqs.helpers import gdal_translate, style_exists
+from dataqs.downloader import NotModified
+from dataqs.helpers import array_to_geotiff, make_cog, style_exists
+from dataqs.metrics import instrumented
 from dataqs.processor_base import GeoDataProcessor
 
 logger = logging.getLogger("dataqs.processors")
@@ -21,14 +23,8 @@ class GFMSProcessor(GeoDataProcessor):
 
     rows = 800
     cols = 2458
-
-    header = """ncols        {cols}
-    nrows        {rows}
-    xllcorner    -127.5
-    yllcorner    -50.0
-    cellsize     0.125
-    NODATA_value -9999
-    """.format(cols=cols, rows=rows)
+    geotransform = (-127.5, 0.125, 0, 50.0, 0, -0.125)
+    nodata = -9999
 
     base_url = "http://eagle1.umd.edu/flood/download/"
     layer_future = "gfms_latest"
@@ -77,6 +73,7 @@ class GFMSProcessor(GeoDataProcessor):
         img_url = "{}/{}".format(base_url, latest_img)
         return img_url
 
+    @instrumented('convert')
     def convert(self, img_file):
         """
         Convert a raw GFMS image into a GeoTIFF
@@ -85,28 +82,17 @@ class GFMSProcessor(GeoDataProcessor):
         :return: Name of converted GeoTIFF file
         """
         basename = os.path.splitext(img_file)[0]
-        aig_file = "{}.aig".format(basename)
         tif_file = "{}.tif".format(basename)
 
-        outfile = open(os.path.join(self.tmp_dir, aig_file), "w")
-        infile = open(os.path.join(self.tmp_dir, img_file), "rb")
-
-        try:
-            coords = struct.unpack('f'*self.rows*self.cols,
-                                   infile.read(4*self.rows*self.cols))
-            outfile.write(self.header)
-
-            for idx, value in enumerate(coords):
-                outfile.write(str(value) + " ")
-                if (idx + 1) % 2458 == 0:
-                    outfile.write("\n")
-        finally:
-            outfile.close()
-            infile.close()
-
-        gdal_translate(os.path.join(self.tmp_dir, aig_file),
-                       os.path.join(self.tmp_dir, tif_file),
-                       projection="EPSG:4326")
+        # Raw grid of rows x cols 32-bit floats, north to south
+        data = numpy.fromfile(os.path.join(self.tmp_dir, img_file),
+                              dtype=numpy.float32,
+                              count=self.rows * self.cols)
+        array_to_geotiff(data.reshape(self.rows, self.cols),
+                         os.path.join(self.tmp_dir, tif_file),
+                         self.geotransform, projection="EPSG:4326",
+                         nodata=self.nodata)
+        make_cog(os.path.join(self.tmp_dir, tif_file))
         return tif_file
 
     def parse_title(self, tif_file):
@@ -126,7 +112,11 @@ class GFMSProcessor(GeoDataProcessor):
         Retrieve and process the GFMS image furthest into the future.
         """
         img_url = self.get_latest_future()
-        img_file = self.download(img_url)
+        try:
+            img_file = self.download(img_url, conditional=True)
+        except NotModified:
+            logger.info("{} has not changed, skipping".format(img_url))
+            return
         tif_file = self.convert(img_file)
         new_title = self.parse_title(tif_file)
         self.post_geoserver(tif_file, self.layer_future)
@@ -138,13 +128,18 @@ class GFMSProcessor(GeoDataProcessor):
         self.update_geonode(self.layer_future, title=new_title,
                             store=self.layer_future)
         self.truncate_gs_cache(self.layer_future)
+        self.seed_gs_cache(self.layer_future)
 
     def import_current(self):
         """
         Retrieve and process the GFMS image closest to the current date/time.
         """
         img_url = self.get_most_current()
-        img_file = self.download(img_url)
+        try:
+            img_file = self.download(img_url, conditional=True)
+        except NotModified:
+            logger.info("{} has not changed, skipping".format(img_url))
+            return
         tif_file = self.convert(img_file)
         new_title = self.parse_title(tif_file)
         self.post_geoserver(tif_file, self.layer_current)
@@ -156,6 +151,7 @@ class GFMSProcessor(GeoDataProcessor):
         self.update_geonode(self.layer_current, title=new_title,
                             store=self.layer_current)
         self.truncate_gs_cache(self.layer_current)
+        self.seed_gs_cache(self.layer_current)
 
     def run(self):
         """
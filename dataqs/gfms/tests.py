@@ -4,6 +4,8 @@ import os
 import datetime
 from django.test import TestCase
 import re
+import numpy
+from osgeo import gdal
 from dataqs.gfms.gfms import GFMSProcessor
 import httpretty
 
@@ -86,6 +88,39 @@ class GFMSTest(TestCase):
         self.assertTrue(os.path.exists(os.path.join(
             self.processor.tmp_dir, tif_file)))
 
+    def test_convert_georeference(self):
+        """
+        Verify that the GeoTIFF matches the ASCII grid the image used to be
+        converted through
+        """
+        current_url = self.processor.get_most_current()
+        httpretty.register_uri(httpretty.GET, current_url,
+                               body=get_mock_image())
+        imgfile = self.processor.download(current_url)
+        tif_file = self.processor.convert(imgfile)
+        rows, cols = self.processor.rows, self.processor.cols
+        data = numpy.fromfile(os.path.join(self.processor.tmp_dir, imgfile),
+                              dtype=numpy.float32, count=rows * cols)
+        aig_file = os.path.join(self.processor.tmp_dir,
+                                self.processor.prefix + '_test.asc')
+        with open(aig_file, 'w') as aig:
+            aig.write("ncols        {}\n"
+                      "nrows        {}\n"
+                      "xllcorner    -127.5\n"
+                      "yllcorner    -50.0\n"
+                      "cellsize     0.125\n"
+                      "NODATA_value -9999\n".format(cols, rows))
+            numpy.savetxt(aig, data.reshape(rows, cols), fmt='%.9g')
+        aig_ds = gdal.Open(aig_file)
+        tif_ds = gdal.Open(os.path.join(self.processor.tmp_dir, tif_file))
+        self.assertEquals(aig_ds.GetGeoTransform(), tif_ds.GetGeoTransform())
+        self.assertEquals((cols, rows),
+                          (tif_ds.RasterXSize, tif_ds.RasterYSize))
+        self.assertEquals(-9999, tif_ds.GetRasterBand(1).GetNoDataValue())
+        self.assertTrue(numpy.allclose(
+            aig_ds.GetRasterBand(1).ReadAsArray(),
+            tif_ds.GetRasterBand(1).ReadAsArray()))
+
     def test_cleanup(self):
         current_url = self.processor.get_most_current()
         httpretty.register_uri(httpretty.GET, current_url,
@@ -1,30 +1,71 @@
 import datetime
+import hashlib
 import logging
+import math
+import multiprocessing
+from collections import namedtuple
 import traceback
+import uuid
 import os
 import subprocess
+import tempfile
+import zlib
+from contextlib import contextmanager
 import requests
-from geoserver.catalog import Catalog, FailedRequestError
-import psycopg2
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 import re
-import sys
-from StringIO import StringIO
-import rasterio
-from osgeo import gdal
-from rasterio._warp import RESAMPLING
-from rasterio.warp import calculate_default_transform, reproject
+import threading
+import time
 import unicodedata
-from geonode.geoserver.helpers import ogc_server_settings
-import ogr2ogr
+from xml.sax.saxutils import escape
+from django.conf import settings
+from geonode.geoserver.helpers import ogc_server_settings, get_store
 
 logger = logging.getLogger("dataqs.helpers")
 
+GS_POOL_SIZE = getattr(settings, 'GS_POOL_SIZE', 4)
+GS_MAX_RETRIES = getattr(settings, 'GS_MAX_RETRIES', 3)
+GS_RETRY_BACKOFF = getattr(settings, 'GS_RETRY_BACKOFF', 0.5)
+GS_CONNECT_TIMEOUT = getattr(settings, 'GS_CONNECT_TIMEOUT', 10)
+GS_READ_TIMEOUT = getattr(settings, 'GS_READ_TIMEOUT', 300)
+GS_UPLOAD_GZIP = getattr(settings, 'GS_UPLOAD_GZIP', False)
+UPLOAD_CHUNK_SIZE = getattr(settings, 'UPLOAD_CHUNK_SIZE', 1024 * 1024)
+GS_CATALOG_CACHE_TTL = getattr(settings, 'GS_CATALOG_CACHE_TTL', 300)
+PG_POOL_MIN_SIZE = getattr(settings, 'PG_POOL_MIN_SIZE', 1)
+PG_POOL_MAX_SIZE = getattr(settings, 'PG_POOL_MAX_SIZE', 8)
+# Also run a test query on each connection taken from the pool (an extra
+# round-trip per checkout; by default only the connection state is checked)
+PG_POOL_CHECK_QUERY = getattr(settings, 'PG_POOL_CHECK_QUERY', False)
+COPY_BUFFER_SIZE = getattr(settings, 'COPY_BUFFER_SIZE', 64 * 1024)
+WARP_NUM_THREADS = getattr(settings, 'WARP_NUM_THREADS',
+                           multiprocessing.cpu_count())
+WARP_RESAMPLING = getattr(settings, 'WARP_RESAMPLING', 'nearest')
+# Memory limit for reprojection in MB (used as the GDAL block cache size
+# and to size the windows of windowed reprojection)
+WARP_MEMORY_LIMIT = getattr(settings, 'WARP_MEMORY_LIMIT', 64)
+WARP_BLOCK_SIZE = getattr(settings, 'WARP_BLOCK_SIZE', 256)
+COG_BLOCK_SIZE = getattr(settings, 'COG_BLOCK_SIZE', 256)
+COG_OVERVIEW_RESAMPLING = getattr(settings, 'COG_OVERVIEW_RESAMPLING',
+                                  'NEAREST')
+# Use GDAL's VectorTranslate (GDAL 2.1+) instead of the ogr2ogr port
+OGR_USE_VECTOR_TRANSLATE = getattr(settings, 'OGR_USE_VECTOR_TRANSLATE',
+                                   True)
+# Rows per transaction when loading vector data into PostgreSQL
+OGR_PG_GROUP_TRANSACTIONS = getattr(settings, 'OGR_PG_GROUP_TRANSACTIONS',
+                                    20000)
+# Directory for the precomputed index maps of fixed-grid reprojections
+WARP_INDEX_CACHE_DIR = getattr(
+    settings, 'WARP_INDEX_CACHE_DIR',
+    os.path.join(getattr(settings, 'GS_TMP_DIR', '/tmp'), 'warp_index'))
+
 
 class GdalErrorHandler(object):
     """
     Don't display GDAL warnings, only errors
     """
     def __init__(self):
+        from osgeo import gdal
         self.err_level = gdal.CE_Failure
         self.err_no = 0
         self.err_msg = ''
@@ -35,10 +76,242 @@ class GdalErrorHandler(object):
         self.err_msg = err_msg
 
 
-err = GdalErrorHandler()
-handler = err.handler
-gdal.PushErrorHandler(handler)
-gdal.UseExceptions()
+err = None
+handler = None
+_gdal_lock = threading.Lock()
+
+
+def get_gdal():
+    """
+    Import GDAL on first use rather than when this module is imported,
+    installing the error handler and enabling exceptions once.
+    :return: osgeo.gdal module
+    """
+    global err, handler
+    from osgeo import gdal
+    if err is None:
+        with _gdal_lock:
+            if err is None:
+                gdal_err = GdalErrorHandler()
+                gdal.PushErrorHandler(gdal_err.handler)
+                gdal.UseExceptions()
+                handler = gdal_err.handler
+                err = gdal_err
+    return gdal
+
+
+class GeoServerSession(requests.Session):
+    """
+    A requests Session that applies a default timeout to every request
+    """
+    def __init__(self, timeout=None):
+        super(GeoServerSession, self).__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(GeoServerSession, self).request(method, url, **kwargs)
+
+
+_gs_sessions = {}
+_gs_session_lock = threading.Lock()
+
+
+def get_gs_session():
+    """
+    Return a shared, authenticated, connection-pooled session for GeoServer
+    REST requests.  One session is created per process (so that forked
+    Celery workers never share sockets) and reused by all of its threads.
+    Pool size, retries and timeouts are set by the GS_POOL_SIZE,
+    GS_MAX_RETRIES, GS_RETRY_BACKOFF, GS_CONNECT_TIMEOUT and GS_READ_TIMEOUT
+    settings.
+    :return: GeoServerSession
+    """
+    pid = os.getpid()
+    session = _gs_sessions.get(pid)
+    if session is None:
+        with _gs_session_lock:
+            session = _gs_sessions.get(pid)
+            if session is None:
+                session = GeoServerSession(
+                    timeout=(GS_CONNECT_TIMEOUT, GS_READ_TIMEOUT))
+                _user, _password = ogc_server_settings.credentials
+                session.auth = (_user, _password)
+                # Only retry failures that happen before a request body is
+                # sent, so that streamed uploads are never replayed empty.
+                retries = Retry(total=GS_MAX_RETRIES, connect=GS_MAX_RETRIES,
+                                read=0, backoff_factor=GS_RETRY_BACKOFF)
+                adapter = HTTPAdapter(pool_connections=GS_POOL_SIZE,
+                                      pool_maxsize=GS_POOL_SIZE,
+                                      max_retries=retries)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _gs_sessions[pid] = session
+    return session
+
+
+class CatalogCache(object):
+    """
+    Process-wide cache of GeoServer catalog existence checks.  Objects
+    found to exist are remembered for `ttl` seconds, so repeated checks
+    cost no REST requests; missing objects are not cached, because they
+    are about to be created (and then registered with `add`).  Each
+    thread gets its own gsconfig Catalog, since those are not thread-safe.
+    """
+    def __init__(self, ttl=GS_CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def catalog(self):
+        """
+        A gsconfig Catalog for the current process and thread
+        """
+        from geoserver.catalog import Catalog
+
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            _user, _password = ogc_server_settings.credentials
+            self._local.catalog = Catalog(ogc_server_settings.rest,
+                                          _user, _password)
+            self._local.pid = pid
+        return self._local.catalog
+
+    def exists(self, key, lookup):
+        """
+        Check whether a catalog object exists, using the cache if possible
+        :param key: tuple identifying the catalog object
+        :param lookup: function taking a Catalog and returning True if the
+        object exists
+        :return: True or False
+        """
+        with self._lock:
+            expires = self._entries.get(key)
+        if expires and expires > time.time():
+            return True
+        found = lookup(self.catalog)
+        if found:
+            self.add(key)
+        return found
+
+    def add(self, key):
+        """
+        Record that a catalog object exists, e.g. right after creating it
+        :param key: tuple identifying the catalog object
+        """
+        with self._lock:
+            self._entries[key] = time.time() + self.ttl
+        self.clear_catalog_cache()
+
+    def invalidate(self, key=None):
+        """
+        Forget a cached catalog object, or all of them if no key is given
+        :param key: tuple identifying the catalog object
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        self.clear_catalog_cache()
+
+    def clear_catalog_cache(self):
+        """
+        Discard the current thread's Catalog response cache, so that
+        objects created through the REST API are visible to it
+        """
+        cache = getattr(getattr(self._local, 'catalog', None), '_cache', None)
+        if cache is not None:
+            cache.clear()
+
+
+gs_catalog_cache = CatalogCache()
+
+
+def gzip_chunks(fileobj, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Generator that gzip-compresses a file-like object chunk by chunk
+    :param fileobj: Open binary file-like object
+    :param chunk_size: Number of bytes to read at a time
+    :return: iterator of compressed byte strings
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                  zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+@contextmanager
+def file_upload(filepath, content_type, compress=GS_UPLOAD_GZIP):
+    """
+    Open a file as a streaming request body, so that uploads never hold
+    the whole file in memory.  Uncompressed bodies are sent with an
+    explicit Content-Length; compressed bodies are gzipped on the fly and
+    sent with chunked transfer encoding (only enable this if GeoServer, or
+    a proxy in front of it, decodes gzip request bodies).
+    :param filepath: Full path & name of the file to upload
+    :param content_type: Content-Type header value
+    :param compress: Whether to gzip the body while streaming it
+    :return: tuple of (request body, request headers)
+    """
+    headers = {'Content-Type': content_type}
+    with open(filepath, 'rb') as upload:
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+            yield gzip_chunks(upload), headers
+        else:
+            headers['Content-Length'] = str(os.fstat(upload.fileno()).st_size)
+            yield upload, headers
+
+
+def expand_bbox(bbox, x, y):
+    """
+    Expand a bounding box to include a point
+    :param bbox: (minx, miny, maxx, maxy) tuple, or None
+    :param x: x coordinate (longitude)
+    :param y: y coordinate (latitude)
+    :return: (minx, miny, maxx, maxy) tuple
+    """
+    if bbox is None:
+        return x, y, x, y
+    return min(bbox[0], x), min(bbox[1], y), max(bbox[2], x), max(bbox[3], y)
+
+
+def bbox_to_gridset(bbox, gridset):
+    """
+    Transform an EPSG:4326 bounding box to the coordinate system of a
+    GeoWebCache gridset, for geographic and spherical mercator gridsets.
+    :param bbox: (minx, miny, maxx, maxy) tuple in EPSG:4326
+    :param gridset: Name of the gridset, e.g. 'EPSG:900913'
+    :return: (minx, miny, maxx, maxy) tuple, or None if the gridset's
+    coordinate system is not supported
+    """
+    match = re.match(r'EPSG:(\d+)$', gridset)
+    if not match:
+        return None
+    epsg = int(match.group(1))
+    if epsg == 4326:
+        return tuple(bbox)
+    if epsg not in (900913, 3857, 3785, 102100, 102113):
+        return None
+    half_circ = 20037508.342789244
+    max_lat = 85.0511287798
+
+    def to_mercator(lon, lat):
+        lat = max(-max_lat, min(max_lat, lat))
+        x = lon * half_circ / 180.0
+        y = math.log(math.tan((90.0 + lat) * math.pi / 360.0)) * \
+            half_circ / math.pi
+        return x, y
+
+    minx, miny = to_mercator(bbox[0], bbox[1])
+    maxx, maxy = to_mercator(bbox[2], bbox[3])
+    return minx, miny, maxx, maxy
 
 
 def split_args(arg_string):
@@ -57,6 +330,7 @@ def get_band_count(raster_file):
     :param raster_file: The full path & name of a raster file.
     :return: number of bands
     """
+    gdal = get_gdal()
     datafile = gdal.Open(raster_file)
     return datafile.RasterCount
 
@@ -67,19 +341,16 @@ def gdal_translate(src_filename, dst_filename, dst_format="GTiff", bands=None,
     Convert a raster image with the specified arguments
     (as if running from commandline)
     """
-    from osgeo import gdal
     from osr import SpatialReference
+    gdal = get_gdal()
 
     if not options:
         options = []
 
     # Open existing dataset, subsetting bands if necessary
+    src_ds = gdal.Open(src_filename)
     if bands:
-        tmp_file = src_filename + ".sub"
-        gdal_band_subset(src_filename, bands, tmp_file)
-        src_ds = gdal.Open(tmp_file)
-    else:
-        src_ds = gdal.Open(src_filename)
+        src_ds = band_subset_vrt(src_ds, bands)
     try:
         # Open output format driver, see gdal_translate --formats for list
         driver = gdal.GetDriverByName(dst_format)
@@ -101,8 +372,210 @@ def gdal_translate(src_filename, dst_filename, dst_format="GTiff", bands=None,
         dst_ds = None
         src_ds = None
         band = None
-        if bands and tmp_file:
-            os.remove(tmp_file)
+
+
+def cog_options(data_type, block_size=COG_BLOCK_SIZE):
+    """
+    Return GeoTIFF creation options for a tiled, DEFLATE-compressed image
+    with internal overviews
+    :param data_type: GDAL data type of the image
+    :param block_size: Tile width and height
+    :return: list of creation options
+    """
+    gdal = get_gdal()
+    floating = gdal.GetDataTypeName(data_type).startswith(('Float', 'CFloat'))
+    return [
+        'TILED=YES',
+        'BLOCKXSIZE={}'.format(block_size),
+        'BLOCKYSIZE={}'.format(block_size),
+        'COMPRESS=DEFLATE',
+        'PREDICTOR={}'.format(3 if floating else 2),
+        'COPY_SRC_OVERVIEWS=YES'
+    ]
+
+
+def overview_levels(width, height, block_size=COG_BLOCK_SIZE):
+    """
+    Return overview decimation factors (2, 4, 8...) until the smallest
+    overview fits in a single tile
+    """
+    levels = []
+    factor = 2
+    while max(width, height) > block_size * factor / 2:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def make_cog(filename, statistics=False,
+             resampling=COG_OVERVIEW_RESAMPLING):
+    """
+    Rewrite a GeoTIFF image in place as a cloud-optimized GeoTIFF: tiled,
+    compressed with DEFLATE and a predictor, with internal overviews
+    stored ahead of the full resolution image.
+    :param filename: Full path & name of the GeoTIFF image
+    :param statistics: Also compute and store band statistics
+    :param resampling: Overview resampling method, i.e. 'NEAREST',
+    'AVERAGE'
+    :return: None
+    """
+    gdal = get_gdal()
+    cog_file = filename + '.cog'
+    src_ds = gdal.Open(filename)
+    try:
+        levels = overview_levels(src_ds.RasterXSize, src_ds.RasterYSize)
+        if levels:
+            # Builds an external .ovr file, copied into the output
+            src_ds.BuildOverviews(resampling, levels)
+        if statistics:
+            for band_num in xrange(1, src_ds.RasterCount + 1):
+                src_ds.GetRasterBand(band_num).ComputeStatistics(False)
+        options = cog_options(src_ds.GetRasterBand(1).DataType)
+        dst_ds = gdal.GetDriverByName('GTiff').CreateCopy(
+            cog_file, src_ds, 0, options)
+        dst_ds = None
+    except Exception:
+        if os.path.exists(cog_file):
+            os.remove(cog_file)
+        raise
+    finally:
+        src_ds = None
+        for sidecar in ('.ovr', '.aux.xml'):
+            if os.path.exists(filename + sidecar):
+                os.remove(filename + sidecar)
+    os.rename(cog_file, filename)
+
+
+def netcdf_to_geotiff(nc_file, variable, dst_filename, band=None,
+                      projection="EPSG:4326"):
+    """
+    Write one band (time slice) of a NetCDF variable to a north-up GeoTIFF,
+    reading only that band.  South-up grids are flipped in memory.
+    :param nc_file: Full path & name of the NetCDF file
+    :param variable: Name of the NetCDF variable (subdataset)
+    :param dst_filename: Full path & name of the output GeoTIFF
+    :param band: Band number to convert (default is the last band)
+    :param projection: Output projection
+    :return: None
+    """
+    gdal = get_gdal()
+    src_ds = gdal.Open('NETCDF:"{}":{}'.format(nc_file, variable))
+    try:
+        src_band = src_ds.GetRasterBand(band or src_ds.RasterCount)
+        data = src_band.ReadAsArray()
+        geotransform = list(src_ds.GetGeoTransform())
+        if geotransform[5] > 0:
+            data = data[::-1]
+            geotransform[3] += geotransform[5] * src_ds.RasterYSize
+            geotransform[5] = -geotransform[5]
+        array_to_geotiff(data, dst_filename, geotransform, projection,
+                         nodata=src_band.GetNoDataValue())
+    finally:
+        src_band = None
+        src_ds = None
+
+
+def array_to_geotiff(data, dst_filename, geotransform,
+                     projection="EPSG:4326", nodata=None):
+    """
+    Write a 2-dimensional numpy array to a single band GeoTIFF
+    :param data: numpy array
+    :param dst_filename: Full path & name of the output GeoTIFF
+    :param geotransform: GDAL geotransform of the array
+    :param projection: Output projection
+    :param nodata: Nodata value
+    :return: None
+    """
+    from osgeo import gdal_array
+    from osr import SpatialReference
+    gdal = get_gdal()
+
+    data_type = gdal_array.NumericTypeCodeToGDALTypeCode(data.dtype.type)
+    dst_ds = gdal.GetDriverByName("GTiff").Create(
+        dst_filename, data.shape[1], data.shape[0], 1, data_type)
+    try:
+        dst_ds.SetGeoTransform(geotransform)
+        srs = SpatialReference()
+        srs.SetWellKnownGeogCS(projection)
+        dst_ds.SetProjection(srs.ExportToWkt())
+        dst_band = dst_ds.GetRasterBand(1)
+        if nodata is not None:
+            dst_band.SetNoDataValue(nodata)
+        dst_band.WriteArray(data)
+    finally:
+        # Properly close the datasets to flush to disk
+        dst_band = None
+        dst_ds = None
+
+
+class IntermediateFile(object):
+    """
+    A file-like object that writes to GDAL's /vsimem/ in-memory filesystem
+    and moves the file to disk if it grows larger than max_size bytes.
+    Once closed, the file can be opened by GDAL at its path attribute.
+    """
+    def __init__(self, memory_path, disk_path, max_size):
+        self.disk_path = disk_path
+        self.max_size = max_size
+        self.size = 0
+        self.in_memory = max_size > 0
+        if self.in_memory:
+            self.path = memory_path
+            self._file = get_gdal().VSIFOpenL(memory_path, 'wb')
+        else:
+            self.path = disk_path
+            self._file = open(disk_path, 'wb')
+
+    def write(self, data):
+        if self.in_memory and self.size + len(data) > self.max_size:
+            self.spill()
+        if self.in_memory:
+            get_gdal().VSIFWriteL(data, 1, len(data), self._file)
+        else:
+            self._file.write(data)
+        self.size += len(data)
+
+    def spill(self):
+        """
+        Move the file from memory to disk
+        """
+        gdal = get_gdal()
+        gdal.VSIFCloseL(self._file)
+        disk_file = open(self.disk_path, 'wb')
+        memory_file = gdal.VSIFOpenL(self.path, 'rb')
+        try:
+            while True:
+                chunk = gdal.VSIFReadL(1, COPY_BUFFER_SIZE, memory_file)
+                if not chunk:
+                    break
+                disk_file.write(chunk)
+        finally:
+            gdal.VSIFCloseL(memory_file)
+        gdal.Unlink(self.path)
+        logger.debug("{} exceeds {} bytes, moved to {}".format(
+            self.path, self.max_size, self.disk_path))
+        self._file = disk_file
+        self.path = self.disk_path
+        self.in_memory = False
+
+    def close(self):
+        if self._file is None:
+            return
+        if self.in_memory:
+            get_gdal().VSIFCloseL(self._file)
+        else:
+            self._file.close()
+        self._file = None
+
+    def remove(self):
+        """
+        Close and delete the file
+        """
+        self.close()
+        if self.in_memory:
+            get_gdal().Unlink(self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
 
 
 def nc_convert(filename):
@@ -140,52 +613,629 @@ def ogr2ogr_exec(argstring):
     :param argstring: command line arguments as string
     :return: success or failure
     """
+    import ogr2ogr
+
     args = ["", ]
     args.extend(split_args(argstring))
-    old_stdout = sys.stdout
-    result = StringIO()
-    sys.stdout = result
+    messages = []
+    if not ogr2ogr.main(args, message_func=messages.append):
+        raise Exception("\n".join(messages))
+
+
+VectorLoadResult = namedtuple('VectorLoadResult', [
+    'features_written', 'features_failed', 'features_skipped', 'elapsed'])
+
+
+def ogr_pg_target():
+    """
+    Return the OGR connection string of the GeoNode datastore database
+    """
+    db = ogc_server_settings.datastore_db
+    target = "PG:host={host} user={user} password={password} " \
+             "dbname={name}".format(host=db["HOST"], user=db["USER"],
+                                    password=db["PASSWORD"], name=db["NAME"])
+    if db.get("PORT"):
+        target += " port={}".format(db["PORT"])
+    return target
+
+
+def ogr2ogr_load(source, layer_name, target=None, target_format="PostgreSQL",
+                 mode="append", sql=None, src_srs=None, dst_srs=None,
+                 skip_failures=False, options=None, progress=None,
+                 key=None, bulk=False, spatial_index=True, analyze=True):
+    """
+    Load a vector data source into a layer of a target data source, by
+    default the GeoNode datastore database, with gdal.VectorTranslate if
+    available or else the Python port of ogr2ogr.  Safe to call from
+    several threads; the numbers of features written and failed only
+    include this load, unless other loads append to the same layer at the
+    same time with gdal.VectorTranslate.  Without thread-local GDAL
+    configuration options (GDAL 1.x), bulk loads run one at a time and
+    other loads running alongside them also use COPY.
+    :param source: OGR data source name, i.e. a file path
+    :param layer_name: Name of the target layer/table
+    :param target: OGR target data source name (default is the datastore)
+    :param target_format: OGR driver of the target
+    :param mode: 'append', 'overwrite' or 'create'
+    :param sql: Optional SQL statement to select features from the source
+    :param src_srs: Optional source SRS, i.e. 'EPSG:4326'
+    :param dst_srs: Optional target SRS to reproject to
+    :param skip_failures: Continue after features fail to load
+    :param options: Optional list of extra ogr2ogr arguments,
+    i.e. ['-lco', 'GEOMETRY_NAME=the_geom']
+    :param progress: Optional callable(fraction complete, message), also
+    called with a fraction of None for each message of the translation
+    :param key: Optional key column of the features.  When appending to
+    an existing datastore table, features whose key is already present
+    are skipped instead of failing (see ogr2ogr_merge)
+    :param bulk: Use the high-throughput profile for loads into the
+    datastore: COPY instead of INSERTs, OGR_PG_GROUP_TRANSACTIONS
+    features per transaction, spatial index built after the load and
+    ANALYZE
+    :param spatial_index: Create a spatial index on new datastore tables
+    :param analyze: ANALYZE the table after a bulk load
+    :return: VectorLoadResult
+    """
+    if key and mode == "append" and target is None and \
+            table_exists(layer_name):
+        return ogr2ogr_merge(source, layer_name, key, sql=sql,
+                             src_srs=src_srs, dst_srs=dst_srs,
+                             options=options, progress=progress, bulk=bulk)
+    pg_datastore = target is None and target_format == "PostgreSQL"
+    new_table = pg_datastore and (
+        mode != "append" or not table_exists(layer_name))
+    bulk = bulk and pg_datastore
+    options = list(options or [])
+    if new_table and (bulk or not spatial_index):
+        # Without a spatial index, or with one created after the load
+        options = ["-lco", "SPATIAL_INDEX=NO"] + options
+    if bulk:
+        options = ["-gt", str(OGR_PG_GROUP_TRANSACTIONS)] + options
+    target = target or ogr_pg_target()
+    messages = []
+
+    def message_func(msg):
+        messages.append(msg)
+        if progress:
+            progress(None, msg)
+
+    def progress_func(complete, msg, data):
+        progress(complete, msg)
+        return True
+
+    if OGR_USE_VECTOR_TRANSLATE and hasattr(get_gdal(), 'VectorTranslate'):
+        translate = vector_translate
+    else:
+        translate = ogr2ogr_translate
+    start = time.time()
+    with gdal_config_option("PG_USE_COPY", "YES" if bulk else None):
+        counts = translate(source, layer_name, target, target_format, mode,
+                           sql, src_srs, dst_srs, skip_failures, options,
+                           progress_func if progress else None, message_func)
+    if counts is None:
+        raise Exception("\n".join(messages))
+    if bulk and (analyze or (new_table and spatial_index)):
+        finish_bulk_load(layer_name, spatial_index=new_table and spatial_index,
+                         analyze=analyze)
+    written, failed = counts
+    result = VectorLoadResult(written, failed, 0, time.time() - start)
+    logger.debug("Loaded {} into {}: {}".format(source, layer_name, result))
+    return result
+
+
+_gdal_config_lock = threading.RLock()
+
+
+@contextmanager
+def gdal_config_option(name, value):
+    """
+    Set a GDAL configuration option for the duration of a with block,
+    only for the current thread if the GDAL version supports it.  Older
+    GDAL versions (i.e. 1.10) only have global options, so the with
+    blocks that set an option run one at a time; code running in other
+    threads without setting the option still sees its value.
+    :param name: Option name
+    :param value: Option value, None to leave the option as it is
+    """
+    gdal = get_gdal()
+    if value is None:
+        yield
+        return
+    if hasattr(gdal, 'SetThreadLocalConfigOption'):
+        previous = gdal.GetThreadLocalConfigOption(name, None)
+        gdal.SetThreadLocalConfigOption(name, value)
+        try:
+            yield
+        finally:
+            gdal.SetThreadLocalConfigOption(name, previous)
+        return
+    with _gdal_config_lock:
+        previous = gdal.GetConfigOption(name, None)
+        gdal.SetConfigOption(name, value)
+        try:
+            yield
+        finally:
+            gdal.SetConfigOption(name, previous)
+
+
+def finish_bulk_load(table, spatial_index=True, analyze=True):
+    """
+    Create the spatial index of a table loaded without one and update
+    its planner statistics
+    :param table: Name of a datastore table
+    :param spatial_index: Create a GiST index on its geometry column
+    :param analyze: Update the planner statistics of the table
+    """
+    if spatial_index:
+        geom_columns = postgres_query(
+            "SELECT f_geometry_column FROM geometry_columns "
+            "WHERE f_table_name = %s", params=(table,), returnable=True)
+        for (geom_column,) in geom_columns or []:
+            postgres_query(
+                "CREATE INDEX IF NOT EXISTS {index} ON {table} "
+                "USING GIST ({column})".format(
+                    index=quote_ident("{}_{}_geom_idx".format(
+                        table, geom_column)),
+                    table=quote_ident(table),
+                    column=quote_ident(geom_column)), commit=True)
+    if analyze:
+        postgres_query("ANALYZE {}".format(quote_ident(table)), commit=True)
+
+
+def ogr2ogr_merge(source, layer_name, key, sql=None, src_srs=None,
+                  dst_srs=None, options=None, progress=None, bulk=False):
+    """
+    Append features to an existing datastore table, skipping features
+    whose key is already in the table (or repeated in the source).  The
+    features are loaded into a staging table in large transactions, then
+    merged into the table with a single INSERT, so duplicates never
+    cause failed inserts (and -skipfailures is not needed).
+    :param source: OGR data source name, i.e. a file path
+    :param layer_name: Name of the target table
+    :param key: Key column
+    :param bulk: Analyze the table after the merge
+    :return: VectorLoadResult
+    """
+    # Named as OGR launders it when creating the table
+    staging = re.sub(r'[^a-z0-9_]', '_', "{}_staging_{}".format(
+        layer_name, uuid.uuid4().hex[:8]).lower())
+    start = time.time()
+    try:
+        staged = ogr2ogr_load(
+            source, staging, mode="overwrite", sql=sql, src_srs=src_srs,
+            dst_srs=dst_srs, progress=progress, options=options, bulk=True,
+            spatial_index=False, analyze=False)
+        with postgres_transaction() as cursor:
+            # Field types are guessed per source file, so cast staged
+            # values to the types of the table's columns
+            columns_sql = "SELECT attname, format_type(atttypid, atttypmod) " \
+                          "FROM pg_attribute WHERE attrelid = %s::regclass " \
+                          "AND attnum > 0 AND NOT attisdropped"
+            cursor.execute(columns_sql, (quote_ident(staging),))
+            staging_columns = set(row[0] for row in cursor.fetchall())
+            cursor.execute(columns_sql, (quote_ident(layer_name),))
+            columns = [(quote_ident(name), col_type)
+                       for name, col_type in cursor.fetchall()
+                       if name in staging_columns and name != "ogc_fid"]
+            cursor.execute(
+                "INSERT INTO {table} ({cols}) "
+                "SELECT DISTINCT ON (s.{key}) {values} FROM {staging} s "
+                "WHERE NOT EXISTS (SELECT 1 FROM {table} t "
+                "WHERE t.{key} = s.{key}) ORDER BY s.{key} "
+                "ON CONFLICT DO NOTHING".format(
+                    table=quote_ident(layer_name),
+                    staging=quote_ident(staging),
+                    cols=",".join(name for name, _ in columns),
+                    values=",".join(
+                        "CAST(s.{} AS {})".format(name, col_type)
+                        for name, col_type in columns),
+                    key=quote_ident(key)))
+            inserted = cursor.rowcount
+    finally:
+        postgres_query("DROP TABLE IF EXISTS {}".format(quote_ident(staging)),
+                       commit=True)
+    if bulk:
+        finish_bulk_load(layer_name, spatial_index=False)
+    result = VectorLoadResult(
+        inserted, staged.features_failed,
+        staged.features_written - inserted, time.time() - start)
+    logger.debug("Merged {} into {}: {}".format(source, layer_name, result))
+    return result
+
+
+def vector_translate(source, layer_name, target, target_format, mode, sql,
+                     src_srs, dst_srs, skip_failures, options,
+                     progress_func, message_func):
+    """
+    Translate a vector data source with gdal.VectorTranslate (GDAL 2.1+);
+    see ogr2ogr_load for the arguments.  Features written are counted on
+    the target layer before and after the translation, and features that
+    were not written are counted as failed.
+    :return: tuple of features written and failed, None on failure
+    """
+    gdal = get_gdal()
+
+    def error_handler(err_level, err_no, err_msg):
+        if err_level >= gdal.CE_Warning:
+            message_func(err_msg)
+
+    access_modes = {"append": "append", "overwrite": "overwrite"}
+    gdal.PushErrorHandler(error_handler)
+    src_ds = dst_ds = None
+    try:
+        # Features to translate, counted on the source dataset that is
+        # then passed to VectorTranslate
+        src_ds = gdal.OpenEx(source, gdal.OF_VECTOR)
+        if sql:
+            result_layer = src_ds.ExecuteSQL(sql)
+            expected = result_layer.GetFeatureCount()
+            src_ds.ReleaseResultSet(result_layer)
+        else:
+            expected = sum(src_ds.GetLayer(i).GetFeatureCount()
+                           for i in xrange(src_ds.GetLayerCount()))
+        before = 0
+        if mode == "append":
+            before = count_layer_features(target, layer_name)
+        dst_ds = gdal.VectorTranslate(
+            target, src_ds, options=list(options), format=target_format,
+            accessMode=access_modes.get(mode), layerName=layer_name,
+            SQLStatement=sql, srcSRS=src_srs, dstSRS=dst_srs,
+            skipFailures=skip_failures, callback=progress_func)
+        if dst_ds is None:
+            return None
+        # Close the target to flush the output before counting
+        dst_ds = None
+        written = count_layer_features(target, layer_name) - before
+        return written, max(expected - written, 0)
+    except RuntimeError as e:
+        message_func(str(e))
+        return None
+    finally:
+        # Close the datasets to flush the output
+        src_ds = dst_ds = None
+        gdal.PopErrorHandler()
+
+
+def count_layer_features(target, layer_name):
+    """
+    Count the features of a layer of an OGR data source
+    :param target: OGR data source name
+    :param layer_name: Name of the layer; the only layer of single-layer
+    data sources (i.e. a CSV file) is counted whatever its name
+    :return: number of features, 0 if the data source or layer is missing
+    """
+    gdal = get_gdal()
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    try:
+        ds = gdal.OpenEx(target, gdal.OF_VECTOR)
+    except RuntimeError:
+        return 0
+    finally:
+        gdal.PopErrorHandler()
     try:
-        foo = ogr2ogr.main(args)
-        if not foo:
-            raise Exception(result.getvalue())
+        layer = ds.GetLayerByName(layer_name)
+        if layer is None and ds.GetLayerCount() == 1:
+            layer = ds.GetLayer(0)
+        return layer.GetFeatureCount() if layer is not None else 0
     finally:
-        if old_stdout:
-            sys.stdout = old_stdout
+        layer = ds = None
+
+
+def ogr2ogr_translate(source, layer_name, target, target_format, mode, sql,
+                      src_srs, dst_srs, skip_failures, options,
+                      progress_func, message_func):
+    """
+    Translate a vector data source with the Python port of ogr2ogr;
+    see ogr2ogr_load for the arguments
+    :return: tuple of features written and failed, None on failure
+    """
+    import ogr2ogr
+
+    args = ["", "-f", target_format]
+    if mode == "append":
+        args.append("-append")
+    elif mode == "overwrite":
+        args.append("-overwrite")
+    if skip_failures:
+        args.append("-skipfailures")
+    if sql:
+        args.extend(["-sql", sql])
+    if src_srs:
+        args.extend(["-s_srs", src_srs])
+    if dst_srs:
+        args.extend(["-t_srs", dst_srs])
+    if progress_func:
+        args.append("-progress")
+    args.extend(options)
+    args.extend([target, source, "-nln", layer_name])
+    counts = [0, 0]
+    if not ogr2ogr.main(args, progress_func, None, message_func, counts):
+        return None
+    return tuple(counts)
+
+
+class PostgresPool(object):
+    """
+    Thread-safe pool of connections to the GeoNode datastore database.
+    Callers block while all PG_POOL_MAX_SIZE connections are in use,
+    connections are checked before they are handed out, and any
+    uncommitted work is rolled back before a connection is returned
+    to the pool.
+    """
+    def __init__(self, minconn=PG_POOL_MIN_SIZE, maxconn=PG_POOL_MAX_SIZE,
+                 check_query=PG_POOL_CHECK_QUERY):
+        db = ogc_server_settings.datastore_db
+        conn_string = (
+            "dbname={dbname} user={dbuser} host={dbhost} "
+            "password={dbpass}".format(
+                dbname=db["NAME"], dbuser=db["USER"],
+                dbhost=db["HOST"], dbpass=db["PASSWORD"]
+            )
+        )
+        if db.get("PORT"):
+            conn_string += " port={}".format(db["PORT"])
+        import psycopg2.pool
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, conn_string)
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.check_query = check_query
+
+    def is_healthy(self, conn):
+        """
+        Check that a connection is open and not broken, and optionally
+        that it can run a query
+        :param conn: psycopg2 connection
+        :return: True or False
+        """
+        import psycopg2
+        from psycopg2 import extensions
+
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == \
+                extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if self.check_query:
+            try:
+                cur = conn.cursor()
+                try:
+                    cur.execute("SELECT 1")
+                finally:
+                    cur.close()
+                conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                return False
+        return True
+
+    def getconn(self):
+        """
+        Return a healthy connection, replacing broken ones
+        :return: psycopg2 connection
+        """
+        while True:
+            conn = self.pool.getconn()
+            if self.is_healthy(conn):
+                return conn
+            logger.warn("Discarding broken database connection")
+            self.pool.putconn(conn, close=True)
+
+    def putconn(self, conn):
+        """
+        Roll back any open transaction and return a connection to the pool
+        :param conn: psycopg2 connection
+        """
+        import psycopg2
+        from psycopg2 import extensions
+
+        close = bool(conn.closed)
+        if not close and conn.get_transaction_status() != \
+                extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        self.pool.putconn(conn, close=close)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a with block
+        """
+        self.slots.acquire()
+        try:
+            conn = self.getconn()
+            try:
+                yield conn
+            finally:
+                self.putconn(conn)
+        finally:
+            self.slots.release()
+
+
+_pg_pools = {}
+_pg_pool_lock = threading.Lock()
+
+
+def get_pg_pool():
+    """
+    Return the datastore connection pool of the current process (forked
+    Celery workers must not share connections with their parent).
+    :return: PostgresPool
+    """
+    pid = os.getpid()
+    pool = _pg_pools.get(pid)
+    if pool is None:
+        with _pg_pool_lock:
+            pool = _pg_pools.get(pid)
+            if pool is None:
+                pool = PostgresPool()
+                _pg_pools[pid] = pool
+    return pool
+
+
+@contextmanager
+def postgres_transaction():
+    """
+    Run several statements in a single transaction on a pooled connection.
+    The transaction is committed at the end of the with block, or rolled
+    back if an exception is raised:
+
+        with postgres_transaction() as cur:
+            cur.execute(...)
+            cur.execute(...)
+
+    :return: psycopg2 cursor
+    """
+    with get_pg_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
 
 
 def postgres_query(query, commit=False, returnable=False, params=None):
     """
-    Execute a PostgreSQL query
+    Execute a PostgreSQL query on a pooled connection
     :param query: Query string to execute
     :param commit: Whether or not to commit the query
     :param returnable: Whether or not to return results
     :return: Query result set or None
     """
-    db = ogc_server_settings.datastore_db
-    conn_string = (
-        "dbname={dbname} user={dbuser} host={dbhost} password={dbpass}".format(
-            dbname=db["NAME"], dbuser=db["USER"],
-            dbhost=db["HOST"], dbpass=db["PASSWORD"]
-        )
-    )
-    conn = psycopg2.connect(conn_string)
-    cur = conn.cursor()
-    try:
-        cur.execute(query, params)
-        if returnable:
-            return cur.fetchall()
-        if commit:
-            conn.commit()
-        return None
-    except Exception as e:
-        logger.error(traceback.format_exc())
-        logger.error(query)
-        logger.error(params)
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+    with get_pg_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(query, params)
+            rows = cur.fetchall() if returnable else None
+            if commit:
+                conn.commit()
+            return rows
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            logger.error(query)
+            logger.error(params)
+            raise e
+        finally:
+            cur.close()
+
+
+BulkLoadResult = namedtuple('BulkLoadResult', ['rows', 'inserted', 'updated'])
+
+
+def copy_value(value):
+    """
+    Format a value for PostgreSQL's COPY text format
+    :param value: Python value, None for NULL
+    :return: encoded string
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif isinstance(value, float):
+        # str() rounds floats to 12 significant digits on Python 2
+        value = repr(value)
+    elif not isinstance(value, str):
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+class CopyStream(object):
+    """
+    Read-only file-like object that serves an iterator of rows in COPY
+    text format, so rows never have to be held in memory all at once.
+    """
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+        self.count = 0
+
+    def read(self, size=-1):
+        lines = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            line = '\t'.join(copy_value(value) for value in row) + '\n'
+            lines.append(line)
+            length += len(line)
+            self.count += 1
+        data = ''.join(lines)
+        if size < 0:
+            self.buffer = ''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def quote_ident(name):
+    """
+    Quote a PostgreSQL identifier
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def bulk_upsert(table, columns, rows, key, update=True, cursor=None):
+    """
+    Load rows into a table in a single round-trip: rows are streamed
+    into a temporary staging table with COPY FROM STDIN, then merged
+    into the target table with INSERT ... ON CONFLICT (PostgreSQL 9.5+).
+    If a key value occurs more than once in `rows`, the last row wins.
+    :param table: Name of the target table (used as is)
+    :param columns: List of column names to load
+    :param rows: Iterator of row sequences, in the order of `columns`
+    :param key: Column name, or list of column names, of a unique
+    constraint or primary key of the target table
+    :param update: Update existing rows (True) or leave them as they are
+    :param cursor: Optional cursor of an open transaction, by default the
+    rows are loaded in a transaction of their own
+    :return: BulkLoadResult of rows read, inserted and updated
+    """
+    if cursor is None:
+        with postgres_transaction() as cursor:
+            return bulk_upsert(table, columns, rows, key, update, cursor)
+    keys = [key] if isinstance(key, basestring) else list(key)
+    cols = ','.join(quote_ident(column) for column in columns)
+    key_cols = ','.join(quote_ident(column) for column in keys)
+    staging = quote_ident('staging_' + re.sub(r'\W', '_', table))
+    updates = [column for column in columns if column not in keys]
+    if update and updates:
+        action = 'DO UPDATE SET ' + ','.join(
+            '{col} = EXCLUDED.{col}'.format(col=quote_ident(column))
+            for column in updates)
+    else:
+        action = 'DO NOTHING'
+
+    cursor.execute(
+        'CREATE TEMP TABLE {staging} ON COMMIT DROP AS '
+        'SELECT {cols} FROM {table} WITH NO DATA'.format(
+            staging=staging, cols=cols, table=table))
+    stream = CopyStream(rows)
+    cursor.copy_expert('COPY {} ({}) FROM STDIN'.format(staging, cols),
+                       stream, size=COPY_BUFFER_SIZE)
+    cursor.execute(
+        'WITH merged AS ('
+        ' INSERT INTO {table} ({cols})'
+        ' SELECT DISTINCT ON ({key_cols}) {cols} FROM {staging}'
+        ' ORDER BY {key_cols}, ctid DESC'
+        ' ON CONFLICT ({key_cols}) {action}'
+        ' RETURNING (xmax = 0) AS inserted)'
+        ' SELECT COALESCE(SUM(CASE WHEN inserted THEN 1 ELSE 0 END), 0),'
+        ' COALESCE(SUM(CASE WHEN inserted THEN 0 ELSE 1 END), 0)'
+        ' FROM merged'.format(table=table, cols=cols, key_cols=key_cols,
+                              staging=staging, action=action))
+    inserted, updated = cursor.fetchone()
+    cursor.execute('DROP TABLE {}'.format(staging))
+    result = BulkLoadResult(stream.count, int(inserted), int(updated))
+    logger.debug("Loaded {} into {}".format(result, table))
+    return result
 
 
 def purge_old_data(table, datefield, days):
@@ -215,71 +1265,246 @@ def table_exists(tablename):
 
 
 def layer_exists(layer_name, store, workspace):
-    _user, _password = ogc_server_settings.credentials
-    url = ogc_server_settings.rest
-    gs_catalog = Catalog(url, _user, _password)
-    try:
-        layer = gs_catalog.get_resource(layer_name, store=store,
-                                        workspace=workspace)
-        return layer is not None
-    except FailedRequestError:
-        return False
+    from geoserver.catalog import FailedRequestError
+
+    def lookup(gs_catalog):
+        try:
+            layer = gs_catalog.get_resource(layer_name, store=store,
+                                            workspace=workspace)
+            return layer is not None
+        except FailedRequestError:
+            return False
+    return gs_catalog_cache.exists(
+        ('resource', workspace, store, layer_name), lookup)
 
 
 def style_exists(style_name):
-    _user, _password = ogc_server_settings.credentials
-    url = ogc_server_settings.rest
-    gs_catalog = Catalog(url, _user, _password)
-    style = gs_catalog.get_style(style_name)
-    return style is not None
+    def lookup(gs_catalog):
+        style = gs_catalog.get_style(style_name)
+        return style is not None
+    return gs_catalog_cache.exists(('style', style_name), lookup)
+
+
+def store_exists(store, workspace):
+    from geoserver.catalog import FailedRequestError
+
+    def lookup(gs_catalog):
+        try:
+            return get_store(gs_catalog, store,
+                             workspace=workspace) is not None
+        except FailedRequestError:
+            return False
+    return gs_catalog_cache.exists(('store', workspace, store), lookup)
+
+
+VRT_SIMPLE_SOURCE = """<SimpleSource>
+  <SourceFilename relativeToVRT="0">{filename}</SourceFilename>
+  <SourceBand>{band}</SourceBand>
+  <SourceProperties RasterXSize="{xsize}" RasterYSize="{ysize}"
+   DataType="{datatype}" BlockXSize="{blockx}" BlockYSize="{blocky}"/>
+  <SrcRect xOff="0" yOff="0" xSize="{xsize}" ySize="{ysize}"/>
+  <DstRect xOff="0" yOff="0" xSize="{xsize}" ySize="{ysize}"/>
+</SimpleSource>"""
+
+
+def band_subset_vrt(src_ds, bands):
+    """
+    Create an in-memory virtual dataset that exposes only the specified
+    bands of a raster image.  No pixels are read until the virtual
+    dataset is, so copying it only reads the selected bands, block by
+    block.
+    :param src_ds: GDAL dataset of the input image
+    :param bands: list of bands in input image to expose
+    :return: GDAL VRT dataset
+    """
+    gdal = get_gdal()
+    vrt_ds = gdal.GetDriverByName("VRT").Create(
+        '', src_ds.RasterXSize, src_ds.RasterYSize, 0)
+    vrt_ds.SetGeoTransform(src_ds.GetGeoTransform())
+    vrt_ds.SetProjection(src_ds.GetProjection())
+    filename = escape(src_ds.GetDescription())
+    for idx, band_num in enumerate(bands):
+        src_band = src_ds.GetRasterBand(band_num)
+        vrt_ds.AddBand(src_band.DataType)
+        vrt_band = vrt_ds.GetRasterBand(idx + 1)
+        blockx, blocky = src_band.GetBlockSize()
+        vrt_band.SetMetadata({'source_0': VRT_SIMPLE_SOURCE.format(
+            filename=filename, band=band_num,
+            xsize=src_ds.RasterXSize, ysize=src_ds.RasterYSize,
+            datatype=gdal.GetDataTypeName(src_band.DataType),
+            blockx=blockx, blocky=blocky)}, 'vrt_sources')
+        nodata = src_band.GetNoDataValue()
+        if nodata is not None:
+            vrt_band.SetNoDataValue(nodata)
+    return vrt_ds
 
 
 def gdal_band_subset(infile, bands, dst_filename, dst_format="GTiff"):
     """
     Create a new raster image containing only the specified bands
-    from input image  **NOTE: numpy must be installed before GDAL to use
-    the ReadAsArray, WriteArray methods
+    from input image
     :param infile: inpur raster image
     :param bands: list of bands in input image to copy
     :param dst_filename: destination image filename
     :param dst_format: destination image format (default is GTiff)
     """
+    gdal = get_gdal()
     ds = gdal.Open(infile)
     driver = gdal.GetDriverByName(dst_format)
-    driver.Register()
-    band = bands[0]
-    out_ds = driver.Create(dst_filename, ds.RasterXSize,
-                           ds.RasterYSize, len(bands),
-                           ds.GetRasterBand(band).DataType)
-    out_ds.SetGeoTransform(ds.GetGeoTransform())
-
     try:
-        for idx, band_num in enumerate(bands):
-            inband = ds.GetRasterBand(band_num).ReadAsArray()
-            outBand = out_ds.GetRasterBand(idx+1)
-            outBand.WriteArray(inband)
-            inband = None
-            outBand = None
-
+        out_ds = driver.CreateCopy(dst_filename, band_subset_vrt(ds, bands))
     finally:
         # Properly close the datasets to flush to disk
-        band = None
-        inband = None
-        outBand = None
         ds = None
         out_ds = None
 
 
-def warp_image(infile, outfile, dst_crs="EPSG:3857", dst_driver='GTiff'):
+def warp_windows(width, height, count, dtype, memory_limit,
+                 block_size=WARP_BLOCK_SIZE):
+    """
+    Split a raster into full-width strips of whole tile rows, each
+    small enough for all of its bands to fit within the memory limit.
+    :param width: Raster width
+    :param height: Raster height
+    :param count: Number of bands
+    :param dtype: Numpy data type of the raster
+    :param memory_limit: Memory limit in MB
+    :param block_size: Tile height
+    :return: generator of ((row_start, row_stop), (col_start, col_stop))
+    """
+    import numpy
+
+    row_bytes = width * count * numpy.dtype(dtype).itemsize
+    rows = memory_limit * 1024 * 1024 // max(row_bytes, 1)
+    rows = max(block_size, rows // block_size * block_size)
+    for row in xrange(0, height, rows):
+        yield ((row, min(row + rows, height)), (0, width))
+
+
+def warp_index_key(src, dst_crs, resolution=None):
+    """
+    Return a key identifying the reprojection of a raster's grid
+    :param src: rasterio dataset
+    :param dst_crs: Output projection
+    :param resolution: Output resolution
+    :return: hex digest
+    """
+    crs = src.crs
+    if isinstance(crs, dict):
+        crs = sorted(crs.items())
+    return hashlib.sha1(repr((
+        src.width, src.height, tuple(src.affine)[:6], crs,
+        dst_crs, resolution)).encode('utf-8')).hexdigest()
+
+
+def build_warp_index(src, dst_crs, resolution=None):
+    """
+    Compute the destination transform of a nearest-neighbour reprojection
+    and an index map of the source pixel used for each destination pixel,
+    by reprojecting an image of (1-based) source pixel numbers.  Pixels
+    outside the source image are 0.
+    :param src: rasterio dataset
+    :param dst_crs: Output projection
+    :param resolution: Output resolution
+    :return: tuple of destination transform and index map
+    """
+    import numpy
+    from rasterio._warp import RESAMPLING
+    from rasterio.warp import calculate_default_transform, reproject
+
+    dst_transform, dst_width, dst_height = calculate_default_transform(
+        src.crs, dst_crs, src.width, src.height, *src.bounds,
+        resolution=resolution)
+    source = numpy.arange(1, src.width * src.height + 1,
+                          dtype=numpy.int32).reshape(src.height, src.width)
+    index = numpy.zeros((dst_height, dst_width), dtype=numpy.int32)
+    reproject(
+        source=source,
+        destination=index,
+        src_transform=src.affine,
+        src_crs=src.crs,
+        dst_transform=dst_transform,
+        dst_crs=dst_crs,
+        resampling=RESAMPLING.nearest,
+        num_threads=WARP_NUM_THREADS)
+    return dst_transform, index
+
+
+def get_warp_index(src, dst_crs, resolution=None,
+                   cache_dir=WARP_INDEX_CACHE_DIR):
+    """
+    Return the destination transform and index map of a reprojection,
+    from the cache directory if it was computed before for the same grid
+    :param src: rasterio dataset
+    :param dst_crs: Output projection
+    :param resolution: Output resolution
+    :param cache_dir: Directory of cached index maps
+    :return: tuple of destination transform and index map
+    """
+    import numpy
+    from affine import Affine
+
+    cache_file = os.path.join(cache_dir, '{}.npz'.format(
+        warp_index_key(src, dst_crs, resolution)))
+    if os.path.exists(cache_file):
+        try:
+            cached = numpy.load(cache_file)
+            try:
+                return Affine(*cached['transform']), cached['index']
+            finally:
+                cached.close()
+        except (IOError, KeyError, ValueError):
+            logger.warn("Ignoring corrupt warp index {}".format(cache_file))
+    dst_transform, index = build_warp_index(src, dst_crs, resolution)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            numpy.savez_compressed(
+                tmp_file, index=index,
+                transform=numpy.array(tuple(dst_transform)[:6]))
+        os.rename(tmp_path, cache_file)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return dst_transform, index
+
+
+def warp_image(infile, outfile, dst_crs="EPSG:3857", dst_driver='GTiff',
+               num_threads=WARP_NUM_THREADS, resampling=WARP_RESAMPLING,
+               memory_limit=WARP_MEMORY_LIMIT, windowed=False,
+               index_cache=None):
     """
     Use rasterio to warp an image from one projection to another
     :param infile: Origina raster image
     :param outfile: Warped raster image
     :param dst_crs: Output projection
     :param dst_driver: Output filetype driver
+    :param num_threads: Number of threads used by the GDAL warper
+    :param resampling: Name of the resampling method, i.e. 'nearest',
+    'bilinear', 'cubic'
+    :param memory_limit: Memory limit in MB
+    :param windowed: Reproject window by window into a tiled image,
+    so that memory use does not grow with the size of the image
+    :param index_cache: Directory of cached index maps; if specified,
+    nearest-neighbour reprojections of a grid that was reprojected before
+    are done with a precomputed source pixel index map
     :return: None
     """
-    with rasterio.drivers(CPL_DEBUG=False):
+    import numpy
+    import rasterio
+    from affine import Affine
+    from rasterio._warp import RESAMPLING
+    from rasterio.warp import calculate_default_transform, reproject
+
+    if index_cache and resampling == 'nearest' and not windowed:
+        return warp_image_indexed(infile, outfile, dst_crs, dst_driver,
+                                  index_cache)
+    resampling = getattr(RESAMPLING, resampling)
+    with rasterio.drivers(CPL_DEBUG=False,
+                          GDAL_CACHEMAX=str(memory_limit)):
         with rasterio.open(infile) as src:
             res = None
             dst_transform, dst_width, dst_height = calculate_default_transform(
@@ -294,18 +1519,86 @@ def warp_image(infile, outfile, dst_crs="EPSG:3857", dst_driver='GTiff'):
                 'height': dst_height,
                 'driver': dst_driver
             })
+            if windowed:
+                out_kwargs.update({
+                    'tiled': True,
+                    'blockxsize': WARP_BLOCK_SIZE,
+                    'blockysize': WARP_BLOCK_SIZE
+                })
 
+            with rasterio.open(outfile, 'w', **out_kwargs) as dst:
+                if not windowed:
+                    for i in range(1, src.count + 1):
+                        reproject(
+                            source=rasterio.band(src, i),
+                            destination=rasterio.band(dst, i),
+                            src_transform=src.affine,
+                            src_crs=src.crs,
+                            dst_transform=out_kwargs['transform'],
+                            dst_crs=out_kwargs['crs'],
+                            resampling=resampling,
+                            num_threads=num_threads)
+                    return
+                windows = warp_windows(dst_width, dst_height, src.count,
+                                       src.meta['dtype'], memory_limit)
+                for window in windows:
+                    (row_start, row_stop), (col_start, col_stop) = window
+                    window_transform = dst_transform * Affine.translation(
+                        col_start, row_start)
+                    for i in range(1, src.count + 1):
+                        data = numpy.empty(
+                            (row_stop - row_start, col_stop - col_start),
+                            dtype=src.meta['dtype'])
+                        data.fill(src.nodatavals[i - 1] or 0)
+                        reproject(
+                            source=rasterio.band(src, i),
+                            destination=data,
+                            src_transform=src.affine,
+                            src_crs=src.crs,
+                            dst_transform=window_transform,
+                            dst_crs=out_kwargs['crs'],
+                            resampling=resampling,
+                            num_threads=num_threads)
+                        dst.write_band(i, data, window=window)
+
+
+def warp_image_indexed(infile, outfile, dst_crs="EPSG:3857",
+                       dst_driver='GTiff', cache_dir=WARP_INDEX_CACHE_DIR):
+    """
+    Warp an image from one projection to another (nearest neighbour)
+    by looking up each output pixel in a cached source pixel index map
+    :param infile: Original raster image
+    :param outfile: Warped raster image
+    :param dst_crs: Output projection
+    :param dst_driver: Output filetype driver
+    :param cache_dir: Directory of cached index maps
+    :return: None
+    """
+    import numpy
+    import rasterio
+
+    with rasterio.drivers(CPL_DEBUG=False):
+        with rasterio.open(infile) as src:
+            dst_transform, index = get_warp_index(src, dst_crs,
+                                                  cache_dir=cache_dir)
+            out_kwargs = src.meta.copy()
+            out_kwargs.update({
+                'crs': dst_crs,
+                'transform': dst_transform,
+                'affine': dst_transform,
+                'width': index.shape[1],
+                'height': index.shape[0],
+                'driver': dst_driver
+            })
+            inside = index > 0
+            src_index = index[inside] - 1
             with rasterio.open(outfile, 'w', **out_kwargs) as dst:
                 for i in range(1, src.count + 1):
-                    reproject(
-                        source=rasterio.band(src, i),
-                        destination=rasterio.band(dst, i),
-                        src_transform=src.affine,
-                        src_crs=src.crs,
-                        dst_transform=out_kwargs['transform'],
-                        dst_crs=out_kwargs['crs'],
-                        resampling=RESAMPLING.nearest,
-                        num_threads=1)
+                    data = src.read_band(i).ravel()
+                    warped = numpy.empty(index.shape, dtype=data.dtype)
+                    warped.fill(src.nodatavals[i - 1] or 0)
+                    warped[inside] = data[src_index]
+                    dst.write_band(i, warped)
 
 
 def get_html(url=None):
@@ -319,6 +1612,64 @@ def get_html(url=None):
     return r.content
 
 
+class TokenBucket(object):
+    """
+    Thread-safe token bucket that allows bursts of up to capacity requests
+    and refills at rate tokens per second
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.timestamp) * self.rate)
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter(object):
+    """
+    Rate limit requests with a separate token bucket for each host
+    """
+    def __init__(self, rate, capacity=1):
+        """
+        :param rate: Requests per second per host, no limit if 0 or None
+        :param capacity: Maximum burst of requests per host
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        """
+        Wait until a request to the host is allowed
+        :param host: Host name
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity)
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+
 def asciier(txt):
     """
     Replace any non-ASCII characters
@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+
+import importlib
+import json
+import logging
+import re
+import socket
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+
+logger = logging.getLogger("dataqs.metrics")
+
+# List of sinks that stage timings are sent to, either dotted class paths
+# or (dotted class path, dict of keyword arguments) tuples, for example:
+# [('dataqs.metrics.StatsdSink', {'host': 'statsd.local', 'port': 8125}),
+#  ('dataqs.metrics.JSONFileSink', {'path': '/var/log/dataqs.json'})]
+DATAQS_METRICS_SINKS = getattr(settings, 'DATAQS_METRICS_SINKS',
+                               ['dataqs.metrics.LogSink'])
+
+
+class StageTiming(object):
+    """
+    Wall time, bytes and row counts of one stage of a processor run
+    """
+    def __init__(self, processor, stage):
+        self.processor = processor
+        self.stage = stage
+        self.bytes = 0
+        self.rows = 0
+        self.start = time.time()
+        self.elapsed = None
+        self.failed = False
+
+    def finish(self, failed=False):
+        self.elapsed = time.time() - self.start
+        self.failed = failed
+
+    def as_dict(self):
+        return {
+            'processor': self.processor,
+            'stage': self.stage,
+            'start': self.start,
+            'elapsed': self.elapsed,
+            'bytes': self.bytes,
+            'rows': self.rows,
+            'failed': self.failed
+        }
+
+
+class LogSink(object):
+    """
+    Write stage timings to a log as key=value lines
+    """
+    def __init__(self, logger_name="dataqs.metrics", level=logging.INFO):
+        self.logger = logging.getLogger(logger_name)
+        self.level = level
+
+    def emit(self, timing):
+        self.logger.log(
+            self.level,
+            "processor=%s stage=%s elapsed=%.3f bytes=%d rows=%d failed=%s",
+            timing.processor, timing.stage, timing.elapsed, timing.bytes,
+            timing.rows, timing.failed)
+
+
+class StatsdSink(object):
+    """
+    Send stage timings to a statsd server over UDP, as
+    <prefix>.<processor>.<stage>.time (ms), .bytes and .rows (counters)
+    """
+    def __init__(self, host='localhost', port=8125, prefix='dataqs'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def emit(self, timing):
+        name = '.'.join(re.sub(r'[^\w-]', '_', part) for part in (
+            self.prefix, timing.processor, timing.stage))
+        lines = ['{}.time:{}|ms'.format(name, int(timing.elapsed * 1000))]
+        if timing.bytes:
+            lines.append('{}.bytes:{}|c'.format(name, timing.bytes))
+        if timing.rows:
+            lines.append('{}.rows:{}|c'.format(name, timing.rows))
+        if timing.failed:
+            lines.append('{}.failed:1|c'.format(name))
+        self.socket.sendto('\n'.join(lines).encode('utf-8'), self.address)
+
+
+class JSONFileSink(object):
+    """
+    Append stage timings to a file, one JSON document per line
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, timing):
+        with self._lock:
+            with open(self.path, 'a') as json_file:
+                json_file.write(json.dumps(timing.as_dict()) + '\n')
+
+
+def load_sink(config):
+    """
+    Instantiate a sink from a dotted class path, or a tuple of
+    (dotted class path, dict of keyword arguments)
+    """
+    if isinstance(config, (list, tuple)):
+        path, kwargs = config
+    else:
+        path, kwargs = config, {}
+    module_name, class_name = path.rsplit('.', 1)
+    sink_class = getattr(importlib.import_module(module_name), class_name)
+    return sink_class(**kwargs)
+
+
+_sinks = None
+_sinks_lock = threading.Lock()
+
+
+def get_sinks():
+    """
+    Return the sinks configured by the DATAQS_METRICS_SINKS setting
+    """
+    global _sinks
+    if _sinks is None:
+        with _sinks_lock:
+            if _sinks is None:
+                _sinks = [load_sink(config) for config in DATAQS_METRICS_SINKS]
+    return _sinks
+
+
+def emit(timing):
+    """
+    Send a stage timing to all configured sinks.  Sink errors are logged,
+    never raised, so that metrics can not break a processor run.
+    """
+    for sink in get_sinks():
+        try:
+            sink.emit(timing)
+        except Exception:
+            logger.exception("Could not emit metrics to {}".format(sink))
+
+
+def instrumented(stage):
+    """
+    Decorator that times a processor method as the given stage
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.stage(stage):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -7,8 +7,9 @@ import datetime
 import re
 import shutil
 from django.conf import settings
+from dataqs.metrics import instrumented
 from dataqs.processor_base import GeoDataMosaicProcessor
-from dataqs.helpers import gdal_translate, style_exists
+from dataqs.helpers import gdal_translate, make_cog, style_exists
 
 logger = logging.getLogger("dataqs.processors")
 script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -41,12 +42,14 @@ class GPMProcessor(GeoDataMosaicProcessor):
         re_1day = re.compile(pattern)
         files = sorted([x for x in file_list if re_1day.search(x)])[-days:]
         for file_1day in files:
-            with open(os.path.join(self.tmp_dir, file_1day), 'wb') as outfile:
+            with self.intermediate(file_1day) as outfile:
                 ftp.retrbinary('RETR %s' % file_1day, outfile.write)
 
+            # The world file has to be stored next to the image
             tfw_file = file_1day.replace('.tif', '.tfw')
-            with open(os.path.join(self.tmp_dir, tfw_file), 'wb') as outfile:
-                ftp.retrbinary('RETR %s' % tfw_file, outfile.write)
+            with self.intermediate(tfw_file,
+                                   in_memory=outfile.in_memory) as tfwfile:
+                ftp.retrbinary('RETR %s' % tfw_file, tfwfile.write)
         return files
 
     def parse_name(self, tifname):
@@ -59,6 +62,7 @@ class GPMProcessor(GeoDataMosaicProcessor):
             name_subs.group(2), imgstrtime)
         return layer_title, imgtime
 
+    @instrumented('convert')
     def convert(self, tif_file):
         layer_title, imgtime = self.parse_name(tif_file)
         time_format = imgtime.strftime('%Y%m%dT%H0000000Z')
@@ -66,9 +70,10 @@ class GPMProcessor(GeoDataMosaicProcessor):
             prefix=self.layer_name,
             time=time_format)
         # Use gdal_translate to embed projection info
-        gdal_translate(os.path.join(self.tmp_dir, tif_file),
+        gdal_translate(self.intermediate_path(tif_file),
                        os.path.join(self.tmp_dir, tif_out),
                        nodata=0, projection="EPSG:4326")
+        make_cog(os.path.join(self.tmp_dir, tif_out))
 
         return tif_out
 
@@ -87,8 +92,8 @@ class GPMProcessor(GeoDataMosaicProcessor):
                 self.post_geoserver(dst_file, self.layer_name)
 
         layer_title, imgtime = self.parse_name(tifs[-1])
-        self.drop_old_hourly_images(imgtime, self.layer_name)
-        self.drop_old_daily_images(imgtime, self.layer_name)
+        removed = self.drop_old_hourly_images(imgtime, self.layer_name)
+        removed += self.drop_old_daily_images(imgtime, self.layer_name)
         if not style_exists(self.layer_name):
             with open(os.path.join(script_dir, 'resources/gpm.sld')) as sld:
                 self.set_default_style(self.layer_name,
@@ -96,8 +101,12 @@ class GPMProcessor(GeoDataMosaicProcessor):
         self.update_geonode(self.layer_name, title=layer_title,
                             store=self.layer_name,
                             bounds=('-180.0', '180.0', '-90.0', '90.0',
-                                    'EPSG:4326'))
-        self.truncate_gs_cache(self.layer_name)
+                                    'EPSG:4326'),
+                            time_extent=self.get_time_extent(imgtime))
+        times = [self.parse_name(tif)[1].strftime(self.gwc_time_format)
+                 for tif in tifs]
+        self.truncate_gs_cache(self.layer_name, times=times + removed)
+        self.seed_gs_cache(self.layer_name, times=times)
         self.cleanup()
 
 
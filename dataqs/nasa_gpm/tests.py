@@ -3,6 +3,7 @@ import zipfile
 import os
 import datetime
 from django.test import TestCase
+from osgeo import gdal
 from dataqs.nasa_gpm.nasa_gpm import GPMProcessor
 from mock import patch
 
@@ -60,12 +61,13 @@ class NasaGpmTest(TestCase):
     @patch('ftplib.FTP.cwd', mock_none)
     def test_download(self, mock_ftp):
         """
-        Verify that files are downloaded.
+        Verify that files are downloaded (into memory).
         """
         today = datetime.datetime.utcnow()
         imgfile = self.processor.download()[0]
-        self.assertTrue(os.path.exists(os.path.join(
-            self.processor.tmp_dir, imgfile)))
+        img_path = self.processor.intermediate_path(imgfile)
+        self.assertTrue(img_path.startswith('/vsimem/'))
+        self.assertIsNotNone(gdal.VSIStatL(img_path))
         self.assertTrue('3B-HHR-E.MS.MRG.3IMERG.{}'.format(
             datetime.datetime.strftime(today, '%Y%m%d')) in imgfile)
 
@@ -108,8 +110,29 @@ class NasaGpmTest(TestCase):
         """
         dl_tif = self.processor.download()[0]
         self.processor.convert(dl_tif)
-        self.assertNotEqual([], glob.glob(os.path.join(
-            self.processor.tmp_dir, self.processor.prefix + '*')))
+        img_path = self.processor.intermediate_path(dl_tif)
         self.processor.cleanup()
+        self.assertIsNone(gdal.VSIStatL(img_path))
         self.assertEquals([], glob.glob(os.path.join(
             self.processor.tmp_dir, self.processor.prefix + '*')))
+
+    @patch('ftplib.FTP', autospec=True)
+    @patch('ftplib.FTP.retrbinary', mock_retrbinary)
+    @patch('ftplib.FTP.nlst', mock_nlst)
+    @patch('ftplib.FTP.connect', mock_none)
+    @patch('ftplib.FTP.login', mock_none)
+    @patch('ftplib.FTP.cwd', mock_none)
+    @patch('dataqs.processor_base.INTERMEDIATE_MEMORY_LIMIT', 1024)
+    def test_spill_to_disk(self, mock_ftp):
+        """
+        Images larger than the memory limit should be written to disk,
+        along with their world files
+        """
+        dl_tif = self.processor.download()[0]
+        tfw_file = dl_tif.replace('.tif', '.tfw')
+        for filename in (dl_tif, tfw_file):
+            self.assertEquals(os.path.join(self.processor.tmp_dir, filename),
+                              self.processor.intermediate_path(filename))
+        convert_tif = self.processor.convert(dl_tif)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.processor.tmp_dir, convert_tif)))
@@ -38,6 +38,7 @@
 import sys
 import os
 import stat
+import threading
 
 try:
     from osgeo import gdal
@@ -50,6 +51,18 @@ except:
 
 ###############################################################################
 
+# Per-thread message handler, set by main(message_func=...)
+_local = threading.local()
+
+def Message(msg):
+    message_func = getattr(_local, 'message_func', None)
+    if message_func is None:
+        print(msg)
+    else:
+        message_func(msg)
+
+###############################################################################
+
 class ScaledProgressObject:
     def __init__(self, min, max, cbk, cbk_data = None):
         self.min = min
@@ -123,10 +136,21 @@ class AssociatedLayers:
 #/*                                main()                                */
 #/************************************************************************/
 
-bSkipFailures = False
-nGroupTransactions = 200
-bPreserveFID = False
-nFIDToFetch = ogr.NullFID
+# Options and feature counts of the translation running in each thread,
+# so that several translations can run at the same time
+class TranslateOptions(threading.local):
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self.bSkipFailures = False
+        self.nGroupTransactions = 200
+        self.bPreserveFID = False
+        self.nFIDToFetch = ogr.NullFID
+        self.nFeaturesWritten = 0
+        self.nFeaturesFailed = 0
+
+psOptions = TranslateOptions()
 
 class Enum(set):
     def __getattr__(self, name):
@@ -136,12 +160,22 @@ class Enum(set):
 
 GeomOperation = Enum(["NONE", "SEGMENTIZE", "SIMPLIFY_PRESERVE_TOPOLOGY"])
 
-def main(args = None, progress_func = TermProgress, progress_data = None):
+def main(args = None, progress_func = TermProgress, progress_data = None, \
+         message_func = None, pnFeatureCounts = None):
 
-    global bSkipFailures
-    global nGroupTransactions
-    global bPreserveFID
-    global nFIDToFetch
+    # Reset options that a previous translation in this thread may have set
+    psOptions.Reset()
+    _local.message_func = message_func
+    try:
+        return _main(args, progress_func, progress_data)
+    finally:
+        _local.message_func = None
+        # Number of features written and failed
+        if pnFeatureCounts is not None:
+            pnFeatureCounts[0] = psOptions.nFeaturesWritten
+            pnFeatureCounts[1] = psOptions.nFeaturesFailed
+
+def _main(args = None, progress_func = TermProgress, progress_data = None):
 
     pszFormat = "ESRI Shapefile"
     pszDataSource = None
@@ -219,11 +253,11 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
             papszLCO.append(args[iArg] )
 
         elif EQUAL(args[iArg],"-preserve_fid"):
-            bPreserveFID = True
+            psOptions.bPreserveFID = True
 
         elif len(args[iArg]) >= 5 and EQUAL(args[iArg][0:5], "-skip"):
-            bSkipFailures = True
-            nGroupTransactions = 1 # /* #2409 */
+            psOptions.bSkipFailures = True
+            psOptions.nGroupTransactions = 1 # /* #2409 */
 
         elif EQUAL(args[iArg],"-append"):
             bAppend = True
@@ -238,7 +272,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 
         elif EQUAL(args[iArg],"-fid") and iArg < nArgc-1:
             iArg = iArg + 1
-            nFIDToFetch = int(args[iArg])
+            psOptions.nFIDToFetch = int(args[iArg])
 
         elif EQUAL(args[iArg],"-sql") and iArg < nArgc-1:
             iArg = iArg + 1
@@ -287,7 +321,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
             elif EQUAL(args[iArg+1],"MULTIPOLYGON25D"):
                 eGType = ogr.wkbMultiPolygon25D
             else:
-                print("-nlt %s: type not recognised." % args[iArg+1])
+                Message("-nlt %s: type not recognised." % args[iArg+1])
                 return False
 
             iArg = iArg + 1
@@ -296,14 +330,14 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 
             nCoordDim = int(args[iArg+1])
             if nCoordDim != 2 and nCoordDim != 3:
-                print("-dim %s: value not handled." % args[iArg+1])
+                Message("-dim %s: value not handled." % args[iArg+1])
                 return False
             iArg = iArg + 1
 
         elif (EQUAL(args[iArg],"-tg") or \
                 EQUAL(args[iArg],"-gt")) and iArg < nArgc-1:
             iArg = iArg + 1
-            nGroupTransactions = int(args[iArg])
+            psOptions.nGroupTransactions = int(args[iArg])
 
         elif EQUAL(args[iArg],"-s_srs") and iArg < nArgc-1:
             iArg = iArg + 1
@@ -386,7 +420,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                     break
 
                 else:
-                    print("Unhandled type for fieldtypeasstring option : %s " % token)
+                    Message("Unhandled type for fieldtypeasstring option : %s " % token)
                     return Usage()
 
         elif EQUAL(args[iArg],"-progress"):
@@ -417,7 +451,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                   (len(args[iArg+1]) >= 12 and EQUAL(args[iArg+1][0:12],"MULTIPOLYGON") ) :
                 poClipSrc = ogr.CreateGeometryFromWkt(args[iArg+1])
                 if poClipSrc is None:
-                    print("FAILURE: Invalid geometry. Must be a valid POLYGON or MULTIPOLYGON WKT\n")
+                    Message("FAILURE: Invalid geometry. Must be a valid POLYGON or MULTIPOLYGON WKT\n")
                     return Usage()
 
                 iArg = iArg + 1
@@ -460,7 +494,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                   (len(args[iArg+1]) >= 12 and EQUAL(args[iArg+1][0:12],"MULTIPOLYGON") ) :
                 poClipDst = ogr.CreateGeometryFromWkt(args[iArg+1])
                 if poClipDst is None:
-                    print("FAILURE: Invalid geometry. Must be a valid POLYGON or MULTIPOLYGON WKT\n")
+                    Message("FAILURE: Invalid geometry. Must be a valid POLYGON or MULTIPOLYGON WKT\n")
                     return Usage()
 
                 iArg = iArg + 1
@@ -506,28 +540,28 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
     if pszDataSource is None:
         return Usage()
 
-    if bPreserveFID and bExplodeCollections:
-        print("FAILURE: cannot use -preserve_fid and -explodecollections at the same time\n\n")
+    if psOptions.bPreserveFID and bExplodeCollections:
+        Message("FAILURE: cannot use -preserve_fid and -explodecollections at the same time\n\n")
         return Usage()
 
     if bClipSrc and pszClipSrcDS is not None:
         poClipSrc = LoadGeometry(pszClipSrcDS, pszClipSrcSQL, pszClipSrcLayer, pszClipSrcWhere)
         if poClipSrc is None:
-            print("FAILURE: cannot load source clip geometry\n" )
+            Message("FAILURE: cannot load source clip geometry\n" )
             return Usage()
 
     elif bClipSrc and poClipSrc is None:
         if poSpatialFilter is not None:
             poClipSrc = poSpatialFilter.Clone()
         if poClipSrc is None:
-            print("FAILURE: -clipsrc must be used with -spat option or a\n" + \
+            Message("FAILURE: -clipsrc must be used with -spat option or a\n" + \
                   "bounding box, WKT string or datasource must be specified\n")
             return Usage()
 
     if pszClipDstDS is not None:
         poClipDst = LoadGeometry(pszClipDstDS, pszClipDstSQL, pszClipDstLayer, pszClipDstWhere)
         if poClipDst is None:
-            print("FAILURE: cannot load dest clip geometry\n" )
+            Message("FAILURE: cannot load dest clip geometry\n" )
             return Usage()
 
 #/* -------------------------------------------------------------------- */
@@ -539,11 +573,11 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 #/*      Report failure                                                  */
 #/* -------------------------------------------------------------------- */
     if poDS is None:
-        print("FAILURE:\n" + \
+        Message("FAILURE:\n" + \
                 "Unable to open datasource `%s' with the following drivers." % pszDataSource)
 
         for iDriver in range(ogr.GetDriverCount()):
-            print("  ->  " + ogr.GetDriver(iDriver).GetName() )
+            Message("  ->  " + ogr.GetDriver(iDriver).GetName() )
 
         return False
 
@@ -567,12 +601,12 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                     poODS = None
 
             if bUpdate:
-                print("FAILURE:\n" +
+                Message("FAILURE:\n" +
                         "Unable to open existing output datasource `%s'." % pszDestDataSource)
                 return False
 
         elif len(papszDSCO) > 0:
-            print("WARNING: Datasource creation options ignored since an existing datasource\n" + \
+            Message("WARNING: Datasource creation options ignored since an existing datasource\n" + \
                     "         being updated." )
 
         if poODS is not None:
@@ -584,16 +618,16 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
     if not bUpdate:
         poDriver = ogr.GetDriverByName(pszFormat)
         if poDriver is None:
-            print("Unable to find driver `%s'." % pszFormat)
-            print( "The following drivers are available:" )
+            Message("Unable to find driver `%s'." % pszFormat)
+            Message( "The following drivers are available:" )
 
             for iDriver in range(ogr.GetDriverCount()):
-                print("  ->  %s" % ogr.GetDriver(iDriver).GetName() )
+                Message("  ->  %s" % ogr.GetDriver(iDriver).GetName() )
 
             return False
 
         if poDriver.TestCapability( ogr.ODrCCreateDataSource ) == False:
-            print( "%s driver does not support data source creation." % pszFormat)
+            Message( "%s driver does not support data source creation." % pszFormat)
             return False
 
 #/* -------------------------------------------------------------------- */
@@ -619,7 +653,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                     # this syntax is only supported by Python >= 2.6
                     os.mkdir(pszDestDataSource, 493)
                 except:
-                    print("Failed to create directory %s\n"
+                    Message("Failed to create directory %s\n"
                           "for shapefile datastore.\n" % pszDestDataSource )
                     return False
 
@@ -628,7 +662,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 #/* -------------------------------------------------------------------- */
         poODS = poDriver.CreateDataSource( pszDestDataSource, options = papszDSCO )
         if poODS is None:
-            print( "%s driver failed to create %s" % (pszFormat, pszDestDataSource ))
+            Message( "%s driver failed to create %s" % (pszFormat, pszDestDataSource ))
             return False
 
 #/* -------------------------------------------------------------------- */
@@ -637,7 +671,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
     if pszOutputSRSDef is not None:
         poOutputSRS = osr.SpatialReference()
         if poOutputSRS.SetFromUserInput( pszOutputSRSDef ) != 0:
-            print( "Failed to process SRS definition: %s" % pszOutputSRSDef )
+            Message( "Failed to process SRS definition: %s" % pszOutputSRSDef )
             return False
 
 #/* -------------------------------------------------------------------- */
@@ -646,7 +680,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
     if pszSourceSRSDef is not None:
         poSourceSRS = osr.SpatialReference()
         if poSourceSRS.SetFromUserInput( pszSourceSRSDef ) != 0:
-            print( "Failed to process SRS definition: %s" % pszSourceSRSDef )
+            Message( "Failed to process SRS definition: %s" % pszSourceSRSDef )
             return False
 
 #/* -------------------------------------------------------------------- */
@@ -665,9 +699,9 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 #/* -------------------------------------------------------------------- */
     if pszSQLStatement is not None:
         if pszWHERE is not None:
-            print( "-where clause ignored in combination with -sql." )
+            Message( "-where clause ignored in combination with -sql." )
         if len(papszLayers) > 0:
-            print( "layer names ignored in combination with -sql." )
+            Message( "layer names ignored in combination with -sql." )
 
         poResultSet = poDS.ExecuteSQL( pszSQLStatement, poSpatialFilter, \
                                         None )
@@ -680,7 +714,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                     pProgressArg = progress_data
 
                 elif not poResultSet.TestCapability(ogr.OLCFastFeatureCount):
-                    print( "Progress turned off as fast feature count is not available.")
+                    Message( "Progress turned off as fast feature count is not available.")
                     bDisplayProgress = False
 
                 else:
@@ -731,7 +765,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                                 bExplodeCollections, \
                                 nSrcFileSize, None, \
                                 pfnProgress, pProgressArg ):
-                print(
+                Message(
                         "Terminating translation prematurely after failed\n" + \
                         "translation from sql statement." )
 
@@ -783,7 +817,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
             for iLayer in range(nSrcLayerCount):
                 poLayer = poDS.GetLayer(iLayer)
                 if poLayer is None:
-                    print("FAILURE: Couldn't fetch advertised layer %d!" % iLayer)
+                    Message("FAILURE: Couldn't fetch advertised layer %d!" % iLayer)
                     return False
 
                 papszLayers[iLayer] = poLayer.GetName()
@@ -803,7 +837,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
         for iLayer in range(nSrcLayerCount):
             poLayer = poDS.GetLayer(iLayer)
             if poLayer is None:
-                print("FAILURE: Couldn't fetch advertised layer %d!" % iLayer)
+                Message("FAILURE: Couldn't fetch advertised layer %d!" % iLayer)
                 return False
 
             pasAssocLayers[iLayer].poSrcLayer = poLayer
@@ -811,8 +845,8 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
             if CSLFindString(papszLayers, poLayer.GetName()) >= 0:
                 if pszWHERE is not None:
                     if poLayer.SetAttributeFilter( pszWHERE ) != 0:
-                        print("FAILURE: SetAttributeFilter(%s) on layer '%s' failed.\n" % (pszWHERE, poLayer.GetName()) )
-                        if not bSkipFailures:
+                        Message("FAILURE: SetAttributeFilter(%s) on layer '%s' failed.\n" % (pszWHERE, poLayer.GetName()) )
+                        if not psOptions.bSkipFailures:
                             return False
 
                 if poSpatialFilter is not None:
@@ -835,7 +869,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                                            pszZField, \
                                            pszWHERE )
 
-                if psInfo is None and not bSkipFailures:
+                if psInfo is None and not psOptions.bSkipFailures:
                     return False
 
                 pasAssocLayers[iLayer].psInfo = psInfo
@@ -865,8 +899,8 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                                         nSrcFileSize,  \
                                         anReadFeatureCount, \
                                         pfnProgress, pProgressArg ) \
-                        and not bSkipFailures:
-                        print(
+                        and not psOptions.bSkipFailures:
+                        Message(
                                 "Terminating translation prematurely after failed\n" + \
                                 "translation of layer " + poLayer.GetName() + " (use -skipfailures to skip errors)")
 
@@ -899,7 +933,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                 poLayer = poDS.GetLayer(iLayer)
 
                 if poLayer is None:
-                    print("FAILURE: Couldn't fetch advertised layer %d!" % iLayer)
+                    Message("FAILURE: Couldn't fetch advertised layer %d!" % iLayer)
                     return False
 
                 papoLayers[iLayer] = poLayer
@@ -917,7 +951,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                 poLayer = poDS.GetLayerByName(layername)
 
                 if poLayer is None:
-                    print("FAILURE: Couldn't fetch advertised layer %s!" % layername)
+                    Message("FAILURE: Couldn't fetch advertised layer %s!" % layername)
                     return False
 
                 papoLayers[iLayer] = poLayer
@@ -933,8 +967,8 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 
             if pszWHERE is not None:
                 if poLayer.SetAttributeFilter( pszWHERE ) != 0:
-                    print("FAILURE: SetAttributeFilter(%s) failed." % pszWHERE)
-                    if not bSkipFailures:
+                    Message("FAILURE: SetAttributeFilter(%s) failed." % pszWHERE)
+                    if not psOptions.bSkipFailures:
                         return False
 
             if poSpatialFilter is not None:
@@ -942,7 +976,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 
             if bDisplayProgress and not bSrcIsOSM:
                 if not poLayer.TestCapability(ogr.OLCFastFeatureCount):
-                    print("Progress turned off as fast feature count is not available.")
+                    Message("Progress turned off as fast feature count is not available.")
                     bDisplayProgress = False
                 else:
                     panLayerCountFeatures[iLayer] = poLayer.GetFeatureCount()
@@ -1009,8 +1043,8 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
                                     bExplodeCollections, \
                                     nSrcFileSize, None, \
                                     pfnProgress, pProgressArg )) \
-                and not bSkipFailures:
-                print(
+                and not psOptions.bSkipFailures:
+                Message(
                         "Terminating translation prematurely after failed\n" + \
                         "translation of layer " + poLayer.GetLayerDefn().GetName() + " (use -skipfailures to skip errors)")
 
@@ -1032,7 +1066,7 @@ def main(args = None, progress_func = TermProgress, progress_data = None):
 
 def Usage():
 
-    print( "Usage: ogr2ogr [--help-general] [-skipfailures] [-append] [-update] [-gt n]\n" + \
+    Message( "Usage: ogr2ogr [--help-general] [-skipfailures] [-append] [-update] [-gt n]\n" + \
             "               [-select field_list] [-where restricted_where] \n" + \
             "               [-progress] [-sql <sql statement>] \n" + \
             "               [-spat xmin ymin xmax ymax] [-preserve_fid] [-fid FID]\n" + \
@@ -1050,9 +1084,9 @@ def Usage():
         poDriver = ogr.GetDriver(iDriver)
 
         if poDriver.TestCapability( ogr.ODrCCreateDataSource ):
-            print( "     -f \"" + poDriver.GetName() + "\"" )
+            Message( "     -f \"" + poDriver.GetName() + "\"" )
 
-    print( " -append: Append to existing layer instead of creating new if it exists\n" + \
+    Message( " -append: Append to existing layer instead of creating new if it exists\n" + \
             " -overwrite: delete the output layer and recreate it empty\n" + \
             " -update: Open existing output datasource in update mode\n" + \
             " -progress: Display progress on terminal. Only works if input layers have the \"fast feature count\" capability\n" + \
@@ -1079,7 +1113,7 @@ def Usage():
             "      Integer, Real, String, Date, Time, DateTime, Binary, IntegerList, RealList,\n" + \
             "      StringList. Special value All can be used to convert all fields to strings.")
 
-    print(" -a_srs srs_def: Assign an output SRS\n" + \
+    Message(" -a_srs srs_def: Assign an output SRS\n" + \
         " -t_srs srs_def: Reproject/transform to this SRS on output\n" + \
         " -s_srs srs_def: Override source SRS\n" + \
         "\n" + \
@@ -1119,7 +1153,7 @@ def LoadGeometry( pszDS, pszSQL, pszLyr, pszWhere):
         poLyr = poDS.GetLayer(0)
 
     if poLyr is None:
-        print("Failed to identify source layer from datasource.")
+        Message("Failed to identify source layer from datasource.")
         poDS.Destroy()
         return None
 
@@ -1142,7 +1176,7 @@ def LoadGeometry( pszDS, pszSQL, pszLyr, pszWhere):
                     poGeom.AddGeometry(poSrcGeom.GetGeometryRef(iGeom) )
 
             else:
-                print("ERROR: Geometry not of polygon type." )
+                Message("ERROR: Geometry not of polygon type." )
                 if pszSQL is not None:
                     poDS.ReleaseResultSet( poLyr )
                 poDS.Destroy()
@@ -1209,7 +1243,7 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
             poSourceSRS = poSrcLayer.GetSpatialRef()
 
         if poSourceSRS is None:
-            print("Can't transform coordinates, source layer has no\n" + \
+            Message("Can't transform coordinates, source layer has no\n" + \
                     "coordinate system.  Use -s_srs to set one." )
             return None
 
@@ -1220,16 +1254,16 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
         if poCT is None:
             pszWKT = None
 
-            print("Failed to create coordinate transformation between the\n" + \
+            Message("Failed to create coordinate transformation between the\n" + \
                 "following coordinate systems.  This may be because they\n" + \
                 "are not transformable, or because projection services\n" + \
                 "(PROJ.4 DLL/.so) could not be loaded." )
 
             pszWKT = poSourceSRS.ExportToPrettyWkt( 0 )
-            print( "Source:\n" + pszWKT )
+            Message( "Source:\n" + pszWKT )
 
             pszWKT = poOutputSRS.ExportToPrettyWkt( 0 )
-            print( "Target:\n" + pszWKT )
+            Message( "Target:\n" + pszWKT )
             return None
 
 #/* -------------------------------------------------------------------- */
@@ -1275,7 +1309,7 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
 #/* -------------------------------------------------------------------- */
     if poDstLayer is not None and bOverwrite:
         if poDstDS.DeleteLayer( iLayer ) != 0:
-            print("DeleteLayer() failed when overwrite requested." )
+            Message("DeleteLayer() failed when overwrite requested." )
             return None
 
         poDstLayer = None
@@ -1313,7 +1347,7 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
             eGType = eGType | ogr.wkb25DBit
 
         if poDstDS.TestCapability( ogr.ODsCCreateLayer ) == False:
-            print("Layer " + pszNewLayerName + "not found, and CreateLayer not supported by driver.")
+            Message("Layer " + pszNewLayerName + "not found, and CreateLayer not supported by driver.")
             return None
 
         gdal.ErrorReset()
@@ -1330,12 +1364,12 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
 #/*      Otherwise we will append to it, if append was requested.        */
 #/* -------------------------------------------------------------------- */
     elif not bAppend:
-        print("FAILED: Layer " + pszNewLayerName + "already exists, and -append not specified.\n" + \
+        Message("FAILED: Layer " + pszNewLayerName + "already exists, and -append not specified.\n" + \
                             "        Consider using -append, or -overwrite.")
         return None
     else:
         if len(papszLCO) > 0:
-            print("WARNING: Layer creation options ignored since an existing layer is\n" + \
+            Message("WARNING: Layer creation options ignored since an existing layer is\n" + \
                     "         being appended to." )
 
 #/* -------------------------------------------------------------------- */
@@ -1388,14 +1422,14 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
                     #/* Sanity check : if it fails, the driver is buggy */
                     if poDstFDefn is not None and \
                         poDstFDefn.GetFieldCount() != nDstFieldCount + 1:
-                        print("The output driver has claimed to have added the %s field, but it did not!" %  oFieldDefn.GetNameRef() )
+                        Message("The output driver has claimed to have added the %s field, but it did not!" %  oFieldDefn.GetNameRef() )
                     else:
                         panMap[iSrcField] = nDstFieldCount
                         nDstFieldCount = nDstFieldCount + 1
 
             else:
-                print("Field '" + papszSelFields[iField] + "' not found in source layer.")
-                if not bSkipFailures:
+                Message("Field '" + papszSelFields[iField] + "' not found in source layer.")
+                if not psOptions.bSkipFailures:
                     return None
 
         #/* -------------------------------------------------------------------- */
@@ -1459,7 +1493,7 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
                 #/* Sanity check : if it fails, the driver is buggy */
                 if poDstFDefn is not None and \
                     poDstFDefn.GetFieldCount() != nDstFieldCount + 1:
-                    print("The output driver has claimed to have added the %s field, but it did not!" %  oFieldDefn.GetNameRef() )
+                    Message("The output driver has claimed to have added the %s field, but it did not!" %  oFieldDefn.GetNameRef() )
                 else:
                     panMap[iField] = nDstFieldCount
                     nDstFieldCount = nDstFieldCount + 1
@@ -1468,7 +1502,7 @@ def SetupTargetLayer( poSrcDS, poSrcLayer, poDstDS, papszLCO, pszNewLayerName, \
         #/* For an existing layer, build the map by fetching the index in the destination */
         #/* layer for each source field */
         if poDstFDefn is None:
-            print( "poDstFDefn == NULL.\n" )
+            Message( "poDstFDefn == NULL.\n" )
             return None
 
         for iField in range(nSrcFieldCount):
@@ -1527,17 +1561,17 @@ def TranslateLayer( psInfo, poSrcDS, poSrcLayer, poDstDS,  \
     nFeaturesInTransaction = 0
     nCount = 0
 
-    if nGroupTransactions > 0:
+    if psOptions.nGroupTransactions > 0:
         poDstLayer.StartTransaction()
 
     while True:
         poDstFeature = None
 
-        if nFIDToFetch != ogr.NullFID:
+        if psOptions.nFIDToFetch != ogr.NullFID:
 
             #// Only fetch feature on first pass.
             if nFeaturesInTransaction == 0:
-                poFeature = poSrcLayer.GetFeature(nFIDToFetch)
+                poFeature = poSrcLayer.GetFeature(psOptions.nFIDToFetch)
             else:
                 poFeature = None
 
@@ -1564,7 +1598,7 @@ def TranslateLayer( psInfo, poSrcDS, poSrcLayer, poDstDS,  \
 
         for iPart in range(nIters):
             nFeaturesInTransaction = nFeaturesInTransaction + 1
-            if nFeaturesInTransaction == nGroupTransactions:
+            if nFeaturesInTransaction == psOptions.nGroupTransactions:
                 poDstLayer.CommitTransaction()
                 poDstLayer.StartTransaction()
                 nFeaturesInTransaction = 0
@@ -1574,14 +1608,14 @@ def TranslateLayer( psInfo, poSrcDS, poSrcLayer, poDstDS,  \
 
             if poDstFeature.SetFromWithMap( poFeature, 1, panMap ) != 0:
 
-                if nGroupTransactions > 0:
+                if psOptions.nGroupTransactions > 0:
                     poDstLayer.CommitTransaction()
 
-                print("Unable to translate feature %d from layer %s" % (poFeature.GetFID() , poSrcLayer.GetName() ))
+                Message("Unable to translate feature %d from layer %s" % (poFeature.GetFID() , poSrcLayer.GetName() ))
 
                 return False
 
-            if bPreserveFID:
+            if psOptions.bPreserveFID:
                 poDstFeature.SetFID( poFeature.GetFID() )
 
             poDstGeometry = poDstFeature.GetGeometryRef()
@@ -1629,11 +1663,11 @@ def TranslateLayer( psInfo, poSrcDS, poSrcLayer, poDstDS,  \
                 if poCT is not None:
                     eErr = poDstGeometry.Transform( poCT )
                     if eErr != 0:
-                        if nGroupTransactions > 0:
+                        if psOptions.nGroupTransactions > 0:
                             poDstLayer.CommitTransaction()
 
-                        print("Failed to reproject feature %d (geometry probably out of source or destination SRS)." % poFeature.GetFID())
-                        if not bSkipFailures:
+                        Message("Failed to reproject feature %d (geometry probably out of source or destination SRS)." % poFeature.GetFID())
+                        if not psOptions.bSkipFailures:
                             return False
 
                 elif poOutputSRS is not None:
@@ -1659,11 +1693,15 @@ def TranslateLayer( psInfo, poSrcDS, poSrcLayer, poDstDS,  \
                     poDstFeature.SetGeometryDirectly(ogr.ForceToMultiLineString(poDstGeometry))
 
             gdal.ErrorReset()
-            if poDstLayer.CreateFeature( poDstFeature ) != 0 and not bSkipFailures:
-                if nGroupTransactions > 0:
+            if poDstLayer.CreateFeature( poDstFeature ) == 0:
+                psOptions.nFeaturesWritten = psOptions.nFeaturesWritten + 1
+            elif not psOptions.bSkipFailures:
+                if psOptions.nGroupTransactions > 0:
                     poDstLayer.RollbackTransaction()
 
                 return False
+            else:
+                psOptions.nFeaturesFailed = psOptions.nFeaturesFailed + 1
 
         #/* Report progress */
         nCount = nCount  + 1
@@ -1684,7 +1722,7 @@ def TranslateLayer( psInfo, poSrcDS, poSrcLayer, poDstDS,  \
         if pnReadFeatureCount is not None:
             pnReadFeatureCount[0] = nCount
 
-    if nGroupTransactions > 0:
+    if psOptions.nGroupTransactions > 0:
         poDstLayer.CommitTransaction()
 
     return True
@@ -1692,7 +1730,7 @@ def TranslateLayer( psInfo, poSrcDS, poSrcLayer, poDstDS,  \
 if __name__ == '__main__':
     version_num = int(gdal.VersionInfo('VERSION_NUM'))
     if version_num < 1800: # because of ogr.GetFieldTypeName
-        print('ERROR: Python bindings of GDAL 1.8.0 or later required')
+        Message('ERROR: Python bindings of GDAL 1.8.0 or later required')
         sys.exit(1)
 
     if not main(sys.argv):
@@ -3,19 +3,22 @@ from __future__ import absolute_import
 import glob
 import json
 import logging
-from time import sleep
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from time import sleep, time
+from dateutil.parser import parse
 from urlparse import urljoin
 from zipfile import ZipFile
-from geoserver.catalog import Catalog, FailedRequestError
 import os
 import datetime
-import requests
+import uuid
 from django.conf import settings
 import shutil
-from dataqs.helpers import get_html
-from geonode.geoserver.helpers import ogc_server_settings, gs_catalog, get_store
-from geonode.geoserver.management.commands.updatelayers import Command \
-    as UpdateLayersCommand
+from dataqs.downloader import Downloader, ValidatorCache
+from dataqs.metrics import StageTiming, emit, instrumented
+from dataqs.helpers import get_html, get_gs_session, file_upload, \
+    gs_catalog_cache, store_exists, bbox_to_gridset, IntermediateFile
+from geonode.geoserver.helpers import ogc_server_settings
 
 logger = logging.getLogger("dataqs.processors")
 
@@ -23,6 +26,14 @@ DEFAULT_WORKSPACE = getattr(settings, 'DEFAULT_WORKSPACE', 'geonode')
 GS_DATA_DIR = getattr(settings, 'GS_DATA_DIR', '/data/geodata')
 GS_TMP_DIR = getattr(settings, 'GS_TMP_DIR', '/tmp')
 RSYNC_WAIT_TIME = getattr(settings, 'RSYNC_WAIT_TIME', 0)
+GS_GRANULE_DELETE_THREADS = getattr(settings, 'GS_GRANULE_DELETE_THREADS', 4)
+GWC_SEED_CONFIG = getattr(settings, 'GWC_SEED_CONFIG', {})
+GEONODE_FULL_SYNC = getattr(settings, 'GEONODE_FULL_SYNC', False)
+GWC_SEED_TIMEOUT = getattr(settings, 'GWC_SEED_TIMEOUT', 600)
+GWC_SEED_POLL_INTERVAL = getattr(settings, 'GWC_SEED_POLL_INTERVAL', 5)
+# Total size in bytes of the intermediate files a processor keeps in memory
+INTERMEDIATE_MEMORY_LIMIT = getattr(settings, 'INTERMEDIATE_MEMORY_LIMIT',
+                                    256 * 1024 * 1024)
 
 GPMOSAIC_COVERAGE_JSON = """{
     "coverage": {
@@ -65,6 +76,43 @@ PropertyCollectors=TimestampFileNameExtractorSPI[timeregex](ingestion)
 """
 
 
+def as_list(value):
+    """
+    Return a value from a GeoServer JSON document as a list (single
+    elements are not wrapped in a list by GeoServer's JSON encoder)
+    """
+    if value is None or value == '':
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def remove_file(filepath):
+    """
+    Remove a file if it exists
+    :param filepath: Full path & name of the file
+    """
+    if os.path.isfile(filepath):
+        os.remove(filepath)
+
+
+def bounds_differ(layer_fields, bounds):
+    """
+    Compare the bbox of a GeoNode layer with new layer bounds
+    :param layer_fields: dict of the layer's bbox_x0, bbox_x1, bbox_y0,
+    bbox_y1 and srid fields
+    :param bounds: (minx, maxx, miny, maxy, srs) layer bounds
+    :return: True if the bounds are different
+    """
+    for field, value in zip(('bbox_x0', 'bbox_x1', 'bbox_y0', 'bbox_y1'),
+                            bounds[:4]):
+        if layer_fields.get(field) is None or \
+                float(layer_fields[field]) != float(value):
+            return True
+    return layer_fields.get('srid') != bounds[4]
+
+
 class GeoDataProcessor(object):
     """
     Base class to handle geodata retrieval and processing
@@ -75,6 +123,13 @@ class GeoDataProcessor(object):
     gs_url = base_url + "{}/coveragestores/{}/file.geotiff"
     gs_vec_url = base_url + "{}/datastores/{}/featuretypes"
     gs_style_url = "http://{}:8080/geoserver/rest/styles/"
+    gwc_zoom_start = 0
+    gwc_zoom_stop = 19
+    # Degrees added around truncated extents, so that symbols drawn across
+    # tile edges are truncated along with the tiles containing the data
+    gwc_bbox_buffer = 2.0
+    # Per-layer GeoWebCache seeding options, updated by GWC_SEED_CONFIG
+    seed_config = {}
 
     def __init__(self, workspace=DEFAULT_WORKSPACE, tmp_dir=GS_TMP_DIR,
                  **kwargs):
@@ -84,49 +139,316 @@ class GeoDataProcessor(object):
             os.makedirs(tmp_dir)
         if 'days' in kwargs.keys():
             self.days = kwargs['days']
+        self.download_stats = []
+        self.validator_cache = ValidatorCache()
+        self.pending_validators = {}
+        self.stage_timings = []
+        self._active_stages = {}
+        self.intermediates = {}
+        self.memory_dir = '/vsimem/dataqs/{}'.format(uuid.uuid4().hex)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a stage of the processor (download, convert, db_load, publish,
+        geonode_sync, cache_truncate...) and send the result to the sinks
+        configured by the DATAQS_METRICS_SINKS setting.  Byte and row
+        counts can be added to the yielded StageTiming:
+
+            with self.stage('db_load') as timing:
+                timing.rows += load(rows)
+
+        A stage started while another stage of the same name is active is
+        counted as part of the active one.
+        :param name: Name of the stage
+        :return: StageTiming
+        """
+        if name in self._active_stages:
+            yield self._active_stages[name]
+            return
+        timing = StageTiming(self.__class__.__name__, name)
+        self._active_stages[name] = timing
+        try:
+            yield timing
+            timing.finish()
+        finally:
+            if timing.elapsed is None:
+                timing.finish(failed=True)
+            del self._active_stages[name]
+            self.stage_timings.append(timing)
+            emit(timing)
+
+    @contextmanager
+    def intermediate(self, filename, in_memory=True):
+        """
+        Write an intermediate file that is only read back by GDAL.  It is
+        kept in GDAL's /vsimem/ in-memory filesystem as long as the
+        processor's in-memory files fit within INTERMEDIATE_MEMORY_LIMIT
+        bytes, otherwise it is written to the temp directory:
+
+            with self.intermediate(filename) as outfile:
+                ftp.retrbinary('RETR ' + filename, outfile.write)
+            gdal.Open(self.intermediate_path(filename))
+
+        :param filename: Name of the file
+        :param in_memory: Write the file straight to the temp directory
+        if False
+        :return: IntermediateFile
+        """
+        max_size = 0
+        if in_memory:
+            max_size = INTERMEDIATE_MEMORY_LIMIT - sum(
+                f.size for f in self.intermediates.values() if f.in_memory)
+        if filename in self.intermediates:
+            self.intermediates.pop(filename).remove()
+        outfile = IntermediateFile(os.path.join(self.memory_dir, filename),
+                                   os.path.join(self.tmp_dir, filename),
+                                   max_size)
+        try:
+            yield outfile
+        except Exception:
+            outfile.remove()
+            raise
+        outfile.close()
+        self.intermediates[filename] = outfile
+
+    def intermediate_path(self, filename):
+        """
+        Path of an intermediate file for GDAL
+        :param filename: Name of the file
+        :return: /vsimem/ path if the file is in memory, else the path of
+        the file in the temp directory
+        """
+        if filename in self.intermediates:
+            return self.intermediates[filename].path
+        return os.path.join(self.tmp_dir, filename)
+
+    @property
+    def gs_session(self):
+        """
+        Shared, connection-pooled session used for all GeoServer REST calls
+        """
+        return get_gs_session()
 
-    def download(self, url, filename=None, html=False):
+    def download(self, url, filename=None, html=False, checksum=None,
+                 conditional=False):
         """
         Download a file from the specified URL
         :param url: The URL to download from
         :param filename: Optional name of the downloaded file.
+        :param html: Return the response content instead of saving a file
+        :param checksum: Optional tuple of (hashlib algorithm, hex digest)
+        to verify the downloaded file against
+        :param conditional: Only download the file if it has changed since
+        the last successful run (based on its ETag/Last-Modified headers)
         :return: Name of the downloaded file (not including path).
+        :raises NotModified: if conditional and the file has not changed
         """
         if not filename:
             filename = url.rsplit('/')[-1]
         if html:
             return get_html(url)
-        r = requests.get(url, stream=True)
-        with open(os.path.join(self.tmp_dir, filename), 'wb') as out_file:
-            for chunk in r.iter_content(chunk_size=1024):
-                if chunk:  # filter out keep-alive new chunks
-                    out_file.write(chunk)
-                    out_file.flush()
-        r.raise_for_status()
+        headers = None
+        if conditional:
+            headers = self.validator_cache.conditional_headers(url)
+        with self.stage('download') as timing:
+            stats = Downloader().download(
+                url, os.path.join(self.tmp_dir, filename),
+                checksum=checksum, headers=headers)
+            timing.bytes += stats.bytes
+        self.download_stats.append(stats)
+        if conditional:
+            self.pending_validators[url] = stats.validators
         return filename
 
-    def truncate_gs_cache(self, layer_name):
-        _user, _password = ogc_server_settings.credentials
-        gwc_url = "{base_url}gwc/rest/seed/{ws}:{layer}.json".format(
+    def save_validators(self):
+        """
+        Record the ETag/Last-Modified values of conditional downloads,
+        so that the next run can skip them if they are unchanged.  Called
+        by cleanup() at the end of a run, so that a failed run does not
+        prevent the same files from being processed again.
+        """
+        self.validator_cache.update(self.pending_validators)
+        self.pending_validators = {}
+
+    def get_gwc_layer(self, layer_name):
+        """
+        Retrieve the GeoWebCache configuration of a layer
+        :param layer_name: Name of the layer
+        :return: dict of the layer's gridsets (name: (zoomStart, zoomStop)),
+        image formats and parameter filter keys
+        """
+        gwc_url = "{base_url}gwc/rest/layers/{ws}:{layer}.json".format(
             base_url=ogc_server_settings.LOCATION,
             ws=self.workspace,
             layer=layer_name
         )
-        truncate_json = json.dumps({
-            'seedRequest': {
-                'name': 'geonode:{}'.format(layer_name),
-                'srs': {'number': 900913},
-                'zoomStart': 0,
-                'zoomStop': 19,
-                'format': 'image/png',
-                'type': 'truncate',
-                'threadCount': 4
-            }
-        })
-        res = requests.post(url=gwc_url, data=truncate_json,
-                            auth=(_user, _password),
-                            headers={"Content-type": "application/json"})
+        res = self.gs_session.get(gwc_url)
         res.raise_for_status()
+        layer = json.loads(res.content)['GeoServerLayer']
+        gridsets = {}
+        for subset in as_list((layer.get('gridSubsets') or {}).get(
+                'gridSubset')):
+            gridsets[subset['gridSetName']] = (
+                int(subset.get('zoomStart', self.gwc_zoom_start)),
+                int(subset.get('zoomStop', self.gwc_zoom_stop)))
+        parameters = []
+        for filters in (layer.get('parameterFilters') or {}).values():
+            parameters.extend(f['key'] for f in as_list(filters))
+        return {
+            'gridsets': gridsets,
+            'formats': as_list((layer.get('mimeFormats') or {}).get(
+                'string')),
+            'parameters': parameters
+        }
+
+    @instrumented('cache_truncate')
+    def truncate_gs_cache(self, layer_name, bbox=None, times=None):
+        """
+        Truncate the GeoWebCache tiles of a layer, in every gridset and
+        image format that the layer is cached in.
+        :param layer_name: Name of the layer
+        :param bbox: Optional (minx, miny, maxx, maxy) EPSG:4326 extent of
+        the changed data; the whole layer is truncated if not provided
+        :param times: Optional list of changed TIME dimension values; tiles
+        for these values and for the default time are truncated
+        """
+        gwc_url = "{base_url}gwc/rest/seed/{ws}:{layer}.json".format(
+            base_url=ogc_server_settings.LOCATION,
+            ws=self.workspace,
+            layer=layer_name
+        )
+        gwc_layer = self.get_gwc_layer(layer_name)
+        if bbox:
+            buf = self.gwc_bbox_buffer
+            bbox = (max(-180.0, bbox[0] - buf), max(-90.0, bbox[1] - buf),
+                    min(180.0, bbox[2] + buf), min(90.0, bbox[3] + buf))
+        parameter_sets = [None]
+        if times and 'TIME' in [p.upper() for p in gwc_layer['parameters']]:
+            parameter_sets.extend(
+                {'entry': [{'string': ['TIME', t]}]} for t in times)
+        for gridset, (zoom_start, zoom_stop) in gwc_layer['gridsets'].items():
+            bounds = bbox_to_gridset(bbox, gridset) if bbox else None
+            for image_format in gwc_layer['formats']:
+                for parameters in parameter_sets:
+                    seed_request = {
+                        'name': '{}:{}'.format(self.workspace, layer_name),
+                        'gridSetId': gridset,
+                        'zoomStart': zoom_start,
+                        'zoomStop': zoom_stop,
+                        'format': image_format,
+                        'type': 'truncate',
+                        'threadCount': 4
+                    }
+                    if bounds:
+                        seed_request['bounds'] = {
+                            'coords': {'double': list(bounds)}}
+                    if parameters:
+                        seed_request['parameters'] = parameters
+                    res = self.gs_session.post(
+                        url=gwc_url,
+                        data=json.dumps({'seedRequest': seed_request}),
+                        headers={"Content-type": "application/json"})
+                    res.raise_for_status()
+
+    def get_seed_config(self, layer_name):
+        """
+        Return the GeoWebCache seeding options for a layer, from the
+        processor's seed_config property and the GWC_SEED_CONFIG setting,
+        for example:
+        {'zoomStart': 0, 'zoomStop': 6, 'bbox': (-180, -90, 180, 90),
+         'gridSetId': 'EPSG:900913', 'format': 'image/png',
+         'threadCount': 2, 'latest_time': True, 'wait': True}
+        :param layer_name: Name of the layer
+        :return: dict of seeding options, empty if the layer is not seeded
+        """
+        config = dict(self.seed_config.get(layer_name, {}))
+        config.update(GWC_SEED_CONFIG.get(layer_name, {}))
+        return config
+
+    @instrumented('cache_seed')
+    def seed_gs_cache(self, layer_name, times=None):
+        """
+        Pre-seed the GeoWebCache tiles of a layer, if it has seeding options
+        configured, so that the most used zoom levels are already rendered
+        when users open the layer.
+        :param layer_name: Name of the layer
+        :param times: Optional list of TIME dimension values; if the
+        layer's 'latest_time' option is set the latest value is seeded
+        along with the default time.
+        """
+        config = self.get_seed_config(layer_name)
+        if not config:
+            return
+        gwc_url = "{base_url}gwc/rest/seed/{ws}:{layer}.json".format(
+            base_url=ogc_server_settings.LOCATION,
+            ws=self.workspace,
+            layer=layer_name
+        )
+        gridset = config.get('gridSetId', 'EPSG:900913')
+        seed_request = {
+            'name': '{}:{}'.format(self.workspace, layer_name),
+            'gridSetId': gridset,
+            'zoomStart': config.get('zoomStart', 0),
+            'zoomStop': config.get('zoomStop', 6),
+            'format': config.get('format', 'image/png'),
+            'type': 'seed',
+            'threadCount': config.get('threadCount', 2)
+        }
+        if config.get('bbox'):
+            bounds = bbox_to_gridset(config['bbox'], gridset)
+            if bounds:
+                seed_request['bounds'] = {'coords': {'double': list(bounds)}}
+        parameter_sets = [None]
+        if times and config.get('latest_time', True):
+            parameter_sets.append(
+                {'entry': [{'string': ['TIME', max(times)]}]})
+        for parameters in parameter_sets:
+            if parameters:
+                seed_request['parameters'] = parameters
+            res = self.gs_session.post(
+                url=gwc_url,
+                data=json.dumps({'seedRequest': seed_request}),
+                headers={"Content-type": "application/json"})
+            res.raise_for_status()
+        if config.get('wait', True):
+            self.wait_for_gwc_tasks(layer_name)
+
+    def wait_for_gwc_tasks(self, layer_name, timeout=GWC_SEED_TIMEOUT,
+                           interval=GWC_SEED_POLL_INTERVAL):
+        """
+        Poll GeoWebCache until a layer's seed/truncate tasks are finished
+        :param layer_name: Name of the layer
+        :param timeout: Maximum number of seconds to wait
+        :param interval: Number of seconds between status requests
+        :return: True if all tasks finished, False if timed out
+        """
+        gwc_url = "{base_url}gwc/rest/seed/{ws}:{layer}.json".format(
+            base_url=ogc_server_settings.LOCATION,
+            ws=self.workspace,
+            layer=layer_name
+        )
+        start = time()
+        while True:
+            res = self.gs_session.get(gwc_url)
+            res.raise_for_status()
+            # Each task is [tiles done, tiles total, seconds remaining,
+            # task id, status (-1 aborted, 0 pending, 1 running, 2 done)]
+            tasks = [task for task in
+                     json.loads(res.content).get('long-array-array', [])
+                     if task[4] in (0, 1)]
+            if not tasks:
+                logger.debug("GWC tasks for {} finished in {:.1f}s".format(
+                    layer_name, time() - start))
+                return True
+            logger.debug("GWC tasks for {}: {} of {} tiles done".format(
+                layer_name, sum(task[0] for task in tasks),
+                sum(task[1] for task in tasks)))
+            if time() - start > timeout:
+                logger.warn("GWC tasks for {} still running after {}s".format(
+                    layer_name, timeout))
+                return False
+            sleep(interval)
 
     def post_geoserver(self, tif_file, layer_name):
         """
@@ -137,24 +459,21 @@ class GeoDataProcessor(object):
         # Post to Geoserver
         gs_url = self.gs_url.format(ogc_server_settings.hostname,
                                     self.workspace, layer_name)
-        data = None
-        with open(os.path.join(self.tmp_dir, tif_file), 'rb') as tif_binary:
-            data = tif_binary.read()
-        _user, _password = ogc_server_settings.credentials
-        res = requests.put(url=gs_url,
-                           data=data,
-                           auth=(_user, _password),
-                           headers={'Content-Type': 'image/tif'})
+        with self.stage('publish') as timing:
+            with file_upload(os.path.join(self.tmp_dir, tif_file),
+                             'image/tif') as (data, headers):
+                res = self.gs_session.put(url=gs_url, data=data,
+                                          headers=headers)
+                timing.bytes += int(headers.get('Content-Length', 0))
 
         res.raise_for_status()
+        gs_catalog_cache.add(
+            ('resource', self.workspace, layer_name, layer_name))
         return res.content
 
     def verify_store(self, store, workspace=DEFAULT_WORKSPACE):
-        cat = gs_catalog
-        try:
-            get_store(cat, store, workspace=workspace)
-
-        except FailedRequestError:
+        if not store_exists(store, workspace):
+            cat = gs_catalog_cache.catalog
             ds = cat.create_datastore(store, workspace=workspace)
             db = ogc_server_settings.datastore_db
             db_engine = 'postgis' if \
@@ -168,7 +487,9 @@ class GeoDataProcessor(object):
                 dbtype=db_engine
             )
             cat.save(ds)
+            gs_catalog_cache.add(('store', workspace, store))
 
+    @instrumented('publish')
     def post_geoserver_vector(self, layer_name,
                               store=ogc_server_settings.DATASTORE):
         """
@@ -180,15 +501,15 @@ class GeoDataProcessor(object):
         gs_url = self.gs_vec_url.format(ogc_server_settings.hostname,
                                         self.workspace, store)
         data = "<featureType><name>{}</name></featureType>".format(layer_name)
-        _user, _password = ogc_server_settings.credentials
-        res = requests.post(url=gs_url,
-                            data=data,
-                            auth=(_user, _password),
-                            headers={'Content-Type': 'text/xml'})
+        res = self.gs_session.post(url=gs_url,
+                                   data=data,
+                                   headers={'Content-Type': 'text/xml'})
 
         res.raise_for_status()
+        gs_catalog_cache.add(('resource', self.workspace, store, layer_name))
         return res.content
 
+    @instrumented('publish')
     def update_gs_metadata(self, layer_name, json_data, vector=False,
                            store=ogc_server_settings.DATASTORE):
         """
@@ -208,37 +529,67 @@ class GeoDataProcessor(object):
                                         self.workspace, store).replace(
                 'file.geotiff', '')
             gs_url += "/{lyr}.json".format(lyr=layer_name)
-        _user, _password = ogc_server_settings.credentials
-        res = requests.put(url=gs_url, data=json_data, auth=(_user, _password),
-                           headers={'Content-Type': 'application/json'})
+        res = self.gs_session.put(
+            url=gs_url, data=json_data,
+            headers={'Content-Type': 'application/json'})
         res.raise_for_status()
         return res.content
 
-    def update_geonode(self, layer_name, title="", bounds=None, store=None):
+    @instrumented('geonode_sync')
+    def update_geonode(self, layer_name, title="", bounds=None, store=None,
+                       time_extent=None, full_sync=GEONODE_FULL_SYNC):
         """
-        Update a layer and it's title in GeoNode
+        Update a layer and it's title in GeoNode.  GeoNode's updatelayers
+        command is only run if the layer does not exist in GeoNode yet (or
+        if full_sync is True); otherwise the title, bbox and time extent
+        are updated in place with a single database UPDATE.
         :param layer_name: Name of the layer
         :param title: New title for layer
+        :param bounds: Optional (minx, maxx, miny, maxy, srs) layer bounds
+        :param store: Name of the layer's store
+        :param time_extent: Optional (start, end) datetimes of the layer
+        :param full_sync: Always run GeoNode's updatelayers command
         """
-        # Update the layer in GeoNode
-        ulc = UpdateLayersCommand()
-        ulc.handle(verbosity=1, filter=layer_name, store=store,
-                   workspace=DEFAULT_WORKSPACE)
-
+        from geonode.geoserver.management.commands.updatelayers import \
+            Command as UpdateLayersCommand
+        from geonode.layers.models import Layer
+        layers = Layer.objects.filter(
+            typename='{}:{}'.format(DEFAULT_WORKSPACE, layer_name))
+        if full_sync or not layers.exists():
+            ulc = UpdateLayersCommand()
+            ulc.handle(verbosity=1, filter=layer_name, store=store,
+                       workspace=DEFAULT_WORKSPACE)
+
+        current = layers.values('title', 'bbox_x0', 'bbox_x1', 'bbox_y0',
+                                'bbox_y1', 'srid').first() or {}
+        title_changed = bool(title) and current.get('title') != title
+        bounds_changed = bool(bounds) and bounds_differ(current, bounds)
+        fields = {}
         if title:
-            from geonode.layers.models import Layer
-            lyr = Layer.objects.get(typename='geonode:{}'.format(layer_name))
-            lyr.title = title
-            lyr.save()
-            if bounds:
-                from geonode.layers.models import Layer
-                res = lyr.gs_resource
-                res.native_bbox = bounds
-                _user, _password = ogc_server_settings.credentials
-                url = ogc_server_settings.rest
-                gs_catalog = Catalog(url, _user, _password)
-                gs_catalog.save(res)
-
+            fields['title'] = title
+        if bounds:
+            fields.update(bbox_x0=bounds[0], bbox_x1=bounds[1],
+                          bbox_y0=bounds[2], bbox_y1=bounds[3],
+                          srid=bounds[4])
+        if time_extent:
+            fields.update(temporal_extent_start=time_extent[0],
+                          temporal_extent_end=time_extent[1])
+        if fields:
+            layers.update(**fields)
+
+        if title_changed or bounds_changed:
+            # Keep the GeoServer resource in step with GeoNode
+            cat = gs_catalog_cache.catalog
+            res = cat.get_resource(layer_name, store=store,
+                                   workspace=DEFAULT_WORKSPACE)
+            if res is not None:
+                if title_changed:
+                    res.title = title
+                if bounds_changed:
+                    res.native_bbox = bounds
+                cat.save(res)
+
+    @instrumented('publish')
     def set_default_style(self, layer_name, sld_name, sld_content):
         """
         Create a style and assign it as default to a layer
@@ -252,11 +603,9 @@ class GeoDataProcessor(object):
         # Create the style
         s = "<style><name>{name}</name><filename>{name}.sld</filename></style>"
         data = s.format(name=sld_name)
-        _user, _password = ogc_server_settings.credentials
-        res = requests.post(url=gs_url,
-                            data=data,
-                            auth=(_user, _password),
-                            headers={'Content-Type': 'text/xml'})
+        res = self.gs_session.post(url=gs_url,
+                                   data=data,
+                                   headers={'Content-Type': 'text/xml'})
 
         res.raise_for_status()
 
@@ -264,12 +613,12 @@ class GeoDataProcessor(object):
         data = sld_content
         url = urljoin(gs_url, sld_name)
         logger.debug(url)
-        res = requests.put(url=url,
-                           data=data,
-                           auth=(_user, _password),
-                           headers={
-                               'Content-Type': 'application/vnd.ogc.sld+xml'
-                           })
+        res = self.gs_session.put(url=url,
+                                  data=data,
+                                  headers={
+                                      'Content-Type':
+                                          'application/vnd.ogc.sld+xml'
+                                  })
 
         res.raise_for_status()
 
@@ -280,19 +629,23 @@ class GeoDataProcessor(object):
             sld_name)
         url = urljoin(gs_url.replace("styles", "layers"), layer_typename)
         logger.debug(url)
-        res = requests.put(
+        res = self.gs_session.put(
             url=url,
             data=data,
-            auth=(_user, _password),
             headers={'Content-Type': 'text/xml'})
 
         res.raise_for_status()
+        gs_catalog_cache.add(('style', sld_name))
 
     def cleanup(self):
         """
-        Remove any files in the temp directory matching
-        the processor class prefix
+        Remove intermediate files, and any files in the temp directory
+        matching the processor class prefix
         """
+        self.save_validators()
+        for intermediate in self.intermediates.values():
+            intermediate.remove()
+        self.intermediates = {}
         filelist = glob.glob("{}*.*".format(
             os.path.join(self.tmp_dir, self.prefix)))
         for f in filelist:
@@ -315,6 +668,7 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
     create_url = gs_url.replace('external.imagemosaic', 'file.imagemosaic')
 
     archive_hours = ("T12:00:00.000Z",)
+    gwc_time_format = "%Y-%m-%dT%H:00:00.000Z"
     days_to_keep = 30
     data_dir = "{gsd}/data/{ws}/{layer}/{file}"
     local_gs = True
@@ -325,11 +679,11 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
         :param url: URL indicating which image from which mosaic to delete
         :return: response status and content
         """
-        _user, _password = ogc_server_settings.credentials
-        r = requests.delete(url, auth=(_user, _password))
+        r = self.gs_session.delete(url)
         r.raise_for_status()
         return r.status_code, r.content
 
+    @instrumented('publish')
     def post_geoserver(self, filepath, layer_name):
         """
         Add another image to a mosaic datastore
@@ -340,38 +694,63 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
         gs_url = self.gs_url.format(ogc_server_settings.hostname,
                                     self.workspace, layer_name)
         data = "file://{}".format(filepath)
-        _user, _password = ogc_server_settings.credentials
-        res = requests.post(url=gs_url,
-                            data=data,
-                            auth=(_user, _password),
-                            headers={'Content-Type': 'text/plain'})
+        res = self.gs_session.post(url=gs_url,
+                                   data=data,
+                                   headers={'Content-Type': 'text/plain'})
         if res.status_code == 405:
             logger.warn("Mosaic may not exist, try to create it")
             self.create_mosaic(layer_name, filepath)
         else:
             res.raise_for_status()
 
+    @instrumented('granule_removal')
     def remove_mosaic_granules(self, mosaic_url, mosaic_query, layer_name):
         """
-        Remove granules from an image mosaic based on query parameters
+        Remove granules from an image mosaic based on query parameters.
+        The granules are removed from the mosaic index with a single
+        filtered DELETE, or if GeoServer does not support that, with
+        concurrent per-granule DELETEs (GS_GRANULE_DELETE_THREADS at a
+        time).  Their image files are then removed in parallel.
         :param mosaic_url: The base image mosaic REST URL
         :param mosaic_query: Query specifying which granules to remove
         :param layer_name: The name of the image mosaic layer
-        :return: None
+        :return: TIME dimension values (in gwc_time_format) of the removed
+        granules, so that their cached tiles can be truncated
         """
-        _user, _password = ogc_server_settings.credentials
-        r = requests.get("{url}.json?filter={query}".format(
-            url=mosaic_url, query=mosaic_query),
-            auth=(_user, _password))
+        start = time()
+        r = self.gs_session.get("{}.json".format(mosaic_url),
+                                params={'filter': mosaic_query})
         r.raise_for_status()
-        fc = json.loads(r.content)
-        for feature in fc['features']:
-            dst_file = self.data_dir.format(
-                gsd=GS_DATA_DIR, ws=self.workspace,
-                layer=layer_name, file=feature['properties']['location'])
-            if os.path.isfile(dst_file):
-                os.remove(dst_file)
-            self.del_mosaic_image("{}/{}".format(mosaic_url, feature['id']))
+        features = json.loads(r.content)['features']
+        if not features:
+            return []
+        dst_files = [self.data_dir.format(
+            gsd=GS_DATA_DIR, ws=self.workspace,
+            layer=layer_name, file=feature['properties']['location'])
+            for feature in features]
+        pool = ThreadPool(min(GS_GRANULE_DELETE_THREADS, len(features)))
+        try:
+            res = self.gs_session.delete(mosaic_url,
+                                         params={'filter': mosaic_query})
+            if res.status_code in (404, 405, 501):
+                logger.debug("Filtered granule delete not supported, "
+                             "deleting granules individually")
+                pool.map(self.del_mosaic_image, [
+                    "{}/{}".format(mosaic_url, feature['id'])
+                    for feature in features])
+            else:
+                res.raise_for_status()
+            pool.map(remove_file, dst_files)
+        finally:
+            pool.close()
+            pool.join()
+        logger.info("Removed {} granules from {} in {:.2f}s".format(
+            len(features), layer_name, time() - start))
+        return sorted(set(
+            parse(feature['properties']['ingestion']).strftime(
+                self.gwc_time_format)
+            for feature in features
+            if feature['properties'].get('ingestion')))
 
     def drop_old_hourly_images(self, nowtime, layer_name):
         """
@@ -379,6 +758,7 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
         except for the archive hour.
         :param nowtime: Current date/time
         :param layer_name: Geoserver mosaic store/layer name
+        :return: TIME dimension values of the removed images
         """
         today = nowtime.strftime("%Y-%m-%dT%H:00:00.000Z")
         morn = nowtime.strftime("%Y-%m-%dT00:00:00.000Z")
@@ -395,7 +775,8 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
         mosaic_query = (
             "ingestion<{now} AND ingestion>={morn}{archive_query}".format(
                 now=today, morn=morn, archive_query=archive_query))
-        self.remove_mosaic_granules(mosaic_index_url, mosaic_query, layer_name)
+        removed = self.remove_mosaic_granules(mosaic_index_url, mosaic_query,
+                                              layer_name)
 
         # Remove yesterday's old images if any remaining
         yesterday = nowtime - datetime.timedelta(days=1)
@@ -408,7 +789,18 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
                 morn=morn,
                 archive=archive_query,
                 yestermorn=yesterday.strftime("%Y-%m-%dT00:00:00.000Z")))
-        self.remove_mosaic_granules(mosaic_index_url, mosaic_query, layer_name)
+        return removed + self.remove_mosaic_granules(
+            mosaic_index_url, mosaic_query, layer_name)
+
+    def get_time_extent(self, nowtime):
+        """
+        Return the time extent of a mosaic after old images are dropped
+        :param nowtime: Date/time of the latest image
+        :return: tuple of (start, end) datetimes
+        """
+        start = (nowtime - datetime.timedelta(days=self.days_to_keep)).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        return start, nowtime
 
     def drop_old_daily_images(self, nowtime, layer_name):
         """
@@ -416,8 +808,8 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
         property (default is 30).
         :param nowtime: Current date/time
         :param layer_name: Geoserver mosaic store/layer name
+        :return: TIME dimension values of the removed images
         """
-        _user, _password = ogc_server_settings.credentials
         month_cutoff = (nowtime - datetime.timedelta(
             days=self.days_to_keep)).strftime("%Y-%m-%dT00:00:00.000Z")
         mosaic_index_url = self.mosaic_url.format(ogc_server_settings.hostname,
@@ -425,7 +817,8 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
                                                   layer_name,
                                                   layer_name)
         mosaic_query = "ingestion<={}".format(month_cutoff)
-        self.remove_mosaic_granules(mosaic_index_url, mosaic_query, layer_name)
+        return self.remove_mosaic_granules(mosaic_index_url, mosaic_query,
+                                           layer_name)
 
     def create_mosaic_properties_zip(self, layer_name, img_file):
         """
@@ -469,6 +862,7 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
             shutil.rmtree(tmp_dir)
             raise e
 
+    @instrumented('publish')
     def create_mosaic(self, layer_name, img_file):
         """
         Create a time-enabled image mosaic datastore and layer
@@ -480,26 +874,22 @@ class GeoDataMosaicProcessor(GeoDataProcessor):
         gs_url = self.create_url.format(ogc_server_settings.hostname,
                                         self.workspace, layer_name)
         try:
-            with open(ziploc, 'rb') as zipdata:
-                data = zipdata.read()
-                _user, _password = ogc_server_settings.credentials
-                res = requests.put(url=gs_url,
-                                   data=data,
-                                   auth=(_user, _password),
-                                   headers={
-                                       'Content-Type': 'application/zip'}
-                                   )
-                res.raise_for_status()
-                gs_url = gs_url.replace(
-                    'file.imagemosaic',
-                    'coverages/{}.json'.format(layer_name))
-                res = requests.put(url=gs_url,
-                                   data=GPMOSAIC_COVERAGE_JSON,
-                                   auth=(_user, _password),
-                                   headers={
-                                       'Content-Type': 'application/json'
-                                   })
-                res.raise_for_status()
+            with file_upload(ziploc, 'application/zip') as (data, headers):
+                res = self.gs_session.put(url=gs_url,
+                                          data=data,
+                                          headers=headers)
+            res.raise_for_status()
+            gs_url = gs_url.replace(
+                'file.imagemosaic',
+                'coverages/{}.json'.format(layer_name))
+            res = self.gs_session.put(url=gs_url,
+                                      data=GPMOSAIC_COVERAGE_JSON,
+                                      headers={
+                                          'Content-Type': 'application/json'
+                                      })
+            res.raise_for_status()
+            gs_catalog_cache.add(
+                ('resource', self.workspace, layer_name, layer_name))
         finally:
             if os.path.exists(ziploc):
                 shutil.rmtree(os.path.dirname(ziploc))
@@ -2,9 +2,11 @@ from __future__ import absolute_import
 
 import logging
 import os
+from dataqs.downloader import NotModified
+from dataqs.metrics import instrumented
 from dataqs.processor_base import GeoDataProcessor
 from dataqs.helpers import get_band_count, gdal_translate, cdo_invert, \
-    nc_convert, style_exists
+    nc_convert, netcdf_to_geotiff, make_cog, style_exists
 
 logger = logging.getLogger("dataqs.processors")
 script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -20,14 +22,32 @@ class SPEIProcessor(GeoDataProcessor):
         'spei01': 'SPEI Global Drought Monitor (past month)',
         'spei03': 'SPEI Global Drought Monitor (past 3 months)'}
     base_url = "http://notos.eead.csic.es/spei/nc/"
+    variable = "spei"
 
+    @instrumented('convert')
     def convert(self, nc_file):
+        """
+        Convert the latest time slice of a SPEI NetCDF file to GeoTIFF.
+        If GDAL cannot read the file directly (i.e. it was built without
+        NetCDF-4 support), the file is converted with nccopy and cdo first.
+        :param nc_file: Name of the NetCDF file, without extension
+        :return: Name of the GeoTIFF file
+        """
         tif_file = "{}.tif".format(nc_file)
-        nc_transform = nc_convert(os.path.join(self.tmp_dir, nc_file))
-        cdo_transform = cdo_invert(os.path.join(self.tmp_dir, nc_transform))
-        band = get_band_count(cdo_transform)
-        gdal_translate(cdo_transform, os.path.join(self.tmp_dir, tif_file),
-                       bands=[band], projection='EPSG:4326')
+        try:
+            netcdf_to_geotiff(
+                os.path.join(self.tmp_dir, "{}.nc".format(nc_file)),
+                self.variable, os.path.join(self.tmp_dir, tif_file))
+        except RuntimeError as e:
+            logger.warn("Could not read {} with GDAL ({}), using "
+                        "nccopy and cdo".format(nc_file, e))
+            nc_transform = nc_convert(os.path.join(self.tmp_dir, nc_file))
+            cdo_transform = cdo_invert(
+                os.path.join(self.tmp_dir, nc_transform))
+            band = get_band_count(cdo_transform)
+            gdal_translate(cdo_transform, os.path.join(self.tmp_dir, tif_file),
+                           bands=[band], projection='EPSG:4326')
+        make_cog(os.path.join(self.tmp_dir, tif_file))
         return tif_file
 
     def run(self):
@@ -36,7 +56,12 @@ class SPEIProcessor(GeoDataProcessor):
         object's spei_files property.
         """
         for layer_name in self.spei_files.keys():
-            self.download("{}{}.nc".format(self.base_url, layer_name))
+            try:
+                self.download("{}{}.nc".format(self.base_url, layer_name),
+                              conditional=True)
+            except NotModified:
+                logger.info("{} has not changed, skipping".format(layer_name))
+                continue
             tif_file = self.convert(layer_name)
             self.post_geoserver(tif_file, layer_name)
             if not style_exists(layer_name):
@@ -46,6 +71,7 @@ class SPEIProcessor(GeoDataProcessor):
             self.update_geonode(layer_name, title=self.spei_files[layer_name],
                                 store=layer_name)
             self.truncate_gs_cache(layer_name)
+            self.seed_gs_cache(layer_name)
             self.cleanup()
 
 
@@ -4,6 +4,7 @@ import os
 from django.test import TestCase
 from dataqs.spei.spei import SPEIProcessor
 import httpretty
+from mock import MagicMock, call, patch
 
 script_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -58,3 +59,56 @@ class SpieTest(TestCase):
         self.processor.cleanup()
         self.assertEquals([], glob.glob(os.path.join(
             self.processor.tmp_dir, self.processor.prefix + '*')))
+
+    def patch_convert(self, netcdf_error=None):
+        """
+        Patch the conversion helpers used by SPEIProcessor.convert and
+        return a mock that records the calls to all of them in order
+        """
+        helpers = MagicMock()
+        helpers.netcdf_to_geotiff.side_effect = netcdf_error
+        helpers.nc_convert.return_value = 'spei03.nc.classic.nc'
+        helpers.cdo_invert.return_value = 'spei03.nc.classic.inv.nc'
+        helpers.get_band_count.return_value = 12
+        for name in ('netcdf_to_geotiff', 'nc_convert', 'cdo_invert',
+                     'get_band_count', 'gdal_translate', 'make_cog'):
+            patcher = patch('dataqs.spei.spei.' + name,
+                            getattr(helpers, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return helpers
+
+    def test_convert(self):
+        """
+        Verify that the latest band is read from the NetCDF file directly
+        when GDAL supports it
+        """
+        helpers = self.patch_convert()
+        tmp_dir = self.processor.tmp_dir
+        self.assertEquals('spei03.tif', self.processor.convert('spei03'))
+        self.assertEquals([
+            call.netcdf_to_geotiff(os.path.join(tmp_dir, 'spei03.nc'),
+                                   'spei', os.path.join(tmp_dir,
+                                                        'spei03.tif')),
+            call.make_cog(os.path.join(tmp_dir, 'spei03.tif'))
+        ], helpers.mock_calls)
+
+    def test_convert_fallback(self):
+        """
+        Verify that the file is converted with nccopy, then cdo, then
+        gdal_translate when GDAL cannot read it
+        """
+        helpers = self.patch_convert(RuntimeError('not a NetCDF-3 file'))
+        tmp_dir = self.processor.tmp_dir
+        self.assertEquals('spei03.tif', self.processor.convert('spei03'))
+        self.assertEquals([
+            'netcdf_to_geotiff', 'nc_convert', 'cdo_invert',
+            'get_band_count', 'gdal_translate', 'make_cog'
+        ], [name for name, args, kwargs in helpers.mock_calls])
+        helpers.nc_convert.assert_called_once_with(
+            os.path.join(tmp_dir, 'spei03'))
+        helpers.cdo_invert.assert_called_once_with(
+            os.path.join(tmp_dir, 'spei03.nc.classic.nc'))
+        helpers.gdal_translate.assert_called_once_with(
+            'spei03.nc.classic.inv.nc', os.path.join(tmp_dir, 'spei03.tif'),
+            bands=[12], projection='EPSG:4326')
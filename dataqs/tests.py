@@ -0,0 +1,1106 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import skipUnless
+from django.test import TestCase
+import json
+import zlib
+import httpretty
+import requests
+from mock import MagicMock, patch
+import numpy
+from osgeo import gdal
+from psycopg2 import extensions
+from dataqs.downloader import Downloader, ChecksumError, NotModified, \
+    ValidatorCache
+from dataqs.helpers import PostgresPool, CopyStream, warp_windows, \
+    ogr2ogr_load, HostRateLimiter, ogr2ogr_merge, VectorLoadResult, \
+    copy_value, CatalogCache, file_upload, gzip_chunks, band_subset_vrt, \
+    gdal_band_subset, build_warp_index, get_warp_index, warp_image, \
+    OGR_PG_GROUP_TRANSACTIONS, gdal_config_option
+from dataqs.metrics import JSONFileSink
+from dataqs.processor_base import GeoDataProcessor, GeoDataMosaicProcessor, \
+    GWC_SEED_POLL_INTERVAL
+
+TEST_URL = "http://data.example.com/test.bin"
+TEST_BODY = b"0123456789" * 1000
+MOSAIC_URL = "http://localhost:8080/geoserver/rest/workspaces/geonode/" \
+             "coveragestores/test/coverages/test/index/granules"
+SEED_URL = "http://localhost:8080/geoserver/gwc/rest/seed/geonode:test.json"
+GRANULES = {'features': [{
+    'id': 'test.{}'.format(i),
+    'properties': {'location': 'test_2016010{}T120000000Z.tif'.format(i),
+                   'ingestion': '2016-01-0{}T12:00:00Z'.format(i)}
+} for i in (1, 2)]}
+
+# Import a module in a fresh interpreter, after Django and GeoNode, and
+# report the time taken and the modules it loaded
+IMPORT_SCRIPT = """
+import json, sys, time
+import django
+if hasattr(django, 'setup'):
+    django.setup()
+import geonode.geoserver.helpers
+before = set(sys.modules)
+start = time.time()
+__import__(sys.argv[1])
+print(json.dumps({'elapsed': time.time() - start,
+                  'modules': sorted(set(sys.modules) - before)}))
+"""
+
+
+class DownloaderTest(TestCase):
+    """
+    Tests the dataqs.downloader module.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dst = os.path.join(self.tmp_dir, 'test.bin')
+        httpretty.enable()
+
+    def tearDown(self):
+        httpretty.disable()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_download(self):
+        """
+        Verify that a file is downloaded and no partial file remains
+        """
+        httpretty.register_uri(httpretty.GET, TEST_URL, body=TEST_BODY)
+        stats = Downloader().download(TEST_URL, self.dst)
+        with open(self.dst, 'rb') as dl_file:
+            self.assertEquals(TEST_BODY, dl_file.read())
+        self.assertEquals(len(TEST_BODY), stats.bytes)
+        self.assertFalse(os.path.exists(self.dst + Downloader.partial_suffix))
+
+    def test_resume(self):
+        """
+        Verify that a partial download is resumed with a Range request
+        """
+        offset = 4000
+        part_file = self.dst + Downloader.partial_suffix
+        with open(part_file, 'wb') as part:
+            part.write(TEST_BODY[:offset])
+        with open(part_file + Downloader.validator_suffix, 'w') as validator:
+            validator.write('"abc"')
+
+        def range_response(request, uri, headers):
+            self.assertEquals('bytes={}-'.format(offset),
+                              request.headers.get('Range'))
+            self.assertEquals('identity',
+                              request.headers.get('Accept-Encoding'))
+            return 206, headers, TEST_BODY[offset:]
+
+        httpretty.register_uri(httpretty.GET, TEST_URL, body=range_response)
+        stats = Downloader().download(TEST_URL, self.dst)
+        with open(self.dst, 'rb') as dl_file:
+            self.assertEquals(TEST_BODY, dl_file.read())
+        self.assertEquals(offset, stats.resumed_from)
+        self.assertEquals(len(TEST_BODY) - offset, stats.bytes)
+
+    def test_checksum(self):
+        """
+        Verify that a download with a bad checksum is rejected and removed
+        """
+        httpretty.register_uri(httpretty.GET, TEST_URL, body=TEST_BODY)
+        md5 = hashlib.md5(TEST_BODY).hexdigest()
+        Downloader().download(TEST_URL, self.dst, checksum=('md5', md5))
+        self.assertTrue(os.path.exists(self.dst))
+        os.remove(self.dst)
+        with self.assertRaises(ChecksumError):
+            Downloader().download(TEST_URL, self.dst,
+                                  checksum=('md5', 'bad'))
+        self.assertFalse(os.path.exists(self.dst))
+
+    def test_not_modified(self):
+        """
+        Verify that a conditional download of an unchanged file is skipped
+        """
+        etag = '"v1"'
+
+        def conditional_response(request, uri, headers):
+            if request.headers.get('If-None-Match') == etag:
+                return 304, headers, ''
+            headers['ETag'] = etag
+            return 200, headers, TEST_BODY
+
+        httpretty.register_uri(httpretty.GET, TEST_URL,
+                               body=conditional_response)
+        cache = ValidatorCache(os.path.join(self.tmp_dir, 'validators.json'))
+        stats = Downloader().download(
+            TEST_URL, self.dst, headers=cache.conditional_headers(TEST_URL))
+        self.assertEquals(etag, stats.etag)
+        cache.update({TEST_URL: stats.validators})
+        os.remove(self.dst)
+        with self.assertRaises(NotModified):
+            Downloader().download(
+                TEST_URL, self.dst,
+                headers=cache.conditional_headers(TEST_URL))
+        self.assertFalse(os.path.exists(self.dst))
+
+    def test_validator_expiry(self):
+        """
+        Verify that old and surplus validators are removed when the cache
+        is saved
+        """
+        cache_file = os.path.join(self.tmp_dir, 'validators.json')
+        now = time.time()
+        with open(cache_file, 'w') as cache_json:
+            json.dump({
+                'http://example.com/expired': {
+                    'etag': '"a"', 'updated': now - 31 * 86400},
+                'http://example.com/older': {
+                    'etag': '"b"', 'updated': now - 2 * 86400},
+                'http://example.com/newer': {
+                    'etag': '"c"', 'updated': now - 86400},
+            }, cache_json)
+        cache = ValidatorCache(cache_file, max_age=30, max_entries=2)
+        cache.update({TEST_URL: {'etag': '"d"'}})
+        self.assertEquals([TEST_URL, 'http://example.com/newer'],
+                          sorted(cache.load()))
+        self.assertEquals({'If-None-Match': '"d"'},
+                          cache.conditional_headers(TEST_URL))
+
+
+class StageTimingTest(TestCase):
+    """
+    Tests the per-stage instrumentation of GeoDataProcessor.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.metrics_file = os.path.join(self.tmp_dir, 'metrics.json')
+        self.processor = GeoDataProcessor(tmp_dir=self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_metrics(self):
+        with open(self.metrics_file) as metrics:
+            return [json.loads(line) for line in metrics]
+
+    def test_stage(self):
+        """
+        Verify that stage timings, bytes and rows are sent to the sinks
+        and nested stages of the same name are only counted once
+        """
+        sinks = [JSONFileSink(self.metrics_file)]
+        with patch('dataqs.metrics.get_sinks', return_value=sinks):
+            with self.processor.stage('db_load') as timing:
+                timing.rows += 10
+                with self.processor.stage('db_load') as nested:
+                    nested.rows += 5
+        self.assertEquals(1, len(self.processor.stage_timings))
+        metrics = self.get_metrics()
+        self.assertEquals(1, len(metrics))
+        self.assertEquals('GeoDataProcessor', metrics[0]['processor'])
+        self.assertEquals('db_load', metrics[0]['stage'])
+        self.assertEquals(15, metrics[0]['rows'])
+        self.assertFalse(metrics[0]['failed'])
+
+    def test_failed_stage(self):
+        """
+        Verify that a stage that raises an exception is recorded as failed
+        """
+        sinks = [JSONFileSink(self.metrics_file)]
+        with patch('dataqs.metrics.get_sinks', return_value=sinks):
+            with self.assertRaises(ValueError):
+                with self.processor.stage('convert'):
+                    raise ValueError("Bad input")
+        metrics = self.get_metrics()
+        self.assertTrue(metrics[0]['failed'])
+        self.assertIsNotNone(metrics[0]['elapsed'])
+
+
+class FileUploadTest(TestCase):
+    """
+    Tests the dataqs.helpers.file_upload and gzip_chunks functions.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.upload = os.path.join(self.tmp_dir, 'test.bin')
+        with open(self.upload, 'wb') as upload:
+            upload.write(TEST_BODY)
+        httpretty.enable()
+        httpretty.register_uri(httpretty.PUT, TEST_URL)
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_upload(self):
+        """
+        Verify that an uncompressed file is streamed with its length
+        """
+        with file_upload(self.upload, 'image/tif',
+                         compress=False) as (data, headers):
+            requests.put(TEST_URL, data=data, headers=headers)
+        request = httpretty.last_request()
+        self.assertEquals('image/tif', request.headers['Content-Type'])
+        self.assertEquals(str(len(TEST_BODY)),
+                          request.headers['Content-Length'])
+        self.assertIsNone(request.headers.get('Content-Encoding'))
+        self.assertEquals(TEST_BODY, request.body)
+
+    def test_gzip_upload(self):
+        """
+        Verify that a compressed file is streamed in chunks with gzip
+        content encoding
+        """
+        with file_upload(self.upload, 'application/zip',
+                         compress=True) as (data, headers):
+            requests.put(TEST_URL, data=data, headers=headers)
+        request = httpretty.last_request()
+        self.assertEquals('application/zip', request.headers['Content-Type'])
+        self.assertEquals('gzip', request.headers['Content-Encoding'])
+        self.assertEquals('chunked', request.headers['Transfer-Encoding'])
+        self.assertIsNone(request.headers.get('Content-Length'))
+
+    def test_gzip_chunks(self):
+        """
+        Verify that the file is read chunk by chunk and the chunks form
+        one gzip stream of its contents
+        """
+        with open(self.upload, 'rb') as upload:
+            upload = MagicMock(wraps=upload)
+            chunks = list(gzip_chunks(upload, chunk_size=1000))
+        self.assertEquals(11, upload.read.call_count)
+        upload.read.assert_called_with(1000)
+        self.assertEquals(TEST_BODY, zlib.decompress(
+            b''.join(chunks), 16 + zlib.MAX_WBITS))
+
+
+class CatalogCacheTest(TestCase):
+    """
+    Tests the dataqs.helpers.CatalogCache class.
+    """
+
+    def setUp(self):
+        patcher = patch('geoserver.catalog.Catalog')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.cache = CatalogCache(ttl=60)
+        self.key = ('style', 'test')
+
+    def test_hit(self):
+        """
+        Verify that objects found to exist are only looked up once, and
+        missing objects are looked up every time
+        """
+        lookup = MagicMock(return_value=True)
+        self.assertTrue(self.cache.exists(self.key, lookup))
+        self.assertTrue(self.cache.exists(self.key, lookup))
+        self.assertEquals(1, lookup.call_count)
+        lookup.assert_called_with(self.cache.catalog)
+
+        missing = MagicMock(return_value=False)
+        self.assertFalse(self.cache.exists(('style', 'missing'), missing))
+        self.assertFalse(self.cache.exists(('style', 'missing'), missing))
+        self.assertEquals(2, missing.call_count)
+
+    def test_expiry(self):
+        """
+        Verify that cached objects are looked up again after the TTL
+        """
+        self.cache.ttl = 0
+        lookup = MagicMock(return_value=True)
+        self.cache.exists(self.key, lookup)
+        self.cache.exists(self.key, lookup)
+        self.assertEquals(2, lookup.call_count)
+
+    def test_invalidate(self):
+        """
+        Verify that invalidated objects are looked up again, and that
+        the Catalog's own response cache is cleared
+        """
+        self.cache.add(self.key)
+        self.cache.add(('style', 'other'))
+        self.cache.catalog._cache = {'url': 'response'}
+        lookup = MagicMock(return_value=True)
+        self.cache.exists(self.key, lookup)
+        self.assertFalse(lookup.called)
+
+        self.cache.invalidate(self.key)
+        self.assertEquals({}, self.cache.catalog._cache)
+        self.cache.exists(self.key, lookup)
+        self.cache.exists(('style', 'other'), lookup)
+        self.assertEquals(1, lookup.call_count)
+
+        self.cache.invalidate()
+        self.cache.exists(('style', 'other'), lookup)
+        self.assertEquals(2, lookup.call_count)
+
+
+class PostgresPoolTest(TestCase):
+    """
+    Tests the dataqs.helpers.PostgresPool class.
+    """
+
+    def setUp(self):
+        patcher = patch('psycopg2.pool.ThreadedConnectionPool')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.pool = PostgresPool(minconn=1, maxconn=2, check_query=False)
+
+    def test_putconn_rollback(self):
+        """
+        Verify that uncommitted work is rolled back before a connection
+        is returned to the pool
+        """
+        conn = MagicMock(closed=0)
+        conn.get_transaction_status.return_value = \
+            extensions.TRANSACTION_STATUS_INTRANS
+        self.pool.putconn(conn)
+        conn.rollback.assert_called_once_with()
+        self.pool.pool.putconn.assert_called_once_with(conn, close=False)
+
+    def test_broken_connection(self):
+        """
+        Verify that closed connections are discarded on checkout
+        """
+        broken, healthy = MagicMock(closed=1), MagicMock(closed=0)
+        self.pool.pool.getconn.side_effect = [broken, healthy]
+        self.assertIs(healthy, self.pool.getconn())
+        self.pool.pool.putconn.assert_called_once_with(broken, close=True)
+
+    def test_lost_connection(self):
+        """
+        Verify that connections in an unknown state are discarded without
+        running a test query
+        """
+        lost, healthy = MagicMock(closed=0), MagicMock(closed=0)
+        lost.get_transaction_status.return_value = \
+            extensions.TRANSACTION_STATUS_UNKNOWN
+        healthy.get_transaction_status.return_value = \
+            extensions.TRANSACTION_STATUS_IDLE
+        self.pool.pool.getconn.side_effect = [lost, healthy]
+        self.assertIs(healthy, self.pool.getconn())
+        self.pool.pool.putconn.assert_called_once_with(lost, close=True)
+        self.assertFalse(healthy.cursor.called)
+
+
+class CopyStreamTest(TestCase):
+    """
+    Tests the dataqs.helpers.CopyStream class.
+    """
+
+    def test_read(self):
+        """
+        Verify that rows are served in COPY text format, in any read size
+        """
+        rows = [(1, u'caf\xe9', None), (2, 'tab\there', 'back\\slash')]
+        expected = '1\tcaf\xc3\xa9\t\\N\n2\ttab\\there\tback\\\\slash\n'
+        self.assertEquals(expected, CopyStream(rows).read())
+        stream = CopyStream(rows)
+        chunks = iter(lambda: stream.read(5), '')
+        self.assertEquals(expected, ''.join(chunks))
+        self.assertEquals(2, stream.count)
+
+    def test_float_precision(self):
+        """
+        Verify that floats are written with full precision
+        """
+        for value in (0.1234567890123456, -71.06123456789012, 1e-20):
+            self.assertEquals(value, float(copy_value(value)))
+        self.assertEquals('0.1', copy_value(0.1))
+
+
+class HostRateLimiterTest(TestCase):
+    """
+    Tests the dataqs.helpers.HostRateLimiter class.
+    """
+
+    def test_acquire(self):
+        """
+        Verify that requests to a host are limited to the burst size and
+        then to the rate, independently of other hosts
+        """
+        limiter = HostRateLimiter(20, capacity=2)
+        start = time.time()
+        limiter.acquire('a.example.com')
+        limiter.acquire('a.example.com')
+        limiter.acquire('b.example.com')
+        self.assertLess(time.time() - start, 0.05)
+        limiter.acquire('a.example.com')
+        limiter.acquire('a.example.com')
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+def create_test_raster(filename, bands=3, width=20, height=10):
+    """
+    Write a small EPSG:4326 GeoTIFF whose band n is filled with
+    n * 100 + the pixel number
+    """
+    ds = gdal.GetDriverByName('GTiff').Create(
+        filename, width, height, bands, gdal.GDT_Int16)
+    ds.SetGeoTransform((-10.0, 1.0, 0, 5.0, 0, -1.0))
+    ds.SetProjection('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",'
+                     '6378137,298.257223563]],PRIMEM["Greenwich",0],'
+                     'UNIT["degree",0.0174532925199433],'
+                     'AUTHORITY["EPSG","4326"]]')
+    pixels = numpy.arange(width * height).reshape(height, width)
+    for band in range(1, bands + 1):
+        ds.GetRasterBand(band).WriteArray(pixels + band * 100)
+        ds.GetRasterBand(band).SetNoDataValue(-band)
+    ds = None
+
+
+class BandSubsetTest(TestCase):
+    """
+    Tests the dataqs.helpers.band_subset_vrt and gdal_band_subset functions.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_file = os.path.join(self.tmp_dir, 'bands.tif')
+        create_test_raster(self.src_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertSubset(self, src_ds, dst_ds, bands):
+        self.assertEquals(len(bands), dst_ds.RasterCount)
+        self.assertEquals(src_ds.GetGeoTransform(), dst_ds.GetGeoTransform())
+        self.assertEquals(src_ds.GetProjection(), dst_ds.GetProjection())
+        for i, band in enumerate(bands):
+            src_band = src_ds.GetRasterBand(band)
+            dst_band = dst_ds.GetRasterBand(i + 1)
+            self.assertTrue(numpy.array_equal(src_band.ReadAsArray(),
+                                              dst_band.ReadAsArray()))
+            self.assertEquals(src_band.GetNoDataValue(),
+                              dst_band.GetNoDataValue())
+            self.assertEquals(src_band.DataType, dst_band.DataType)
+
+    def test_band_subset_vrt(self):
+        """
+        Verify that the virtual dataset exposes the selected bands in
+        order, with the georeferencing and nodata values of the source
+        """
+        src_ds = gdal.Open(self.src_file)
+        self.assertSubset(src_ds, band_subset_vrt(src_ds, [3, 1]), [3, 1])
+
+    def test_gdal_band_subset(self):
+        """
+        Verify that the selected bands are copied to a new image
+        """
+        dst_file = os.path.join(self.tmp_dir, 'subset.tif')
+        gdal_band_subset(self.src_file, [2], dst_file)
+        self.assertSubset(gdal.Open(self.src_file), gdal.Open(dst_file), [2])
+
+
+class WarpWindowsTest(TestCase):
+    """
+    Tests the dataqs.helpers.warp_windows function.
+    """
+
+    def test_windows(self):
+        """
+        Verify that windows cover the image in whole tile rows within
+        the memory limit
+        """
+        windows = list(warp_windows(4096, 5000, 1, 'float32', 16,
+                                    block_size=256))
+        self.assertEquals((0, 1024), windows[0][0])
+        self.assertEquals((0, 4096), windows[0][1])
+        self.assertEquals(5000, windows[-1][0][1])
+        self.assertEquals(5, len(windows))
+        # Windows are never smaller than one row of tiles
+        windows = list(warp_windows(4096, 500, 4, 'float64', 1,
+                                    block_size=256))
+        self.assertEquals([(0, 256), (256, 500)], [w[0] for w in windows])
+
+
+class WarpIndexTest(TestCase):
+    """
+    Tests the dataqs.helpers.get_warp_index and warp_image_indexed
+    functions.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'warp_index')
+        self.src_file = os.path.join(self.tmp_dir, 'src.tif')
+        create_test_raster(self.src_file, bands=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache(self):
+        """
+        Verify that the index map is computed once and then loaded from
+        the cache directory
+        """
+        import rasterio
+        with rasterio.open(self.src_file) as src:
+            with patch('dataqs.helpers.build_warp_index',
+                       wraps=build_warp_index) as build:
+                transform, index = get_warp_index(
+                    src, 'EPSG:3857', cache_dir=self.cache_dir)
+                cached_transform, cached_index = get_warp_index(
+                    src, 'EPSG:3857', cache_dir=self.cache_dir)
+                self.assertEquals(1, build.call_count)
+        self.assertEquals(1, len(os.listdir(self.cache_dir)))
+        self.assertEquals(tuple(transform)[:6], tuple(cached_transform)[:6])
+        self.assertTrue(numpy.array_equal(index, cached_index))
+
+    def test_indexed_warp(self):
+        """
+        Verify that the indexed warp produces the same image as a
+        nearest-neighbour reprojection
+        """
+        warped_file = os.path.join(self.tmp_dir, 'warped.tif')
+        indexed_file = os.path.join(self.tmp_dir, 'indexed.tif')
+        warp_image(self.src_file, warped_file, resampling='nearest')
+        warp_image(self.src_file, indexed_file, resampling='nearest',
+                   index_cache=self.cache_dir)
+        warped = gdal.Open(warped_file)
+        indexed = gdal.Open(indexed_file)
+        self.assertEquals(warped.GetGeoTransform(), indexed.GetGeoTransform())
+        self.assertEquals(warped.RasterXSize, indexed.RasterXSize)
+        self.assertEquals(warped.RasterYSize, indexed.RasterYSize)
+        for band in (1, 2):
+            expected = warped.GetRasterBand(band).ReadAsArray()
+            actual = indexed.GetRasterBand(band).ReadAsArray()
+            # Compare pixels that map to the source image; the warper
+            # leaves the rest of the output as it was created
+            inside = expected != 0
+            self.assertTrue(inside.any())
+            self.assertTrue(numpy.array_equal(expected[inside],
+                                              actual[inside]))
+
+
+class VectorLoadTest(TestCase):
+    """
+    Tests the dataqs.helpers.ogr2ogr_load function.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, 'points.json')
+        with open(self.source, 'w') as source:
+            json.dump({'type': 'FeatureCollection', 'features': [{
+                'type': 'Feature',
+                'properties': {'id': i},
+                'geometry': {'type': 'Point', 'coordinates': [i, i]}
+            } for i in range(10)]}, source)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load(self):
+        """
+        Verify that features are counted and messages are passed to the
+        progress callback instead of stdout
+        """
+        target = os.path.join(self.tmp_dir, 'points.csv')
+        messages = []
+        result = ogr2ogr_load(
+            self.source, 'points', target=target, target_format='CSV',
+            mode='create', progress=lambda pct, msg: messages.append(pct))
+        self.assertEquals(10, result.features_written)
+        self.assertEquals(0, result.features_failed)
+        self.assertTrue(result.elapsed >= 0)
+        self.assertIn(1.0, messages)
+
+    @skipUnless(hasattr(gdal, 'VectorTranslate'),
+                "gdal.VectorTranslate requires GDAL 2.1+")
+    def test_ogr2ogr_port(self):
+        """
+        Verify that the ogr2ogr port writes the same output and counts as
+        VectorTranslate
+        """
+        outputs = []
+        results = []
+        for use_vector_translate in (True, False):
+            target = os.path.join(self.tmp_dir, 'points{}.csv'.format(
+                len(outputs)))
+            with patch('dataqs.helpers.OGR_USE_VECTOR_TRANSLATE',
+                       use_vector_translate):
+                results.append(ogr2ogr_load(
+                    self.source, 'points', target=target,
+                    target_format='CSV', mode='create'))
+            with open(target) as output:
+                outputs.append(output.read())
+        self.assertEquals(outputs[0], outputs[1])
+        self.assertEquals(results[0][:2], results[1][:2])
+
+    def test_concurrent_loads(self):
+        """
+        Verify that loads with the ogr2ogr port run in several threads
+        count only their own features
+        """
+        results = {}
+
+        def load(i):
+            target = os.path.join(self.tmp_dir, 'points{}.csv'.format(i))
+            results[i] = ogr2ogr_load(
+                self.source, 'points', target=target, target_format='CSV',
+                mode='create', skip_failures=i % 2 == 0)
+
+        with patch('dataqs.helpers.OGR_USE_VECTOR_TRANSLATE', False):
+            threads = [threading.Thread(target=load, args=(i,))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEquals([10] * 4, [results[i].features_written
+                                     for i in range(4)])
+
+    def bulk_load(self, table_exists, **kwargs):
+        """
+        Run a bulk load into the datastore with a mock translation and
+        return the translation options, the PG_USE_COPY configuration
+        option during the translation and the finish_bulk_load mock
+        """
+        loads = []
+
+        def translate(*args):
+            loads.append((args[9], gdal.GetConfigOption('PG_USE_COPY')))
+            return 10, 0
+
+        with patch('dataqs.helpers.OGR_USE_VECTOR_TRANSLATE', False), \
+                patch('dataqs.helpers.ogr2ogr_translate',
+                      side_effect=translate), \
+                patch('dataqs.helpers.table_exists',
+                      return_value=table_exists), \
+                patch('dataqs.helpers.ogr_pg_target',
+                      return_value='PG:dbname=test'), \
+                patch('dataqs.helpers.finish_bulk_load') as finish:
+            result = ogr2ogr_load(self.source, 'points', bulk=True,
+                                  options=['-nln', 'points'], **kwargs)
+        self.assertEquals(10, result.features_written)
+        self.assertEquals(1, len(loads))
+        options, use_copy = loads[0]
+        return options, use_copy, finish
+
+    def test_bulk_new_table(self):
+        """
+        Verify that bulk loads into a new table use COPY and large
+        transactions, and create the spatial index after the load
+        """
+        options, use_copy, finish = self.bulk_load(False)
+        self.assertEquals(['-gt', str(OGR_PG_GROUP_TRANSACTIONS),
+                           '-lco', 'SPATIAL_INDEX=NO', '-nln', 'points'],
+                          options)
+        self.assertEquals('YES', use_copy)
+        self.assertIsNone(gdal.GetConfigOption('PG_USE_COPY'))
+        finish.assert_called_once_with('points', spatial_index=True,
+                                       analyze=True)
+
+    def test_bulk_existing_table(self):
+        """
+        Verify that bulk loads into an existing table keep its spatial
+        index and only analyze it afterwards
+        """
+        options, use_copy, finish = self.bulk_load(True)
+        self.assertEquals(['-gt', str(OGR_PG_GROUP_TRANSACTIONS),
+                           '-nln', 'points'], options)
+        self.assertEquals('YES', use_copy)
+        finish.assert_called_once_with('points', spatial_index=False,
+                                       analyze=True)
+
+    def test_bulk_without_index(self):
+        """
+        Verify that no spatial index is created or analyzed when neither
+        is requested
+        """
+        options, use_copy, finish = self.bulk_load(
+            False, spatial_index=False, analyze=False)
+        self.assertIn('SPATIAL_INDEX=NO', options)
+        self.assertFalse(finish.called)
+
+    def test_global_config_option(self):
+        """
+        Verify that configuration options are set one block at a time and
+        restored when GDAL has no thread-local options
+        """
+        options = {}
+        fake_gdal = MagicMock(spec=['GetConfigOption', 'SetConfigOption'])
+        fake_gdal.GetConfigOption.side_effect = \
+            lambda name, default: options.get(name, default)
+        fake_gdal.SetConfigOption.side_effect = \
+            lambda name, value: options.__setitem__(name, value)
+        inside = threading.Event()
+        release = threading.Event()
+        seen = []
+
+        def hold():
+            with gdal_config_option('PG_USE_COPY', 'YES'):
+                inside.set()
+                release.wait(5)
+
+        def load():
+            with gdal_config_option('PG_USE_COPY', 'NO'):
+                seen.append(options['PG_USE_COPY'])
+
+        with patch('dataqs.helpers.get_gdal', return_value=fake_gdal):
+            holder = threading.Thread(target=hold)
+            holder.start()
+            inside.wait(5)
+            loader = threading.Thread(target=load)
+            loader.start()
+            loader.join(0.2)
+            # The second block waits until the first one is finished
+            self.assertEquals([], seen)
+            self.assertEquals('YES', options['PG_USE_COPY'])
+            release.set()
+            holder.join()
+            loader.join()
+        self.assertEquals(['NO'], seen)
+        self.assertIsNone(options['PG_USE_COPY'])
+
+    def test_bulk_other_target(self):
+        """
+        Verify that the bulk profile only applies to the datastore
+        """
+        target = os.path.join(self.tmp_dir, 'points.csv')
+        with patch('dataqs.helpers.finish_bulk_load') as finish:
+            ogr2ogr_load(self.source, 'points', target=target,
+                         target_format='CSV', mode='create', bulk=True)
+        self.assertFalse(finish.called)
+        with open(target) as output:
+            self.assertEquals(11, len(output.read().splitlines()))
+
+
+class VectorMergeTest(TestCase):
+    """
+    Tests the dataqs.helpers.ogr2ogr_merge function.
+    """
+
+    def setUp(self):
+        self.cursor = MagicMock(rowcount=3)
+        self.cursor.fetchall.side_effect = [
+            [('ogc_fid',), ('ids',), ('mag',), ('wkb_geometry',)],
+            [('ogc_fid', 'integer'), ('ids', 'character varying(64)'),
+             ('mag', 'double precision'), ('place', 'text'),
+             ('wkb_geometry', 'geometry(Point,4326)')]
+        ]
+        patchers = [
+            patch('dataqs.helpers.ogr2ogr_load',
+                  return_value=VectorLoadResult(5, 0, 0, 0.1)),
+            patch('dataqs.helpers.postgres_transaction'),
+            patch('dataqs.helpers.postgres_query'),
+            patch('dataqs.helpers.finish_bulk_load')
+        ]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        self.load, transaction, self.query, self.finish = [
+            patcher.start() for patcher in patchers]
+        transaction.return_value.__enter__.return_value = self.cursor
+
+    def test_merge(self):
+        """
+        Verify that staged features are deduplicated on the key, cast to
+        the table's column types and inserted with a single statement
+        """
+        result = ogr2ogr_merge('quakes.json', 'quakes', 'ids', bulk=True)
+        insert_sql = self.cursor.execute.call_args[0][0]
+        self.assertIn('INSERT INTO "quakes" ("ids","mag","wkb_geometry")',
+                      insert_sql)
+        self.assertIn('SELECT DISTINCT ON (s."ids")', insert_sql)
+        self.assertIn('CAST(s."mag" AS double precision)', insert_sql)
+        self.assertIn('WHERE t."ids" = s."ids"', insert_sql)
+        self.assertIn('ON CONFLICT DO NOTHING', insert_sql)
+        self.assertEquals((3, 0, 2), result[:3])
+        self.finish.assert_called_once_with('quakes', spatial_index=False)
+
+    def test_staging_table(self):
+        """
+        Verify that the staging table is named as OGR launders it, loaded
+        without ANALYZE, quoted in every statement and dropped
+        """
+        ogr2ogr_merge('quakes.json', 'Quakes-Archive', 'ids')
+        staging = self.load.call_args[0][1]
+        self.assertRegexpMatches(staging, r'^quakes_archive_staging_[0-9a-f]+$')
+        self.assertEquals(False, self.load.call_args[1]['analyze'])
+        self.assertEquals(True, self.load.call_args[1]['bulk'])
+        self.assertEquals(('"{}"'.format(staging),),
+                          self.cursor.execute.call_args_list[0][0][1])
+        self.assertIn('FROM "{}" s'.format(staging),
+                      self.cursor.execute.call_args[0][0])
+        self.query.assert_called_once_with(
+            'DROP TABLE IF EXISTS "{}"'.format(staging), commit=True)
+
+    def test_failed_load(self):
+        """
+        Verify that the staging table is dropped if the staging load fails
+        """
+        self.load.side_effect = Exception('load failed')
+        self.assertRaises(Exception, ogr2ogr_merge, 'quakes.json', 'quakes',
+                          'ids')
+        staging = self.load.call_args[0][1]
+        self.query.assert_called_once_with(
+            'DROP TABLE IF EXISTS "{}"'.format(staging), commit=True)
+        self.assertFalse(self.cursor.execute.called)
+
+
+class GeoNodeSyncTest(TestCase):
+    """
+    Tests the GeoDataProcessor.update_geonode method.
+    """
+
+    def setUp(self):
+        patchers = [patch('geonode.layers.models.Layer'),
+                    patch('dataqs.processor_base.gs_catalog_cache')]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        layer_model, catalog_cache = [p.start() for p in patchers]
+        self.layers = layer_model.objects.filter.return_value
+        self.layers.exists.return_value = True
+        self.layers.values.return_value.first.return_value = {
+            'title': 'Floods - 2016-01-01', 'bbox_x0': '-180.0',
+            'bbox_x1': '180.0', 'bbox_y0': '-90.0', 'bbox_y1': '90.0',
+            'srid': 'EPSG:4326'}
+        self.catalog = catalog_cache.catalog
+        self.processor = GeoDataProcessor()
+
+    def test_unchanged(self):
+        """
+        Verify that GeoServer is not called if the title and bounds are
+        unchanged
+        """
+        self.processor.update_geonode(
+            'floods', title='Floods - 2016-01-01',
+            bounds=(-180, 180, -90, 90, 'EPSG:4326'))
+        self.assertFalse(self.catalog.get_resource.called)
+        self.assertFalse(self.catalog.save.called)
+
+    def test_changed_title(self):
+        """
+        Verify that only a changed title is saved to GeoServer
+        """
+        resource = self.catalog.get_resource.return_value
+        resource.native_bbox = None
+        self.processor.update_geonode(
+            'floods', title='Floods - 2016-01-02',
+            bounds=('-180.0', '180.0', '-90.0', '90.0', 'EPSG:4326'))
+        self.assertEquals('Floods - 2016-01-02', resource.title)
+        self.assertIsNone(resource.native_bbox)
+        self.catalog.save.assert_called_once_with(resource)
+
+
+class MosaicGranuleTest(TestCase):
+    """
+    Tests the GeoDataMosaicProcessor.remove_mosaic_granules method.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.processor = GeoDataMosaicProcessor(tmp_dir=self.tmp_dir)
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, MOSAIC_URL + '.json',
+                               body=json.dumps(GRANULES))
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_removed_times(self):
+        """
+        Verify that the times of the removed granules are returned, so
+        that their cached tiles can be truncated
+        """
+        httpretty.register_uri(httpretty.DELETE, MOSAIC_URL, status=200)
+        times = self.processor.remove_mosaic_granules(
+            MOSAIC_URL, 'ingestion<2016-01-03T00:00:00.000Z', 'test')
+        self.assertEquals(['2016-01-01T12:00:00.000Z',
+                           '2016-01-02T12:00:00.000Z'], times)
+
+    def test_filtered_delete(self):
+        """
+        Verify that granules are removed with a single filtered DELETE,
+        along with their image files
+        """
+        httpretty.register_uri(httpretty.DELETE, MOSAIC_URL, status=200)
+        query = 'ingestion<2016-01-03T00:00:00.000Z'
+        with patch('dataqs.processor_base.remove_file') as remove_file:
+            self.processor.remove_mosaic_granules(MOSAIC_URL, query, 'test')
+        deletes = [r for r in httpretty.HTTPretty.latest_requests
+                   if r.method == 'DELETE']
+        self.assertEquals(1, len(deletes))
+        self.assertEquals([query], deletes[0].querystring['filter'])
+        self.assertEquals(
+            ['test_20160101T120000000Z.tif', 'test_20160102T120000000Z.tif'],
+            sorted(os.path.basename(call[0][0])
+                   for call in remove_file.call_args_list))
+
+    def test_granule_delete_fallback(self):
+        """
+        Verify that granules are deleted one by one if GeoServer does not
+        support filtered deletes
+        """
+        httpretty.register_uri(httpretty.DELETE, MOSAIC_URL, status=405)
+        for i in (1, 2):
+            httpretty.register_uri(httpretty.DELETE,
+                                   '{}/test.{}'.format(MOSAIC_URL, i),
+                                   status=200)
+        with patch('dataqs.processor_base.remove_file') as remove_file:
+            self.processor.remove_mosaic_granules(
+                MOSAIC_URL, 'ingestion<2016-01-03T00:00:00.000Z', 'test')
+        deleted = sorted(r.path.split('?')[0]
+                         for r in httpretty.HTTPretty.latest_requests
+                         if r.method == 'DELETE')
+        self.assertEquals(3, len(deleted))
+        self.assertTrue(deleted[1].endswith('/granules/test.1'))
+        self.assertTrue(deleted[2].endswith('/granules/test.2'))
+        self.assertEquals(2, remove_file.call_count)
+
+    def test_no_granules(self):
+        """
+        Verify that nothing is deleted if no granules match the query
+        """
+        httpretty.register_uri(httpretty.GET, MOSAIC_URL + '.json',
+                               body=json.dumps({'features': []}))
+        self.assertEquals([], self.processor.remove_mosaic_granules(
+            MOSAIC_URL, 'ingestion<2000-01-01T00:00:00.000Z', 'test'))
+        self.assertEquals('GET', httpretty.last_request().method)
+
+
+class GWCSeedTest(TestCase):
+    """
+    Tests the GeoDataProcessor GeoWebCache seeding methods.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.processor = GeoDataProcessor(tmp_dir=self.tmp_dir)
+        httpretty.enable()
+        httpretty.register_uri(httpretty.POST, SEED_URL, status=200)
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+        shutil.rmtree(self.tmp_dir)
+
+    def register_tasks(self, *statuses):
+        """
+        Register successive responses of the GWC task status request, one
+        running task per status of 1
+        """
+        httpretty.register_uri(httpretty.GET, SEED_URL, responses=[
+            httpretty.Response(body=json.dumps({'long-array-array': [
+                [10, 100, 5, 1, status]]})) for status in statuses])
+
+    def seed_requests(self):
+        return [json.loads(r.body)['seedRequest']
+                for r in httpretty.HTTPretty.latest_requests
+                if r.method == 'POST']
+
+    def test_seed_config(self):
+        """
+        Verify that the GWC_SEED_CONFIG setting overrides the processor's
+        seeding options
+        """
+        self.processor.seed_config = {
+            'test': {'zoomStop': 4, 'threadCount': 1}}
+        with patch('dataqs.processor_base.GWC_SEED_CONFIG',
+                   {'test': {'zoomStop': 8}}):
+            self.assertEquals({'zoomStop': 8, 'threadCount': 1},
+                              self.processor.get_seed_config('test'))
+            self.assertEquals({}, self.processor.get_seed_config('other'))
+
+    def test_not_seeded(self):
+        """
+        Verify that layers without seeding options are not seeded
+        """
+        self.processor.seed_gs_cache('test', times=['2016-01-01'])
+        self.assertEquals([], httpretty.HTTPretty.latest_requests)
+
+    def test_seed(self):
+        """
+        Verify that the default and latest time are seeded with the
+        configured options
+        """
+        self.processor.seed_config = {'test': {
+            'zoomStart': 1, 'zoomStop': 4, 'gridSetId': 'EPSG:4326',
+            'format': 'image/jpeg', 'threadCount': 1, 'wait': False}}
+        self.processor.seed_gs_cache('test', times=[
+            '2016-01-02T12:00:00.000Z', '2016-01-01T12:00:00.000Z'])
+        default, latest = self.seed_requests()
+        self.assertEquals({
+            'name': 'geonode:test', 'gridSetId': 'EPSG:4326',
+            'zoomStart': 1, 'zoomStop': 4, 'format': 'image/jpeg',
+            'type': 'seed', 'threadCount': 1}, default)
+        self.assertEquals(
+            {'entry': [{'string': ['TIME', '2016-01-02T12:00:00.000Z']}]},
+            latest.pop('parameters'))
+        self.assertEquals(default, latest)
+        self.assertEquals('POST', httpretty.last_request().method)
+
+    def test_seed_wait(self):
+        """
+        Verify that seeding waits for the GWC tasks by default
+        """
+        self.processor.seed_config = {'test': {'latest_time': False}}
+        self.register_tasks(1, 2)
+        with patch('dataqs.processor_base.sleep') as sleep:
+            self.processor.seed_gs_cache('test', times=['2016-01-01'])
+        self.assertEquals(1, len(self.seed_requests()))
+        self.assertNotIn('parameters', self.seed_requests()[0])
+        sleep.assert_called_once_with(GWC_SEED_POLL_INTERVAL)
+
+    def test_wait(self):
+        """
+        Verify that the task status is polled until no task is pending or
+        running
+        """
+        self.register_tasks(0, 1, 2)
+        with patch('dataqs.processor_base.sleep') as sleep:
+            self.assertTrue(self.processor.wait_for_gwc_tasks(
+                'test', interval=3))
+        self.assertEquals(2, sleep.call_count)
+        sleep.assert_called_with(3)
+        self.assertEquals(3, len(httpretty.HTTPretty.latest_requests))
+
+    def test_wait_timeout(self):
+        """
+        Verify that waiting stops once the timeout has passed
+        """
+        self.register_tasks(1)
+        with patch('dataqs.processor_base.sleep') as sleep, \
+                patch('dataqs.processor_base.time',
+                      side_effect=[0, 5, 11]):
+            self.assertFalse(self.processor.wait_for_gwc_tasks(
+                'test', timeout=10, interval=3))
+        sleep.assert_called_once_with(3)
+        self.assertEquals(2, len(httpretty.HTTPretty.latest_requests))
+
+
+class ImportTimeTest(TestCase):
+    """
+    Tests that processor modules do not load raster and database
+    libraries when imported.
+    """
+
+    # Import time budget in seconds
+    budget = 1.0
+    heavy_modules = ('osgeo', 'rasterio', 'numpy', 'psycopg2',
+                     'dataqs.ogr2ogr')
+
+    def import_module(self, module):
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT, module])
+        return json.loads(output.splitlines()[-1])
+
+    def test_import_time(self):
+        """
+        Verify that dataqs.helpers and a vector-only processor import within
+        the budget without loading GDAL, rasterio, numpy or psycopg2
+        """
+        for module in ('dataqs.helpers', 'dataqs.gdacs.gdacs'):
+            result = self.import_module(module)
+            loaded = [name for name in result['modules']
+                      if name.split('.')[0] in self.heavy_modules or
+                      name in self.heavy_modules]
+            self.assertEquals([], loaded)
+            self.assertLess(result['elapsed'], self.budget)
@@ -6,8 +6,8 @@ import datetime
 import logging
 from django.db import connections
 from dataqs.processor_base import GeoDataProcessor, DEFAULT_WORKSPACE
-from dataqs.helpers import postgres_query, ogr2ogr_exec, layer_exists, \
-    style_exists
+from dataqs.helpers import postgres_query, ogr2ogr_load, layer_exists, \
+    style_exists, expand_bbox
 from geonode.geoserver.helpers import ogc_server_settings
 
 logger = logging.getLogger("dataqs.processors")
@@ -47,17 +47,27 @@ class USGSQuakeProcessor(GeoDataProcessor):
     def purge_old_data(self):
         """
         Remove old data from weekly, monthly, and yearly PostGIS tables
+        :return: dict of table name: (minx, miny, maxx, maxy) extent of
+        the removed data
         """
         today = datetime.date.today()
         last_week = (today - datetime.timedelta(days=7)).strftime("%Y-%m-%d")
         last_month = (today - datetime.timedelta(days=30)).strftime("%Y-%m-%d")
         last_year = (today - datetime.timedelta(days=365)).strftime("%Y-%m-%d")
 
+        purged = {}
         for interval, table in zip([last_week, last_month, last_year],
                                    self.tables):
-            postgres_query(
-                "DELETE FROM {} where CAST(time as timestamp) < '{}';".format(
-                    table, interval), commit=True)
+            extent = postgres_query(
+                "WITH purged AS (DELETE FROM {} "
+                "where CAST(time as timestamp) < '{}' "
+                "RETURNING wkb_geometry) "
+                "SELECT ST_XMin(ext), ST_YMin(ext), ST_XMax(ext), ST_YMax(ext) "
+                "FROM (SELECT ST_Extent(wkb_geometry) AS ext FROM purged) e;"
+                .format(table, interval), commit=True, returnable=True)
+            if extent and extent[0][0] is not None:
+                purged[table] = extent[0]
+        return purged
 
     def run(self, rss_file=None):
         """
@@ -72,9 +82,12 @@ class USGSQuakeProcessor(GeoDataProcessor):
             rss_file = os.path.join(self.tmp_dir, rss)
 
         json_data = None
+        bbox = None
         with open(rss_file) as json_file:
             json_data = json.load(json_file)
             for feature in json_data['features']:
+                lon, lat = feature['geometry']['coordinates'][:2]
+                bbox = expand_bbox(bbox, lon, lat)
                 time_original = datetime.datetime.utcfromtimestamp(
                     feature['properties']['time']/1000)
                 updated_original = datetime.datetime.utcfromtimestamp(
@@ -86,13 +99,10 @@ class USGSQuakeProcessor(GeoDataProcessor):
         with open(rss_file, 'w') as modified_file:
             json.dump(json_data, modified_file)
 
-        db = ogc_server_settings.datastore_db
         for table, title in zip(self.tables, self.titles):
-            ogr2ogr_exec("-append -skipfailures -f PostgreSQL \
-                \"PG:host={db_host} user={db_user} password={db_pass} \
-                dbname={db_name}\" {rss} -nln {table}".format(
-                db_host=db["HOST"], db_user=db["USER"], db_pass=db["PASSWORD"],
-                db_name=db["NAME"], rss="{}".format(rss_file), table=table))
+            with self.stage('db_load') as timing:
+                result = ogr2ogr_load(rss_file, table, key='ids', bulk=True)
+                timing.rows += result.features_written
             datastore = ogc_server_settings.server.get('DATASTORE')
             if not layer_exists(table, datastore, DEFAULT_WORKSPACE):
                 c = connections[datastore].cursor()
@@ -109,8 +119,17 @@ class USGSQuakeProcessor(GeoDataProcessor):
             self.update_geonode(table,
                                 title="Earthquakes - {}".format(title),
                                 store=datastore)
-            self.truncate_gs_cache(table)
-        self.purge_old_data()
+        purged = self.purge_old_data()
+        for table in self.tables:
+            # Only truncate tiles covering new or removed earthquakes
+            table_bbox = bbox
+            if table in purged:
+                minx, miny, maxx, maxy = purged[table]
+                table_bbox = expand_bbox(table_bbox, minx, miny)
+                table_bbox = expand_bbox(table_bbox, maxx, maxy)
+            if table_bbox:
+                self.truncate_gs_cache(table, bbox=table_bbox)
+                self.seed_gs_cache(table)
         self.cleanup()
 
 
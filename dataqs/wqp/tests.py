@@ -78,6 +78,21 @@ class WaterQualityTest(TestCase):
                           self.processor.safe_name(
                               'Temperature, water'))
 
+    def test_indicator_rows(self):
+        """
+        Verify that measurement dates are combined with their time and
+        time zone, and empty values are converted to None
+        """
+        data = get_mock_response('test_wqp_ph_Result.csv').splitlines()
+        reader = csv.reader(data)
+        headers = [x.replace('/', '_') for x in next(reader)]
+        start_idx = headers.index('ActivityStartDate')
+        for row in self.processor.indicator_rows(reader, headers):
+            self.assertEquals(len(headers), len(row))
+            self.assertNotIn('', row)
+            if row[start_idx]:
+                self.assertEquals(3, len(row[start_idx].split(' ')))
+
     def test_cleanup(self):
         """
         Verify that no stray files exist after cleanup
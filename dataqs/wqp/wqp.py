@@ -5,8 +5,9 @@ import os
 import datetime
 import re
 import requests
-from dataqs.helpers import postgres_query, ogr2ogr_exec, \
+from dataqs.helpers import postgres_query, bulk_upsert, ogr2ogr_load, \
     table_exists, purge_old_data, layer_exists, style_exists
+from dataqs.metrics import instrumented
 from dataqs.processor_base import GeoDataProcessor, DEFAULT_WORKSPACE
 import unicodecsv as csv
 from geonode.geoserver.helpers import ogc_server_settings
@@ -47,6 +48,7 @@ class WaterQualityPortalProcessor(GeoDataProcessor):
         if 'days_to_keep' in kwargs.keys():
             self.days_to_keep = kwargs['days_to_keep']
 
+    @instrumented('db_load')
     def update_station_table(self, csvfile):
         """
         Insert data on water quality monitoring stations
@@ -68,18 +70,14 @@ class WaterQualityPortalProcessor(GeoDataProcessor):
         station_table = self.station_table
         needs_index = not table_exists(station_table)
 
-        db = ogc_server_settings.datastore_db
         vrt_file = os.path.join(self.tmp_dir, csvfile.replace('.csv', '.vrt'))
         csv_name = os.path.basename(csvfile).replace(".csv", "")
         if not os.path.exists(vrt_file):
             with open(vrt_file, 'w') as vrt:
                 vrt.write(vrt_content.format(
                     name=csv_name, csv=os.path.join(self.tmp_dir, csvfile)))
-        ogr2ogr_exec("-append -skipfailures -f PostgreSQL \
-            \"PG:host={db_host} user={db_user} password={db_pass} \
-            dbname={db_name}\" {vrt} -nln {table}".format(
-            db_host=db["HOST"], db_user=db["USER"], db_pass=db["PASSWORD"],
-            db_name=db["NAME"], vrt="{}".format(vrt_file), table=station_table))
+        ogr2ogr_load(vrt_file, station_table,
+                     key='monitoringlocationidentifier', bulk=True)
         if needs_index:
             sql = 'ALTER TABLE {} '.format(station_table) + \
                   'ADD CONSTRAINT monitoringlocationidentifier_key ' + \
@@ -97,6 +95,29 @@ class WaterQualityPortalProcessor(GeoDataProcessor):
                                'resources/create_table.sql')) as sql:
             postgres_query(sql.read().format(tablename=indicator), commit=True)
 
+    def indicator_rows(self, csvreader, headers):
+        """
+        Clean up measurement rows from a csv file for loading into
+        an indicator database table.
+        :param csvreader: csv reader positioned after the header row
+        :param headers: list of column names
+        :return: generator of rows
+        """
+        date_cols = ("ActivityStartDate", "ActivityEndDate")
+        for row in csvreader:
+            for i, val in enumerate(row):
+                attribute = headers[i]
+                if attribute in date_cols and val:
+                    time_idx = headers.index('{}_Time'.format(
+                        attribute.replace("Date", "Time")))
+                    zone_idx = headers.index('{}_TimeZoneCode'.format(
+                        attribute.replace("Date", "Time")))
+                    row[i] = "{} {} {}".format(
+                        val, row[time_idx], row[zone_idx])
+                elif not val or val == '.' or val == 'None':
+                    row[i] = None
+            yield row
+
     def update_indicator_table(self, csvfile):
         """
         Insert water quality measurement data from a csv file
@@ -110,39 +131,14 @@ class WaterQualityPortalProcessor(GeoDataProcessor):
             self.create_indicator_table(indicator)
         with open(os.path.join(self.tmp_dir, csvfile), 'r') as csvin:
             csvreader = csv.reader(csvin)
-            headers = None
-            for row in csvreader:
-                if not headers:
-                    headers = ['"{}"'.format(x.replace('/', '_')) for x in row]
-                else:
-                    insert_sql = 'INSERT INTO "{}" ({}) SELECT \n'.format(
-                        indicator,
-                        ','.join(headers)
-                    )
-                    query_format = []
-                    for i, val in enumerate(row):
-                        attribute = headers[i].strip('"')
-                        id_idx = headers.index('"ActivityIdentifier"')
-                        query_format.append("%s")
-                        if attribute in date_cols and val:
-                            time_idx = headers.index(
-                                '"{}_Time"'.format(
-                                    attribute.replace("Date", "Time")))
-                            zone_idx = headers.index(
-                                '"{}_TimeZoneCode"'.format(
-                                    attribute.replace("Date", "Time")))
-                            time_str = "{} {} {}".format(
-                                val, row[time_idx], row[zone_idx])
-                            row[i] = time_str
-                        else:
-                            if not val or val == '.' or val == 'None':
-                                row[i] = None
-                    insert_sql += '{}'.format(
-                        ','.join('{}'.format(x) for x in query_format)) + \
-                        ' WHERE NOT EXISTS (SELECT 1 from ' + \
-                        '{} WHERE "ActivityIdentifier" = \'{}\');'.format(
-                            indicator, re.sub('\'{1}', '\'\'', row[id_idx]))
-                    postgres_query(insert_sql, params=tuple(row), commit=True)
+            headers = [x.replace('/', '_') for x in next(csvreader, [])]
+            if headers:
+                with self.stage('db_load') as timing:
+                    result = bulk_upsert(
+                        indicator, headers,
+                        self.indicator_rows(csvreader, headers),
+                        key='ActivityIdentifier', update=False)
+                    timing.rows += result.inserted
         purge_old_data(indicator, date_cols[0], self.days_to_keep)
         if not table_exists(indicator + self.suffix):
             view_sql = 'CREATE OR REPLACE VIEW ' + indicator + self.suffix + \
@@ -226,6 +222,7 @@ class WaterQualityPortalProcessor(GeoDataProcessor):
                                     title=layer_title,
                                     store=datastore)
                 self.truncate_gs_cache(layer_name)
+                self.seed_gs_cache(layer_name)
         self.cleanup()
 
 